@@ -4,12 +4,22 @@ from __future__ import annotations
 
 import json
 import glob
+import hashlib
+import os
 import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
 
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from companies.shards.shared.columnar_out import PYARROW, is_columnar, iter_columnar_rows
+
 # =========================
 # KONFIG
 # =========================
@@ -18,23 +28,45 @@ OUT_DIR = Path("data/out/shards")
 
 WEBSITES_PATTERNS = [
     "data/out/shards/websites_guess_shard*.ndjson",
+    "data/out/shards/websites_guess_shard*.arrows",
     "data/out/shards/websites_guess.ndjson",
 ]
 EMAILS_PATTERNS = [
     "data/out/shards/emails_found_shard*.ndjson",
+    "data/out/shards/emails_found_shard*.arrows",
     "data/out/shards/emails_found.ndjson",
 ]
 TECH_PATTERNS = [
     "data/out/shards/tech_footprint_shard*.ndjson",
+    "data/out/shards/tech_footprint_shard*.arrows",
 ]
 SITE_REVIEW_PATTERNS = [
     "data/out/shards/site_review_shard*.ndjson",
+    "data/out/shards/site_review_shard*.arrows",
 ]
 HIRING_PATTERNS = [
     "data/out/shards/hiring_review_shard*.ndjson",
+    "data/out/shards/hiring_review_shard*.arrows",
+]
+LINE_OF_WORK_PATTERNS = [
+    "data/out/shards/line_of_work_shard*.ndjson",
+    "data/out/shards/line_of_work_shard*.arrows",
+]
+SEGMENT_GROUPS_PATTERNS = [
+    "data/out/shards/segment_groups_shard*.ndjson",
+    "data/out/shards/segment_groups_shard*.arrows",
 ]
 
 COMMIT_EVERY = 2000
+# Kommentar: set-baserad apply via temp-staging (kräver SQLite >= 3.33 för UPDATE ... FROM, annars radläge)
+BULK_MODE = True
+STAGE_BATCH = 5000
+# Kommentar: läs bara nya rader sedan förra körningen (apply_checkpoints), False = allt från byte 0 som förut
+INCREMENTAL = True
+HEAD_BYTES = 4096
+# Kommentar: json-avkodning/städning i en process-pool (bulk-läget), SQLite skrivs bara av huvudprocessen
+DECODE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DECODE_CHUNK_BYTES = 4 * 1024 * 1024
 BUSY_TIMEOUT_MS = 10_000
 
 TABLE = "companies"
@@ -50,6 +82,27 @@ def _safe_loads(line: str) -> dict[str, Any] | None:
         return None
 
 
+def _try_import_orjson():
+    try:
+        import orjson  # type: ignore
+        return orjson
+    except Exception:
+        return None
+
+
+ORJSON = _try_import_orjson()
+
+
+def _fast_loads(line: str) -> dict[str, Any] | None:
+    if ORJSON is not None:
+        try:
+            return ORJSON.loads(line)
+        except Exception:
+            # Kommentar: orjson är striktare (NaN, stora heltal ...) – json avgör så resultatet blir identiskt
+            pass
+    return _safe_loads(line)
+
+
 def _json_dumps_compact(value: Any) -> str:
     #DB lagrar listor/objekt som JSON-text
     return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
@@ -74,10 +127,112 @@ def _commit_maybe(conn: sqlite3.Connection, i: int) -> None:
         conn.commit()
 
 
+# -------------------------
+# INKREMENTELL APPLY (byte-offsets)
+# -------------------------
+class NdjsonTail:
+    """
+    Läser hela rader från en byte-offset. En ofullständig sista rad (sharden skriver fortfarande)
+    lämnas kvar till nästa körning. f.offset = byte efter sista hela raden som lästs.
+    """
+
+    def __init__(self, path: Path, start: int = 0) -> None:
+        self.path = path
+        self.offset = start
+        self._f: BinaryIO | None = None
+
+    def __enter__(self) -> "NdjsonTail":
+        self._f = self.path.open("rb")
+        self._f.seek(self.offset)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __iter__(self) -> Iterator[str]:
+        assert self._f is not None
+        for raw in self._f:
+            if not raw.endswith(b"\n"):
+                break
+            self.offset += len(raw)
+            yield raw.decode("utf-8", "replace")
+
+
+class ApplyCheckpoints:
+    """
+    apply_checkpoints i companies-DB:n: (path, inode, size, byte_offset, head_sha1) per NDJSON-fil.
+    head_sha1 = sha1 av de första min(HEAD_BYTES, byte_offset) byten – fångar rotation där inoden återanvänds.
+    Sparas i samma transaktion som uppdateringarna => krasch mitt i = filen körs om från förra offset
+    (apply är idempotent: fill-if-empty + bara nyare checked_at).
+    """
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS apply_checkpoints (
+                path         TEXT PRIMARY KEY,
+                inode        INTEGER NOT NULL,
+                size         INTEGER NOT NULL,
+                byte_offset  INTEGER NOT NULL,
+                head_sha1    TEXT NOT NULL,
+                updated_at   TEXT NOT NULL
+            )
+            """
+        )
+        conn.commit()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return path.resolve().as_posix()
+
+    @staticmethod
+    def _head_sha1(path: Path, offset: int) -> str:
+        with path.open("rb") as f:
+            return hashlib.sha1(f.read(min(HEAD_BYTES, offset))).hexdigest()
+
+    def start(self, path: Path) -> tuple[int, str]:
+        """
+        Returnerar (offset, läge): läge = "new" | "append" | "unchanged" | "rotated" | "truncated".
+        """
+        st = path.stat()
+        row = self.conn.execute(
+            "SELECT inode, byte_offset, head_sha1 FROM apply_checkpoints WHERE path = ?", (self._key(path),)
+        ).fetchone()
+        if row is None:
+            return 0, "new"
+        inode, offset = int(row[0]), int(row[1])
+        if st.st_size < offset:
+            return 0, "truncated"
+        if inode != st.st_ino or self._head_sha1(path, offset) != row[2]:
+            return 0, "rotated"
+        if st.st_size == offset:
+            return offset, "unchanged"
+        return offset, "append"
+
+    def save(self, path: Path, offset: int) -> None:
+        st = path.stat()
+        self.conn.execute(
+            """
+            INSERT INTO apply_checkpoints(path, inode, size, byte_offset, head_sha1, updated_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now'))
+            ON CONFLICT(path) DO UPDATE SET
+                inode = excluded.inode,
+                size = excluded.size,
+                byte_offset = excluded.byte_offset,
+                head_sha1 = excluded.head_sha1,
+                updated_at = excluded.updated_at
+            """,
+            (self._key(path), st.st_ino, st.st_size, offset, self._head_sha1(path, offset)),
+        )
+
+
 # -------------------------
 # WEBSITES
 # -------------------------
-def apply_websites_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, int]:
+def apply_websites_file(conn: sqlite3.Connection, ndjson_path: Path, start: int = 0) -> dict[str, int]:
     """
     {
       "orgnr": "...",
@@ -89,7 +244,7 @@ def apply_websites_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str
     """
     applied_value = applied_marker = skipped = errors = 0
 
-    with ndjson_path.open("r", encoding="utf-8") as f:
+    with NdjsonTail(ndjson_path, start) as f:
         for i, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
@@ -149,13 +304,14 @@ def apply_websites_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str
         "applied_marker": applied_marker,
         "skipped": skipped,
         "errors": errors,
+        "offset": f.offset,
     }
 
 
 # -------------------------
 # EMAILS
 # -------------------------
-def apply_emails_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, int]:
+def apply_emails_file(conn: sqlite3.Connection, ndjson_path: Path, start: int = 0) -> dict[str, int]:
     """
     {
       "orgnr": "...",
@@ -166,7 +322,7 @@ def apply_emails_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str,
     """
     applied_value = applied_marker = skipped = errors = 0
 
-    with ndjson_path.open("r", encoding="utf-8") as f:
+    with NdjsonTail(ndjson_path, start) as f:
         for i, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
@@ -226,13 +382,14 @@ def apply_emails_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str,
         "applied_marker": applied_marker,
         "skipped": skipped,
         "errors": errors,
+        "offset": f.offset,
     }
 
 
 # -------------------------
 # TECH FOOTPRINT
 # -------------------------
-def apply_tech_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, int]:
+def apply_tech_file(conn: sqlite3.Connection, ndjson_path: Path, start: int = 0) -> dict[str, int]:
     """
     {
       "orgnr": "...",
@@ -247,7 +404,7 @@ def apply_tech_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, in
     """
     applied_marker = skipped = errors = 0
 
-    with ndjson_path.open("r", encoding="utf-8") as f:
+    with NdjsonTail(ndjson_path, start) as f:
         for i, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
@@ -310,13 +467,14 @@ def apply_tech_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, in
         "applied_marker": applied_marker,
         "skipped": skipped,
         "errors": errors,
+        "offset": f.offset,
     }
 
 
 # -------------------------
 # SITE REVIEW
 # -------------------------
-def apply_site_review_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, int]:
+def apply_site_review_file(conn: sqlite3.Connection, ndjson_path: Path, start: int = 0) -> dict[str, int]:
     """
     {
       "orgnr": "...",
@@ -328,7 +486,7 @@ def apply_site_review_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[
     """
     applied_marker = skipped = errors = 0
 
-    with ndjson_path.open("r", encoding="utf-8") as f:
+    with NdjsonTail(ndjson_path, start) as f:
         for i, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
@@ -385,13 +543,14 @@ def apply_site_review_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[
         "applied_marker": applied_marker,
         "skipped": skipped,
         "errors": errors,
+        "offset": f.offset,
     }
 
 
 # -------------------------
 # HIRING REVIEW
 # -------------------------
-def apply_hiring_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str, int]:
+def apply_hiring_file(conn: sqlite3.Connection, ndjson_path: Path, start: int = 0) -> dict[str, int]:
     """
     {
       "orgnr": "...",
@@ -406,7 +565,7 @@ def apply_hiring_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str,
     """
     applied_marker = skipped = errors = 0
 
-    with ndjson_path.open("r", encoding="utf-8") as f:
+    with NdjsonTail(ndjson_path, start) as f:
         for i, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
@@ -474,9 +633,456 @@ def apply_hiring_file(conn: sqlite3.Connection, ndjson_path: Path) -> dict[str,
         "applied_marker": applied_marker,
         "skipped": skipped,
         "errors": errors,
+        "offset": f.offset,
+    }
+
+
+# -------------------------
+# BULK (set-baserad)
+# -------------------------
+# Kommentar: i stället för 1–2 UPDATE per NDJSON-rad streamas filen in i en temp-staging-tabell
+# (executemany) och appliceras med två set-baserade UPDATE ... FROM per fil. Samma semantik som radläget:
+# - värde (website/emails) sätts bara om tomt i DB – första raden i filen med värde vinner
+# - markören (*_checked_at + fälten) bara om nyare än DB – raden med senast checked_at vinner, lika => första raden
+# - segment_groups: union-merge (tar aldrig bort grupper), skriver bara när unionen skiljer sig från DB
+# applied_value/applied_marker räknar bolag (inte rader som i radläget).
+@dataclass(frozen=True)
+class BulkSpec:
+    marker_col: str                       # companies.*_checked_at
+    fields: tuple[str, ...]               # staging-kolumner = companies-kolumner som sätts med markören
+    parse: Callable[[dict[str, Any]], tuple | None]   # -> (orgnr, checked_at, value, *fields) eller None = skip
+    value_col: str | None = None          # fill-if-empty-kolumn (website/emails)
+    value_mode: str = "fill"              # fill | union (CSV-union, segment_groups)
+
+    def columns(self) -> list[str]:
+        # Kommentar: staging-schemat (delas med DbSink-sidodatabaserna)
+        return ["seq INTEGER PRIMARY KEY", "orgnr TEXT NOT NULL", "checked_at TEXT", "value TEXT", *self.fields]
+
+
+def _bulk_websites(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    if not orgnr:
+        return None
+    return (
+        orgnr,
+        (obj.get("checked_at") or "").strip(),
+        (obj.get("found_website") or "").strip(),
+        (obj.get("status") or "").strip().lower() or "checked",
+    )
+
+
+def _bulk_emails(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    if not orgnr:
+        return None
+    return (
+        orgnr,
+        (obj.get("checked_at") or "").strip(),
+        (obj.get("emails") or "").strip(),
+        (obj.get("status") or "").strip().lower() or "checked",
+    )
+
+
+def _bulk_tech(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    checked_at = (obj.get("checked_at") or "").strip()
+    if not orgnr or not checked_at:
+        return None
+    return (
+        orgnr,
+        checked_at,
+        "",
+        (obj.get("microsoft_status") or "").strip() or None,
+        obj.get("microsoft_strength"),
+        (obj.get("microsoft_confidence") or "").strip() or None,
+        (obj.get("it_support_signal") or "").strip() or None,
+        (obj.get("it_support_confidence") or "").strip() or None,
+        (obj.get("err_reason") or "").strip(),
+    )
+
+
+def _bulk_site_review(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    checked_at = (obj.get("checked_at") or "").strip()
+    if not orgnr or not checked_at:
+        return None
+    site_flags = obj.get("site_flags", None)
+    return (
+        orgnr,
+        checked_at,
+        "",
+        obj.get("site_score", None),
+        _json_dumps_compact(site_flags) if site_flags is not None else None,
+        (obj.get("err_reason") or "").strip(),
+    )
+
+
+def _bulk_hiring(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    checked_at = (obj.get("checked_at") or "").strip()
+    if not orgnr or not checked_at:
+        return None
+    evidence_url = (obj.get("evidence_url") or "").strip()
+    external_job_urls = obj.get("external_job_urls", [])
+    merged_urls: list[str] = []
+    if isinstance(external_job_urls, list):
+        merged_urls.extend([str(u).strip() for u in external_job_urls if str(u).strip()])
+    if evidence_url:
+        merged_urls.append(evidence_url)
+    return (
+        orgnr,
+        checked_at,
+        "",
+        (obj.get("hiring_status") or "").strip() or None,
+        (obj.get("hiring_what_text") or "").strip(),
+        obj.get("hiring_count", None),
+        (obj.get("err_reason") or "").strip(),
+        _json_dumps_compact(merged_urls) if merged_urls else None,
+    )
+
+
+def _bulk_line_of_work(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    checked_at = (obj.get("checked_at") or "").strip()
+    if not orgnr or not checked_at:
+        return None
+    return (
+        orgnr,
+        checked_at,
+        "",
+        (obj.get("final_label") or "").strip() or None,
+        (obj.get("w_raw") or "").strip(),
+        obj.get("final_conf", None),
+        (obj.get("final_bucket") or "").strip() or None,
+        (obj.get("source") or "").strip() or None,
+    )
+
+
+def _bulk_segment_groups(obj: dict[str, Any]) -> tuple | None:
+    orgnr = (obj.get("orgnr") or "").strip()
+    if not orgnr:
+        return None
+    return (
+        orgnr,
+        (obj.get("checked_at") or "").strip(),
+        (obj.get("segment_groups_after") or "").strip(),
+    )
+
+
+def _csv_union(first: str | None, second: str | None) -> str:
+    """
+    CSV-union utan dubbletter: first i sin ordning, sedan det som bara finns i second.
+    """
+    out: list[str] = []
+    seen: set[str] = set()
+    for raw in (first, second):
+        for g in str(raw or "").split(","):
+            g = g.strip()
+            if g and g not in seen:
+                seen.add(g)
+                out.append(g)
+    return ",".join(out)
+
+
+def _csv_key(value: str | None) -> str:
+    """
+    Jämförelsenyckel för en CSV-mängd: unika grupper sorterade (ordningen i kolumnen spelar ingen roll).
+    """
+    return ",".join(sorted({g.strip() for g in str(value or "").split(",") if g.strip()}))
+
+
+BULK_SPECS: dict[str, BulkSpec] = {
+    "websites": BulkSpec("website_checked_at", ("website_status",), _bulk_websites, value_col="website"),
+    "emails": BulkSpec("emails_checked_at", ("email_status",), _bulk_emails, value_col="emails"),
+    "tech": BulkSpec(
+        "tech_checked_at",
+        (
+            "microsoft_status",
+            "microsoft_strength",
+            "microsoft_confidence",
+            "it_support_signal",
+            "it_support_confidence",
+            "tech_err_reason",
+        ),
+        _bulk_tech,
+    ),
+    "site_review": BulkSpec(
+        "site_review_checked_at", ("site_score", "site_flags", "site_review_err_reason"), _bulk_site_review
+    ),
+    "hiring": BulkSpec(
+        "hiring_checked_at",
+        ("hiring_status", "hiring_what_text", "hiring_count", "hiring_err_reason", "hiring_external_urls"),
+        _bulk_hiring,
+    ),
+    "line_of_work": BulkSpec(
+        "line_of_work_updated_at",
+        ("line_of_work", "line_of_work_raw", "line_of_work_conf", "line_of_work_bucket", "line_of_work_source"),
+        _bulk_line_of_work,
+    ),
+    "segment_groups": BulkSpec(
+        "segment_groups_checked_at", (), _bulk_segment_groups, value_col="segment_groups", value_mode="union"
+    ),
+}
+
+
+def _complete_end(f: BinaryIO, start: int, size: int) -> int:
+    # Kommentar: byte efter sista "\n" – en ofullständig sista rad lämnas till nästa körning
+    pos = size
+    while pos > start:
+        step = min(64 * 1024, pos - start)
+        f.seek(pos - step)
+        k = f.read(step).rfind(b"\n")
+        if k >= 0:
+            return pos - step + k + 1
+        pos -= step
+    return start
+
+
+def _plan_chunks(ndjson_path: Path, start: int) -> tuple[list[tuple[int, int]], int]:
+    """
+    Delar [start, sista hela raden) i byte-intervall på ~DECODE_CHUNK_BYTES som slutar på radgräns.
+    """
+    ranges: list[tuple[int, int]] = []
+    with ndjson_path.open("rb") as f:
+        end = _complete_end(f, start, ndjson_path.stat().st_size)
+        a = start
+        while a < end:
+            b = min(a + DECODE_CHUNK_BYTES, end)
+            if b < end:
+                f.seek(b - 1)
+                b = b - 1 + len(f.readline())
+            ranges.append((a, b))
+            a = b
+    return ranges, end
+
+
+def _decode_chunk(job: tuple[str, str, int, int]) -> tuple[list[tuple], int, int]:
+    """
+    Worker (körs i process-poolen eller inline): json + städning för ett byte-intervall.
+    Returnerar (staging-rader med seq = byte-offset, skipped, errors).
+    """
+    kind, path, a, b = job
+    parse = BULK_SPECS[kind].parse
+    rows: list[tuple] = []
+    skipped = errors = 0
+
+    with open(path, "rb") as f:
+        f.seek(a)
+        data = f.read(b - a)
+
+    seq = a
+    for raw in data.split(b"\n")[:-1]:
+        pos = seq
+        seq += len(raw) + 1
+        line = raw.decode("utf-8", "replace").strip()
+        if not line:
+            continue
+        obj = _fast_loads(line)
+        if not obj:
+            errors += 1
+            continue
+        row = parse(obj)
+        if row is None:
+            skipped += 1
+            continue
+        rows.append((pos, *row))
+    return rows, skipped, errors
+
+
+def _ordered_map(pool: ProcessPoolExecutor | None, fn: Callable, jobs: list) -> Iterator:
+    # Kommentar: resultat i jobb-ordning, max 2 per worker i luften (begränsar minnet för stora filer)
+    if pool is None:
+        yield from map(fn, jobs)
+        return
+    window = 2 * DECODE_WORKERS
+    pending: deque = deque()
+    for job in jobs:
+        pending.append(pool.submit(fn, job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def create_stage(conn: sqlite3.Connection, spec: BulkSpec) -> None:
+    conn.execute("DROP TABLE IF EXISTS temp.stage")
+    conn.execute(f"CREATE TEMP TABLE stage ({', '.join(spec.columns())})")
+
+
+def _stage_file(
+    conn: sqlite3.Connection,
+    ndjson_path: Path,
+    kind: str,
+    start: int = 0,
+    pool: ProcessPoolExecutor | None = None,
+) -> tuple[int, int, int]:
+    """
+    NDJSON (från byte start) -> temp.stage. Avkodning i poolen, skrivning bara här (en SQLite-writer).
+    Returnerar (skipped, errors, offset).
+    """
+    spec = BULK_SPECS[kind]
+    create_stage(conn, spec)
+    insert_sql = f"INSERT INTO temp.stage VALUES ({', '.join(['?'] * (len(spec.fields) + 4))})"
+    if is_columnar(ndjson_path):
+        return _stage_columnar(conn, ndjson_path, spec, insert_sql)
+
+    ranges, end = _plan_chunks(ndjson_path, start)
+    if pool is not None and len(ranges) < 2:
+        pool = None  # Kommentar: liten fil – poolen kostar mer än den ger
+
+    skipped = errors = 0
+    jobs = [(kind, ndjson_path.as_posix(), a, b) for a, b in ranges]
+    for rows, sk, er in _ordered_map(pool, _decode_chunk, jobs):
+        conn.executemany(insert_sql, rows)
+        skipped += sk
+        errors += er
+    return skipped, errors, end
+
+
+def _stage_columnar(conn: sqlite3.Connection, path: Path, spec: BulkSpec, insert_sql: str) -> tuple[int, int, int]:
+    # Kommentar: Arrow-segment (--columnar) läses alltid hela – de är små (en per körning) och apply är idempotent.
+    # offset = filstorleken före läsning => "unchanged" nästa gång om writern inte lagt till fler batchar
+    size = path.stat().st_size
+    skipped = 0
+    batch: list[tuple] = []
+    for seq, obj in enumerate(iter_columnar_rows(path)):
+        parsed = spec.parse(obj)
+        if parsed is None:
+            skipped += 1
+            continue
+        batch.append((seq, *parsed))
+        if len(batch) >= STAGE_BATCH:
+            conn.executemany(insert_sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(insert_sql, batch)
+    return skipped, 0, size
+
+
+def apply_file_bulk(
+    conn: sqlite3.Connection,
+    ndjson_path: Path,
+    kind: str,
+    start: int = 0,
+    pool: ProcessPoolExecutor | None = None,
+) -> dict[str, int]:
+    skipped, errors, offset = _stage_file(conn, ndjson_path, kind, start, pool)
+    applied_value, applied_marker = apply_staged(conn, BULK_SPECS[kind])
+    return {
+        "applied_value": applied_value,
+        "applied_marker": applied_marker,
+        "skipped": skipped,
+        "errors": errors,
+        "offset": offset,
     }
 
 
+def apply_staged(conn: sqlite3.Connection, spec: BulkSpec) -> tuple[int, int]:
+    """
+    temp.stage -> companies (set-baserat). Returnerar (applied_value, applied_marker). Droppar stage efteråt.
+    """
+    applied_value = 0
+    if spec.value_col and spec.value_mode == "union":
+        # 1) union av alla rader per bolag (senaste först) + DB – bara när något faktiskt tillkommer
+        # (mängderna jämförs sorterade: en union som bara byter ordning på befintliga grupper skrivs inte)
+        conn.create_function("csv_union", 2, _csv_union, deterministic=True)
+        conn.create_function("csv_key", 1, _csv_key, deterministic=True)
+        cur = conn.execute(
+            f"""
+            UPDATE {TABLE}
+            SET {spec.value_col} = csv_union(s.value, {TABLE}.{spec.value_col}),
+                {COL_UPDATED_AT} = datetime('now')
+            FROM (
+                SELECT orgnr, group_concat(value, ',') AS value FROM (
+                    SELECT orgnr, value FROM temp.stage WHERE value <> '' ORDER BY orgnr, seq DESC
+                )
+                GROUP BY orgnr
+            ) AS s
+            WHERE {TABLE}.{COL_ORGNR} = s.orgnr
+              AND csv_key(csv_union(s.value, {TABLE}.{spec.value_col})) <> csv_key({TABLE}.{spec.value_col})
+            """
+        )
+        applied_value = cur.rowcount
+    elif spec.value_col:
+        # 1) värdet ENDAST om tomt i DB (första raden per bolag med värde)
+        cur = conn.execute(
+            f"""
+            UPDATE {TABLE}
+            SET {spec.value_col} = s.value,
+                {COL_UPDATED_AT} = datetime('now')
+            FROM (
+                SELECT orgnr, value FROM temp.stage
+                WHERE seq IN (SELECT MIN(seq) FROM temp.stage WHERE value <> '' GROUP BY orgnr)
+            ) AS s
+            WHERE {TABLE}.{COL_ORGNR} = s.orgnr
+              AND ({TABLE}.{spec.value_col} IS NULL OR TRIM({TABLE}.{spec.value_col}) = '')
+            """
+        )
+        applied_value = cur.rowcount
+
+    # 2) markör + fält om NDJSON är nyare (eller DB saknar datum) – senaste checked_at per bolag
+    sets = [f"{c} = s.{c}" for c in spec.fields]
+    sets += [f"{spec.marker_col} = s.checked_at", f"{COL_UPDATED_AT} = datetime('now')"]
+    cur = conn.execute(
+        f"""
+        UPDATE {TABLE}
+        SET {", ".join(sets)}
+        FROM (
+            SELECT * FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY orgnr ORDER BY julianday(checked_at) DESC, seq ASC
+                ) AS rn
+                FROM temp.stage
+                WHERE checked_at <> ''
+            )
+            WHERE rn = 1
+        ) AS s
+        WHERE {TABLE}.{COL_ORGNR} = s.orgnr
+          AND (
+            {TABLE}.{spec.marker_col} IS NULL OR TRIM({TABLE}.{spec.marker_col}) = ''
+            OR julianday(s.checked_at) > julianday({TABLE}.{spec.marker_col})
+          )
+        """
+    )
+    applied_marker = cur.rowcount
+
+    conn.execute("DROP TABLE IF EXISTS temp.stage")
+    return applied_value, applied_marker
+
+
+ROW_APPLY: dict[str, Callable[[sqlite3.Connection, Path, int], dict[str, int]]] = {
+    "websites": apply_websites_file,
+    "emails": apply_emails_file,
+    "tech": apply_tech_file,
+    "site_review": apply_site_review_file,
+    "hiring": apply_hiring_file,
+}
+
+
+def _apply_one(
+    conn: sqlite3.Connection,
+    ckpt: ApplyCheckpoints | None,
+    fp: Path,
+    kind: str,
+    *,
+    bulk: bool,
+    pool: ProcessPoolExecutor | None = None,
+) -> tuple[dict[str, int], str]:
+    # Kommentar: checkpoint + uppdateringar committas tillsammans
+    if is_columnar(fp) and (not bulk or PYARROW is None):
+        # Kommentar: Arrow-segment läses bara i bulk-läget och kräver pyarrow
+        why = "skip: pyarrow saknas" if PYARROW is None else "skip: kräver bulk"
+        return {"applied_value": 0, "applied_marker": 0, "skipped": 0, "errors": 0, "offset": 0}, why
+    start, mode = ckpt.start(fp) if ckpt is not None else (0, "full")
+    if mode == "unchanged":
+        return {"applied_value": 0, "applied_marker": 0, "skipped": 0, "errors": 0, "offset": start}, mode
+    r = apply_file_bulk(conn, fp, kind, start, pool) if bulk else ROW_APPLY[kind](conn, fp, start)
+    if ckpt is not None:
+        ckpt.save(fp, r["offset"])
+    conn.commit()
+    return r, mode
+
+
 def main() -> None:
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DB saknas: {DB_PATH}")
@@ -487,6 +1093,8 @@ def main() -> None:
     tech_files = _list_files(TECH_PATTERNS)
     site_review_files = _list_files(SITE_REVIEW_PATTERNS)
     hiring_files = _list_files(HIRING_PATTERNS)
+    line_of_work_files = _list_files(LINE_OF_WORK_PATTERNS)
+    segment_groups_files = _list_files(SEGMENT_GROUPS_PATTERNS)
 
     print("=== FILES ===")
     print(f"Websites files: {len(website_files)}")
@@ -504,25 +1112,37 @@ def main() -> None:
     print(f"Hiring files: {len(hiring_files)}")
     for p in hiring_files:
         print(" -", p)
+    print(f"Line of work files: {len(line_of_work_files)}")
+    for p in line_of_work_files:
+        print(" -", p)
+    print(f"Segment groups files: {len(segment_groups_files)}")
+    for p in segment_groups_files:
+        print(" -", p)
 
     conn = sqlite3.connect(DB_PATH)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
 
+    bulk = BULK_MODE and sqlite3.sqlite_version_info >= (3, 33, 0)
+    if BULK_MODE and not bulk:
+        print(f"Info: SQLite {sqlite3.sqlite_version} saknar UPDATE ... FROM -> radläge")
+
+    ckpt = ApplyCheckpoints(conn) if INCREMENTAL else None
+    pool = ProcessPoolExecutor(max_workers=DECODE_WORKERS) if bulk and DECODE_WORKERS > 1 else None
+
     try:
         # Websites
         total_wv = total_wm = total_we = 0
         if website_files:
             print("\n=== APPLY WEBSITES (ALL FILES) ===")
             for idx, fp in enumerate(website_files, start=1):
-                r = apply_websites_file(conn, fp)
-                conn.commit()
+                r, mode = _apply_one(conn, ckpt, fp, "websites", bulk=bulk, pool=pool)
                 total_wv += r["applied_value"]
                 total_wm += r["applied_marker"]
                 total_we += r["errors"]
                 print(
-                    f"[web {idx}/{len(website_files)}] {fp.name} "
+                    f"[web {idx}/{len(website_files)}] {fp.name} [{mode}] "
                     f"value={r['applied_value']} marker={r['applied_marker']} errors={r['errors']}"
                 )
         else:
@@ -533,13 +1153,12 @@ def main() -> None:
         if email_files:
             print("\n=== APPLY EMAILS (ALL FILES) ===")
             for idx, fp in enumerate(email_files, start=1):
-                r = apply_emails_file(conn, fp)
-                conn.commit()
+                r, mode = _apply_one(conn, ckpt, fp, "emails", bulk=bulk, pool=pool)
                 total_ev += r["applied_value"]
                 total_em += r["applied_marker"]
                 total_ee += r["errors"]
                 print(
-                    f"[email {idx}/{len(email_files)}] {fp.name} "
+                    f"[email {idx}/{len(email_files)}] {fp.name} [{mode}] "
                     f"value={r['applied_value']} marker={r['applied_marker']} errors={r['errors']}"
                 )
         else:
@@ -550,11 +1169,10 @@ def main() -> None:
         if tech_files:
             print("\n=== APPLY TECH (ALL FILES) ===")
             for idx, fp in enumerate(tech_files, start=1):
-                r = apply_tech_file(conn, fp)
-                conn.commit()
+                r, mode = _apply_one(conn, ckpt, fp, "tech", bulk=bulk, pool=pool)
                 total_tm += r["applied_marker"]
                 total_te += r["errors"]
-                print(f"[tech {idx}/{len(tech_files)}] {fp.name} marker={r['applied_marker']} errors={r['errors']}")
+                print(f"[tech {idx}/{len(tech_files)}] {fp.name} [{mode}] marker={r['applied_marker']} errors={r['errors']}")
         else:
             print("\n[tech] inga filer hittades.")
 
@@ -563,12 +1181,11 @@ def main() -> None:
         if site_review_files:
             print("\n=== APPLY SITE REVIEW (ALL FILES) ===")
             for idx, fp in enumerate(site_review_files, start=1):
-                r = apply_site_review_file(conn, fp)
-                conn.commit()
+                r, mode = _apply_one(conn, ckpt, fp, "site_review", bulk=bulk, pool=pool)
                 total_sm += r["applied_marker"]
                 total_se += r["errors"]
                 print(
-                    f"[site {idx}/{len(site_review_files)}] {fp.name} marker={r['applied_marker']} errors={r['errors']}"
+                    f"[site {idx}/{len(site_review_files)}] {fp.name} [{mode}] marker={r['applied_marker']} errors={r['errors']}"
                 )
         else:
             print("\n[site_review] inga filer hittades.")
@@ -578,25 +1195,61 @@ def main() -> None:
         if hiring_files:
             print("\n=== APPLY HIRING (ALL FILES) ===")
             for idx, fp in enumerate(hiring_files, start=1):
-                r = apply_hiring_file(conn, fp)
-                conn.commit()
+                r, mode = _apply_one(conn, ckpt, fp, "hiring", bulk=bulk, pool=pool)
                 total_hm += r["applied_marker"]
                 total_he += r["errors"]
                 print(
-                    f"[hiring {idx}/{len(hiring_files)}] {fp.name} marker={r['applied_marker']} errors={r['errors']}"
+                    f"[hiring {idx}/{len(hiring_files)}] {fp.name} [{mode}] marker={r['applied_marker']} errors={r['errors']}"
                 )
         else:
             print("\n[hiring] inga filer hittades.")
 
+        # Line of work / segment groups (finns bara i bulk-läget)
+        total_lm = total_le = 0
+        total_gv = total_gm = total_ge = 0
+        if not bulk and (line_of_work_files or segment_groups_files):
+            print("\n[line_of_work/segment_groups] kräver bulk-läget (SQLite >= 3.33) – hoppar över.")
+        else:
+            if line_of_work_files:
+                print("\n=== APPLY LINE OF WORK (ALL FILES) ===")
+                for idx, fp in enumerate(line_of_work_files, start=1):
+                    r, mode = _apply_one(conn, ckpt, fp, "line_of_work", bulk=bulk, pool=pool)
+                    total_lm += r["applied_marker"]
+                    total_le += r["errors"]
+                    print(
+                        f"[low {idx}/{len(line_of_work_files)}] {fp.name} [{mode}] "
+                        f"marker={r['applied_marker']} errors={r['errors']}"
+                    )
+            else:
+                print("\n[line_of_work] inga filer hittades.")
+
+            if segment_groups_files:
+                print("\n=== APPLY SEGMENT GROUPS (ALL FILES) ===")
+                for idx, fp in enumerate(segment_groups_files, start=1):
+                    r, mode = _apply_one(conn, ckpt, fp, "segment_groups", bulk=bulk, pool=pool)
+                    total_gv += r["applied_value"]
+                    total_gm += r["applied_marker"]
+                    total_ge += r["errors"]
+                    print(
+                        f"[seg {idx}/{len(segment_groups_files)}] {fp.name} [{mode}] "
+                        f"union={r['applied_value']} marker={r['applied_marker']} errors={r['errors']}"
+                    )
+            else:
+                print("\n[segment_groups] inga filer hittades.")
+
         print("\n=== SUMMARY ===")
         print(f"WEBSITES   total: value={total_wv} marker={total_wm} errors={total_we}")
         print(f"EMAILS     total: value={total_ev} marker={total_em} errors={total_ee}")
         print(f"TECH       total: marker={total_tm} errors={total_te}")
         print(f"SITE_REVIEW total: marker={total_sm} errors={total_se}")
         print(f"HIRING     total: marker={total_hm} errors={total_he}")
+        print(f"LINE_OF_WORK total: marker={total_lm} errors={total_le}")
+        print(f"SEGMENTS   total: union={total_gv} marker={total_gm} errors={total_ge}")
         print("DONE ✅")
 
     finally:
+        if pool is not None:
+            pool.shutdown()
         conn.close()
 
 
@@ -0,0 +1,100 @@
+# companies/apply/merge_sink_dbs.py
+# Viker in shard-sidodatabaserna (--sink-db, se companies/shards/shared/db_sink.py) i companies.
+# - per sidodatabas: ATTACH, kopiera results (seq <= max) till temp.stage, samma set-baserade apply som NDJSON-bulkläget
+#   (apply_staged), radera de mergade raderna, commit – en stor transaktion per fil
+# - sharderna kan skriva samtidigt (WAL): rader med seq > max tas nästa varv
+# - krasch mellan companies-commit och DELETE => raderna appliceras igen, vilket är idempotent
+#   (fill-if-empty, bara nyare markör, union för segment_groups)
+# Kör:
+#   python companies/apply/merge_sink_dbs.py           # ett varv
+#   python companies/apply/merge_sink_dbs.py --loop    # bakgrundsmerger, var MERGE_EVERY_SEC sekund
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from companies.apply.apply_out_shards_to_db import BULK_SPECS, apply_staged, create_stage
+from companies.shards.shared.db_sink import DEFAULT_SINK_DIR
+
+# =========================
+# KONFIG
+# =========================
+DB_PATH = Path("data/db/companies.db.sqlite")
+SINK_DIR = DEFAULT_SINK_DIR
+MERGE_EVERY_SEC = 30
+BUSY_TIMEOUT_MS = 30_000
+
+
+def merge_one(conn: sqlite3.Connection, sink_path: Path) -> tuple[str, int, int, int]:
+    """
+    En sidodatabas -> companies. Returnerar (kind, rader, applied_value, applied_marker).
+    """
+    conn.execute("ATTACH DATABASE ? AS sink", (sink_path.as_posix(),))
+    try:
+        row = conn.execute("SELECT value FROM sink.meta WHERE key = 'kind'").fetchone()
+        kind = row[0] if row else ""
+        spec = BULK_SPECS.get(kind)
+        if spec is None:
+            raise ValueError(f"okänd kind i {sink_path.name}: {kind!r}")
+
+        max_seq = conn.execute("SELECT MAX(seq) FROM sink.results").fetchone()[0]
+        if max_seq is None:
+            return kind, 0, 0, 0
+
+        create_stage(conn, spec)
+        n = conn.execute("INSERT INTO temp.stage SELECT * FROM sink.results WHERE seq <= ?", (max_seq,)).rowcount
+        applied_value, applied_marker = apply_staged(conn, spec)
+        conn.execute("DELETE FROM sink.results WHERE seq <= ?", (max_seq,))
+        conn.commit()
+        return kind, n, applied_value, applied_marker
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE sink")
+
+
+def merge_all(conn: sqlite3.Connection) -> int:
+    files = sorted(SINK_DIR.glob("*.sqlite"))
+    total = 0
+    for fp in files:
+        kind, n, v, m = merge_one(conn, fp)
+        total += n
+        if n:
+            print(f"[merge] {fp.name} kind={kind} rows={n} value={v} marker={m}")
+    return total
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--loop", action="store_true", help="kör om var MERGE_EVERY_SEC sekund (Ctrl+C för att sluta)")
+    args = ap.parse_args()
+
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+
+    conn = sqlite3.connect(DB_PATH.as_posix())
+    try:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        while True:
+            total = merge_all(conn)
+            print(f"[merge] varv klart: {total} rader")
+            if not args.loop:
+                break
+            time.sleep(MERGE_EVERY_SEC)
+        print("KLART ✅")
+    except KeyboardInterrupt:
+        print("\nAvbrutet.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,15 @@
 from __future__ import annotations
 
 import sqlite3
+import sys
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Iterable
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from companies.shards.shared.columnar_out import COLUMNAR_EXT, PYARROW, count_columnar_rows, is_columnar
+
 # =========================
 # KONFIG (samma stil som db_overview.py)
 # =========================
@@ -63,7 +68,7 @@ def list_ndjson_files(prefix: str) -> list[Path]:
     files = [
         p
         for p in SHARDS_OUT_DIR.iterdir()
-        if p.is_file() and p.name.startswith(prefix) and p.suffix == NDJSON_EXT
+        if p.is_file() and p.name.startswith(prefix) and p.suffix in (NDJSON_EXT, COLUMNAR_EXT)
     ]
     return sorted(files)
 
@@ -77,6 +82,13 @@ def count_ndjson_rows(path: Path) -> int:
     return n
 
 
+def count_rows(path: Path) -> int | None:
+    # Kommentar: Arrow-segment (--columnar) räknas batchvis, None = pyarrow saknas
+    if is_columnar(path):
+        return None if PYARROW is None else count_columnar_rows(path)
+    return count_ndjson_rows(path)
+
+
 def print_file_group(label: str, prefix: str) -> int:
     files = list_ndjson_files(prefix)
     print_section(f"NDJSON FILES – {label}")
@@ -86,7 +98,10 @@ def print_file_group(label: str, prefix: str) -> int:
 
     total = 0
     for p in files:
-        rows = count_ndjson_rows(p)
+        rows = count_rows(p)
+        if rows is None:
+            print_kv(p.name, "(pyarrow saknas)")
+            continue
         total += rows
         print_kv(p.name, f"{rows:,} rows")
     print_kv(f"TOTAL {label} rows", f"{total:,}")
@@ -2,12 +2,19 @@
 #Skickar till DB
 
 import os
+import sys
 import time
 import uuid
 import sqlite3
+from pathlib import Path
+
 import requests
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.open_data.sni_index import SOURCE_BOLAGSVERKET, ensure_table, sync_orgnr
+
 # =========================
 # ÄNDRA HÄR
 # =========================
@@ -141,6 +148,8 @@ def main():
     # (valfritt men bra) index för snabb city + sni-filter
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_{COL_CITY} ON {TABLE}({COL_CITY});")
     cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_{COL_SNI_CODES} ON {TABLE}({COL_SNI_CODES});")
+    # Kommentar: company_sni (targeting) uppdateras i samma transaktion som sni_codes
+    ensure_table(con)
 
     # =========================
     # ENDA ÄNDRINGEN: CITY-filter som stödjer None/all/* och flera städer
@@ -209,6 +218,7 @@ def main():
                     f"UPDATE {TABLE} SET {COL_SNI_CODES}=?, {COL_SNI_TEXT}=? WHERE {COL_ORGNR}=?",
                     (codes, texts, orgnr),
                 )
+                sync_orgnr(con, orgnr, SOURCE_BOLAGSVERKET, codes)
                 if not printed_first:
                     printed_first = True
                     print("FIRST SNI ✅")
@@ -223,6 +233,7 @@ def main():
                     f"UPDATE {TABLE} SET {COL_SNI_CODES}=?, {COL_SNI_TEXT}=? WHERE {COL_ORGNR}=?",
                     (NO_SNI_MARK, "", orgnr),
                 )
+                sync_orgnr(con, orgnr, SOURCE_BOLAGSVERKET)
                 if not printed_first:
                     printed_first = True
                     print("FIRST NO_SNI ✅")
@@ -236,6 +247,7 @@ def main():
                     f"UPDATE {TABLE} SET {COL_SNI_CODES}=?, {COL_SNI_TEXT}=? WHERE {COL_ORGNR}=?",
                     (NOT_FOUND_MARK, "", orgnr),
                 )
+                sync_orgnr(con, orgnr, SOURCE_BOLAGSVERKET)
                 if not printed_first:
                     printed_first = True
                     print("FIRST NOT_FOUND ✅")
@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 import os
 import re
+import sys
 import time
 import sqlite3
 from pathlib import Path
@@ -12,6 +13,10 @@ from typing import Any, Dict, Optional, Tuple
 import requests
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.open_data.sni_index import SOURCE_SCB, ensure_table, sync_from_companies
+
 # =========================
 # Config
 # =========================
@@ -441,6 +446,8 @@ def main() -> None:
     cur = con.cursor()
 
     ensure_columns(con)
+    # Kommentar: scb_sni_5/5p speglas i company_sni (targeting)
+    ensure_table(con)
 
     # laddar kodtabeller om filen finns
     cat_maps = load_category_maps()
@@ -631,6 +638,9 @@ def main() -> None:
                         orgnr,
                     ),
                 )
+                if status == "ok":
+                    # Kommentar: fill-if-empty => läs tillbaka det som faktiskt står i kolumnerna
+                    sync_from_companies(con, [orgnr], SOURCE_SCB)
 
                 scanned += 1
                 if status == "ok":
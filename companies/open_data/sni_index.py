@@ -0,0 +1,152 @@
+# companies/open_data/sni_index.py
+# Normaliserad SNI-tabell för targeting: company_sni(orgnr, sni_code, source), en rad per bolag/kod/källa
+# - sni_codes är fritext (CSV eller JSON-lista) => LIKE '%,62%' kan aldrig använda index
+#   här ligger varje kod för sig med index (source, sni_code, orgnr) => prefix/exact blir range-scans
+# - källor: bolagsverket = companies.sni_codes, scb = scb_sni_5 / scb_sni_5p
+# - hålls i synk av bolagsverket_sni.py och scb_enrich_company_facts.py (sync_orgnr efter varje UPDATE)
+# - migrations/add_company_sni.py skapar tabellen och bygger om den från companies
+#   (kör om efter bulk-skript som skriver sni-kolumnerna direkt, t.ex. fix_new_db_companies.py)
+# - targeting använder tabellen först när en full rebuild() är klar (is_complete, rad i company_sni_meta):
+#   enrichment-skripten skapar den tom och synkar bara sina orgnr, det ensamt vore ett halvt index
+
+from __future__ import annotations
+
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+TABLE = "company_sni"
+META_TABLE = "company_sni_meta"
+SOURCE_BOLAGSVERKET = "bolagsverket"
+SOURCE_SCB = "scb"
+SOURCE_COLUMNS = {
+    SOURCE_BOLAGSVERKET: ("sni_codes",),
+    SOURCE_SCB: ("scb_sni_5", "scb_sni_5p"),
+}
+
+# Kommentar: token = allt mellan komma/hakparentes/citattecken/whitespace ("62010,70220" och '["62010"]')
+_TOKEN_RE = re.compile(r"[^,\[\]\"'\s]+")
+_BATCH = 5000
+
+
+def ensure_table(con: sqlite3.Connection) -> None:
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+          orgnr TEXT NOT NULL,
+          sni_code TEXT NOT NULL,
+          source TEXT NOT NULL,
+          PRIMARY KEY (orgnr, source, sni_code)
+        ) WITHOUT ROWID
+        """
+    )
+    con.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE}_code ON {TABLE}(source, sni_code, orgnr)")
+    con.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+def has_table(con: sqlite3.Connection, name: str = TABLE) -> bool:
+    row = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def is_complete(con: sqlite3.Connection) -> bool:
+    """
+    True när tabellen byggts från hela companies (rebuild) – först då kan den ersätta LIKE över sni_codes.
+    """
+    if not (has_table(con) and has_table(con, META_TABLE)):
+        return False
+    return con.execute(f"SELECT 1 FROM {META_TABLE} WHERE key = 'rebuilt_at'").fetchone() is not None
+
+
+def parse_sni_codes(*raws: Optional[str]) -> list[str]:
+    """
+    Koder ur en eller flera sni-kolumner, unika i ordning. Markörer (__NO_SNI__, __NOT_FOUND__) räknas inte.
+    """
+    out: dict[str, None] = {}
+    for raw in raws:
+        for tok in _TOKEN_RE.findall(raw or ""):
+            if not tok.startswith("__"):
+                out[tok] = None
+    return list(out)
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    # Kommentar: "62" -> "63" så sni_code >= '62' AND sni_code < '63' = alla koder som börjar på 62
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def match_subquery(codes: Sequence[str], mode: str, source: str = SOURCE_BOLAGSVERKET) -> Tuple[str, List[object]]:
+    """
+    SELECT orgnr ... för bolag med någon kod som är exakt (mode="exact") eller börjar med (prefix) något i codes.
+    En indexerad lookup per kod, UNION. ("", []) om codes är tom.
+    """
+    parts: List[str] = []
+    params: List[object] = []
+    for s in dict.fromkeys(x.strip() for x in codes):
+        if not s:
+            continue
+        if mode == "exact":
+            parts.append(f"SELECT orgnr FROM {TABLE} WHERE source = ? AND sni_code = ?")
+            params.extend([source, s])
+        else:
+            parts.append(f"SELECT orgnr FROM {TABLE} WHERE source = ? AND sni_code >= ? AND sni_code < ?")
+            params.extend([source, s, prefix_upper_bound(s)])
+    return " UNION ".join(parts), params
+
+
+def _source_columns(con: sqlite3.Connection) -> dict[str, tuple[str, ...]]:
+    # Kommentar: scb-kolumnerna finns först efter första SCB-körningen
+    cols = {str(r[1]) for r in con.execute("PRAGMA table_info(companies)")}
+    return {src: cs for src, cs in SOURCE_COLUMNS.items() if all(c in cols for c in cs)}
+
+
+def sync_orgnr(con: sqlite3.Connection, orgnr: str, source: str, *raws: Optional[str]) -> None:
+    """
+    Ersätter bolagets koder för en källa med det som nu står i kolumnen (anropas direkt efter UPDATE, samma transaktion).
+    """
+    con.execute(f"DELETE FROM {TABLE} WHERE orgnr = ? AND source = ?", (orgnr, source))
+    con.executemany(
+        f"INSERT OR IGNORE INTO {TABLE}(orgnr, sni_code, source) VALUES (?, ?, ?)",
+        [(orgnr, code, source) for code in parse_sni_codes(*raws)],
+    )
+
+
+def sync_from_companies(con: sqlite3.Connection, orgnrs: Iterable[str], source: str) -> None:
+    """
+    Som sync_orgnr men läser värdet från companies (när UPDATE:n är fill-if-empty och slutvärdet inte är känt).
+    """
+    cols = _source_columns(con).get(source)
+    if not cols:
+        return
+    for orgnr in orgnrs:
+        row = con.execute(f"SELECT {', '.join(cols)} FROM companies WHERE orgnr = ?", (orgnr,)).fetchone()
+        sync_orgnr(con, orgnr, source, *(tuple(row) if row else ()))
+
+
+def rebuild(con: sqlite3.Connection) -> dict[str, int]:
+    """
+    Bygger om hela tabellen från companies. Returnerar antal rader per källa.
+    """
+    ensure_table(con)
+    con.execute(f"DELETE FROM {TABLE}")
+    counts: dict[str, int] = {}
+    for source, cols in _source_columns(con).items():
+        n = 0
+        batch: list[tuple[str, str, str]] = []
+        cur = con.execute(f"SELECT orgnr, {', '.join(cols)} FROM companies WHERE orgnr IS NOT NULL AND orgnr != ''")
+        for orgnr, *raws in cur:
+            batch.extend((orgnr, code, source) for code in parse_sni_codes(*raws))
+            if len(batch) >= _BATCH:
+                con.executemany(f"INSERT OR IGNORE INTO {TABLE}(orgnr, sni_code, source) VALUES (?, ?, ?)", batch)
+                n += len(batch)
+                batch.clear()
+        if batch:
+            con.executemany(f"INSERT OR IGNORE INTO {TABLE}(orgnr, sni_code, source) VALUES (?, ?, ?)", batch)
+            n += len(batch)
+        counts[source] = n
+    con.execute(
+        f"INSERT OR REPLACE INTO {META_TABLE}(key, value) VALUES ('rebuilt_at', ?)",
+        (datetime.now(timezone.utc).replace(microsecond=0).isoformat(),),
+    )
+    return counts
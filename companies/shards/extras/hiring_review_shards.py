@@ -15,24 +15,40 @@
 #Nej, det här hiring-scriptet lägger inte in kategorier just nu. Du behöver ett separat match-script (NDJSON → kategori via job_categories), eller bygga in matchningen i hiring-scriptet (men då blir det mer logik i shard).
 
 import re
+import sys
 import time
-import json
+import asyncio
 import sqlite3
-import hashlib
 import argparse
-from datetime import datetime, timedelta, timezone
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 from urllib.parse import urlsplit, urljoin
 
-import requests
-from requests.exceptions import ConnectionError, InvalidURL
-from urllib3.exceptions import LocationParseError
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.fetch import Fetcher, fetch_html, normalize_url, run_bounded
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+from companies.shards.shared.refresh_sql import RULES, select_due
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, default_owner, keepalive, queue_writer, track
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--shard-id", type=int, required=True)
 ap.add_argument("--shard-total", type=int, default=4)
-args = ap.parse_args()
+ap.add_argument("--queue", action="store_true", help="dra targets ur delad arbetskö i stället för md5-shard")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
+# Kommentar: strikt när skriptet körs självt (felstavad flagga = fel, inte default); importerad av
+# enrich_all_shards.py tål vi pipelinens egna flaggor (--only osv.), pipelinen validerar sina själv
+if __name__ == "__main__":
+    args = ap.parse_args()
+else:
+    args, _unknown = ap.parse_known_args()
 
 SHARD_ID = args.shard_id
 SHARD_TOTAL = args.shard_total
@@ -42,6 +58,7 @@ SHARD_TOTAL = args.shard_total
 # =========================
 DB_PATH = Path("data/db/companies.db.sqlite")
 OUT_PATH = Path(f"data/out/shards/hiring_review_shard{SHARD_ID}.ndjson")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0              # 0 = ALLA
 RESUME = True
 PRINT_EVERY = 50
@@ -49,14 +66,23 @@ REFRESH_DAYS = 30      # rerun efter 30 dagar
 # =========================
 
 TIMEOUT_SECONDS = 12
-SLEEP_BETWEEN_REQUESTS = 0.15
+PER_DOMAIN_RATE = 6.0     # max requests/s per registrerad domän (token bucket)
+PER_DOMAIN_BURST = 2
+# Kommentar: delad sidcache mellan shards (samma sida hämtas en gång för hela enrichment-sviten)
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+# Kommentar: --queue => lease-baserad kö (valfritt antal workers), annars fast md5-shard
+QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+QUEUE_KIND = "hiring"
 MAX_BYTES = 650_000    # vi läser max ~650KB HTML per sida
 MAX_PAGES = 7          #  liten crawl-budget (max career-sidor per bolag)
 
-session = requests.Session()
-session.headers.update({
-    "User-Agent": f"Mozilla/5.0 (Didup-HiringReview/1.0; shard={SHARD_ID})"
-})
+# async-motorn: antal bolag samtidigt + anslutningstak
+CONCURRENCY = 100
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
+
+USER_AGENT = f"Mozilla/5.0 (Didup-HiringReview/1.0; shard={SHARD_ID})"
 
 # vi letar bara karriär-sidor på egen domän för YES
 CAREER_PATH_HINTS = [
@@ -120,145 +146,6 @@ def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
-def parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return None
-
-
-def needs_refresh(checked_at: Optional[str]) -> bool:
-    dt = parse_iso(checked_at)
-    if not dt:
-        return True
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-
-def in_shard(orgnr: str) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % SHARD_TOTAL) == SHARD_ID
-
-
-def _valid_hostname(host: str) -> bool:
-    if not host:
-        return False
-    host = host.strip().lower().rstrip(".")
-    if len(host) > 253:
-        return False
-    if any(c.isspace() for c in host):
-        return False
-    if ".." in host:
-        return False
-    labels = host.split(".")
-    if len(labels) < 2:
-        return False
-    for lab in labels:
-        if not lab or len(lab) > 63:
-            return False
-        if lab.startswith("-") or lab.endswith("-"):
-            return False
-        if not re.fullmatch(r"[a-z0-9-]+", lab):
-            return False
-    return True
-
-
-def _safe_url(url: str) -> bool:
-    try:
-        u = url.strip()
-        parts = urlsplit(u)
-        if parts.scheme not in ("http", "https"):
-            return False
-        host = parts.hostname or ""
-        return _valid_hostname(host)
-    except Exception:
-        return False
-
-
-def _is_retryable_status(code: int) -> bool:
-    # vi retryar INTE 403/429, bara timeout (timeout => ingen rad)
-    return code in (403, 429, 500, 502, 503, 504)
-
-
-def _is_dns_miss_error(e: Exception) -> bool:
-    msg = str(e).lower()
-    return (
-        "name or service not known" in msg
-        or "failed to resolve" in msg
-        or "nodename nor servname" in msg
-        or "temporary failure in name resolution" in msg
-        or "getaddrinfo failed" in msg
-    )
-
-
-def fetch_html(url: str) -> tuple[Optional[str], str]:
-    """
-    Returns (html_text_or_none, err_reason)
-    err_reason: "" | "403" | "429" | "timeout" | "other" | "not_html"
-    """
-    if not _safe_url(url):
-        return (None, "other")
-
-    try:
-        r = session.get(
-            url,
-            timeout=(3, TIMEOUT_SECONDS),
-            allow_redirects=True,
-            stream=True,
-        )
-
-        if _is_retryable_status(r.status_code):
-            r.close()
-            return (None, str(r.status_code))
-
-        if not (200 <= r.status_code < 400):
-            r.close()
-            return (None, "other")
-
-        ct = (r.headers.get("Content-Type") or "").lower()
-        if "text/html" not in ct and "application/xhtml" not in ct and not ct.startswith("text/"):
-            r.close()
-            return (None, "not_html")
-
-        # läs max MAX_BYTES
-        chunks = []
-        read = 0
-        for chunk in r.iter_content(chunk_size=32_768):
-            if not chunk:
-                break
-            chunks.append(chunk)
-            read += len(chunk)
-            if read >= MAX_BYTES:
-                break
-        r.close()
-
-        raw = b"".join(chunks)
-        html = raw.decode("utf-8", errors="ignore")
-        return (html, "")
-
-    except requests.Timeout:
-        return (None, "timeout")
-    except (LocationParseError, InvalidURL):
-        return (None, "other")
-    except (ConnectionError, requests.RequestException) as e:
-        if _is_dns_miss_error(e):
-            return (None, "other")
-        return (None, "other")
-    except Exception:
-        return (None, "other")
-
-
-def normalize_url(u: str) -> str:
-    u = (u or "").strip()
-    if not u:
-        return ""
-    if not u.startswith("http://") and not u.startswith("https://"):
-        u = "https://" + u
-    return u
-
-
 def strip_text(html: str) -> str:
     # snabb text-extraktion (räcker för relevans + triggers)
     s = html.lower()
@@ -482,238 +369,241 @@ def find_external_job_links(base_url: str, html: str) -> list[str]:
 
 
 def load_done_set(path: Path) -> set[str]:
-    done = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
-
-
-def pick_targets(conn: sqlite3.Connection, limit: Optional[int]) -> list[tuple[str, str, str, Optional[str]]]:
-    cur = conn.cursor()
-
-    # vi tar bara bolag med website, och bara de som behöver refresh
-    if limit is None:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, hiring_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            """
-        )
-        rows = cur.fetchall()
-    else:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, hiring_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            LIMIT ?
-            """,
-            (limit * 5,),
-        )
-        rows = cur.fetchall()
+    # Kommentar: sidecar-index (<out>.done) – bara svansen efter senaste checkpoint JSON-parsas
+    return DoneIndex(path).load() | load_columnar_done(path)
+
+
+def pick_targets(
+    conn: sqlite3.Connection,
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> list[tuple[str, str, str, Optional[str]]]:
+    # Kommentar: refresh-regeln + shard körs i SQL (due-index: migrations/add_refresh_due_indexes.py)
+    cur = select_due(
+        conn,
+        RULES[QUEUE_KIND],
+        "orgnr, name, website, hiring_checked_at",
+        refresh_days=REFRESH_DAYS,
+        limit=limit,
+        shard=shard,
+    )
 
     out = []
-    for orgnr, name, website, checked_at in rows:
+    for orgnr, name, website, checked_at in cur:
         if not orgnr or not website:
             continue
-        if needs_refresh(checked_at):
-            out.append((orgnr, name or "", website, checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((orgnr, name or "", website, checked_at))
     return out
 
 
+async def process_target(
+    fetcher: Fetcher,
+    stats: Counter,
+    target: tuple[str, str, str, Optional[str]],
+) -> Optional[dict]:
+    """
+    Hiring review för ett bolag. Returnerar NDJSON-rad, eller None vid timeout (körs om senare).
+    """
+    orgnr, name, website, _prev_checked_at = target
+    base_url = normalize_url(website)
+
+    timeout_flag = False
+
+    html, err = await fetch_html(fetcher, base_url, max_bytes=MAX_BYTES)
+
+    # timeout => skriv INTE rad
+    if err == "timeout":
+        stats["err_timeout"] += 1
+        return None
+
+    row = {
+        "orgnr": orgnr,
+        "name": name,
+        "website": base_url,
+        "checked_at": utcnow_iso(),
+        "err_reason": "",
+        "hiring_status": "unknown",          # yes | no | unknown | maybe_external
+        "hiring_what_text": "",
+        "hiring_count": None,
+        "evidence_url": "",
+        "external_job_urls": [],
+    }
+
+    # 403/429/other/not_html på startsidan => unknown + skriv rad
+    if err in ("403", "429"):
+        row["err_reason"] = err
+        stats["unknown"] += 1
+        if err == "403":
+            stats["err_403"] += 1
+        else:
+            stats["err_429"] += 1
+        return row
+
+    if err:
+        stats["unknown"] += 1
+        if err == "not_html":
+            stats["skipped_not_html"] += 1
+            row["err_reason"] = "not_html"
+        else:
+            stats["err_other"] += 1
+            row["err_reason"] = "other"
+        return row
+
+    # externa jobblänkar från startsidan (indikator)
+    ext_urls = find_external_job_links(base_url, html or "")
+    if ext_urls:
+        row["external_job_urls"] = ext_urls
+
+    # STRICT: vi tar INTE beslut på startsidan.
+    # Startsidan används bara för att hitta karriär-länkar.
+    visited = {base_url}
+    queue: list[str] = []
+
+    # prova vanliga career paths direkt
+    for p in CAREER_PATH_HINTS:
+        u = urljoin(base_url.rstrip("/") + "/", p.lstrip("/"))
+        if u not in visited:
+            queue.append(u)
+
+    #och interna länkar som matchar career-paths
+    queue.extend(extract_internal_career_links(base_url, html or ""))
+
+    best_yes = False
+    best_what = ""
+    best_count = 0
+    best_evidence = ""
+
+    pages_used = 0
+    while queue and pages_used < MAX_PAGES:
+        u = queue.pop(0)
+        if u in visited:
+            continue
+        visited.add(u)
+
+        h2, e2 = await fetch_html(fetcher, u, max_bytes=MAX_BYTES)
+
+        if e2 == "timeout":
+            timeout_flag = True
+            break
+
+        # mur => skip
+        if e2 in ("403", "429"):
+            pages_used += 1
+            continue
+
+        if e2 or not h2:
+            pages_used += 1
+            continue
+
+        pages_used += 1
+
+        t2 = strip_text(h2)
+        if not is_relevant_page(t2):
+            continue
+
+        y, w, c = hard_hiring_decision_strict(u, h2)
+        if y:
+            best_yes = True
+            best_what = w
+            best_count = c if c >= 1 else 1
+            best_evidence = u
+            break
+
+    # timeout under crawl => skriv INTE rad
+    if timeout_flag:
+        stats["err_timeout"] += 1
+        return None
+
+    #slutbeslut
+    if best_yes:
+        row["hiring_status"] = "yes"
+        row["hiring_count"] = int(best_count)
+        row["hiring_what_text"] = best_what
+        row["evidence_url"] = best_evidence
+        row["err_reason"] = ""
+        stats["yes"] += 1
+    else:
+        # ingen intern jobbsida hittad => no eller maybe_external
+        if row["external_job_urls"]:
+            row["hiring_status"] = "maybe_external"
+            row["hiring_count"] = None
+            row["evidence_url"] = row["external_job_urls"][0]
+            stats["maybe_external"] += 1
+        else:
+            row["hiring_status"] = "no"
+            row["hiring_count"] = 0
+            row["evidence_url"] = ""
+            stats["no"] += 1
+
+    stats["ok"] += 1
+    return row
+
+
+def _print_progress(stats: Counter, start: float) -> None:
+    processed = stats["processed"]
+    rate = processed / max(1e-9, time.time() - start)
+    print(
+        f"[{processed}] ok={stats['ok']} yes={stats['yes']} no={stats['no']} maybe_external={stats['maybe_external']} "
+        f"unknown={stats['unknown']} not_html={stats['skipped_not_html']} "
+        f"403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']} | {rate:.1f}/s"
+    )
+
+
+async def crawl(targets: list[tuple[str, str, str, Optional[str]]], out_f, stats: Counter, qw: Optional[QueueWorker] = None) -> None:
+    start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        read_timeout=TIMEOUT_SECONDS,
+        scheduler=PolitenessScheduler(rate_per_sec=PER_DOMAIN_RATE, burst=PER_DOMAIN_BURST),
+        cache=cache,
+    ) as fetcher, keepalive(qw):
+        async for row in run_bounded(targets, track(qw, lambda t: process_target(fetcher, stats, t)), CONCURRENCY):
+            stats["processed"] += 1
+            if row is not None:
+                out_f.write_row(row)
+
+            if stats["processed"] % PRINT_EVERY == 0:
+                _print_progress(stats, start)
+
+
 def main():
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DB saknas: {DB_PATH}")
 
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    done = load_done_set(OUT_PATH) if RESUME else set()
+    # Kommentar: --sink-db => rader som ännu inte mergats räknas också som klara
+    sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID) if args.sink_db else None
+    done = (load_done_set(OUT_PATH) | (sink.load() if sink else set())) if RESUME else set()
     limit = None if LIMIT == 0 else LIMIT
 
     conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
     conn.execute("PRAGMA journal_mode=WAL;")
 
-    targets = pick_targets(conn, limit)
-    targets = [(o, n, w, c) for (o, n, w, c) in targets if in_shard(o)]
-
-    if RESUME and done:
-        targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
-
-    print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS})")
-
-    processed = ok = skipped_not_html = 0
-    err_403 = err_429 = err_timeout = err_other = 0
+    targets = pick_targets(conn, limit, shard=None if args.queue else (SHARD_ID, SHARD_TOTAL))
+    qw: Optional[QueueWorker] = None
+    if args.queue:
+        # Kommentar: kö-läge – ingen fast md5-shard, alla workers drar batchar ur samma kö
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
+        qw = QueueWorker(WorkQueue(QUEUE_PATH), QUEUE_KIND, default_owner(QUEUE_KIND, SHARD_ID))
+        added = qw.queue.enqueue(QUEUE_KIND, targets)
+        print(f"Kö: {QUEUE_KIND} nya={added} {qw.queue.counts(QUEUE_KIND)} (worker={qw.owner}, CONCURRENCY={CONCURRENCY})")
+        targets = qw.targets()
+    else:
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
 
-    yes_count = 0
-    no_count = 0
-    unknown_count = 0
-    maybe_external_count = 0
+        print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS}, CONCURRENCY={CONCURRENCY})")
 
-    start = time.time()
+    stats: Counter = Counter()
 
     try:
-        with OUT_PATH.open("a", encoding="utf-8") as out_f:
-            for orgnr, name, website, _prev_checked_at in targets:
-                processed += 1
-                base_url = normalize_url(website)
-
-                timeout_flag = False
-
-                html, err = fetch_html(base_url)
-                time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                # timeout => skriv INTE rad
-                if err == "timeout":
-                    err_timeout += 1
-                    continue
-
-                row = {
-                    "orgnr": orgnr,
-                    "name": name,
-                    "website": base_url,
-                    "checked_at": utcnow_iso(),
-                    "err_reason": "",
-                    "hiring_status": "unknown",          # yes | no | unknown | maybe_external
-                    "hiring_what_text": "",
-                    "hiring_count": None,
-                    "evidence_url": "",
-                    "external_job_urls": [],
-                }
-
-                # 403/429/other/not_html på startsidan => unknown + skriv rad
-                if err in ("403", "429"):
-                    row["err_reason"] = err
-                    unknown_count += 1
-                    if err == "403":
-                        err_403 += 1
-                    else:
-                        err_429 += 1
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    continue
-
-                if err:
-                    unknown_count += 1
-                    if err == "not_html":
-                        skipped_not_html += 1
-                        row["err_reason"] = "not_html"
-                    else:
-                        err_other += 1
-                        row["err_reason"] = "other"
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    continue
-
-                # externa jobblänkar från startsidan (indikator)
-                ext_urls = find_external_job_links(base_url, html or "")
-                if ext_urls:
-                    row["external_job_urls"] = ext_urls
-
-                # STRICT: vi tar INTE beslut på startsidan.
-                # Startsidan används bara för att hitta karriär-länkar.
-                visited = {base_url}
-                queue: list[str] = []
-
-                # prova vanliga career paths direkt
-                for p in CAREER_PATH_HINTS:
-                    u = urljoin(base_url.rstrip("/") + "/", p.lstrip("/"))
-                    if u not in visited:
-                        queue.append(u)
-
-                #och interna länkar som matchar career-paths
-                queue.extend(extract_internal_career_links(base_url, html or ""))
-
-                best_yes = False
-                best_what = ""
-                best_count = 0
-                best_evidence = ""
-
-                pages_used = 0
-                while queue and pages_used < MAX_PAGES:
-                    u = queue.pop(0)
-                    if u in visited:
-                        continue
-                    visited.add(u)
-
-                    h2, e2 = fetch_html(u)
-                    time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                    if e2 == "timeout":
-                        timeout_flag = True
-                        break
-
-                    # mur => skip
-                    if e2 in ("403", "429"):
-                        pages_used += 1
-                        continue
-
-                    if e2 or not h2:
-                        pages_used += 1
-                        continue
-
-                    pages_used += 1
-
-                    t2 = strip_text(h2)
-                    if not is_relevant_page(t2):
-                        continue
-
-                    y, w, c = hard_hiring_decision_strict(u, h2)
-                    if y:
-                        best_yes = True
-                        best_what = w
-                        best_count = c if c >= 1 else 1
-                        best_evidence = u
-                        break
-
-                # timeout under crawl => skriv INTE rad
-                if timeout_flag:
-                    err_timeout += 1
-                    continue
-
-                #slutbeslut
-                if best_yes:
-                    row["hiring_status"] = "yes"
-                    row["hiring_count"] = int(best_count)
-                    row["hiring_what_text"] = best_what
-                    row["evidence_url"] = best_evidence
-                    row["err_reason"] = ""
-                    yes_count += 1
-                else:
-                    # ingen intern jobbsida hittad => no eller maybe_external
-                    if row["external_job_urls"]:
-                        row["hiring_status"] = "maybe_external"
-                        row["hiring_count"] = None
-                        row["evidence_url"] = row["external_job_urls"][0]
-                        maybe_external_count += 1
-                    else:
-                        row["hiring_status"] = "no"
-                        row["hiring_count"] = 0
-                        row["evidence_url"] = ""
-                        no_count += 1
-
-                out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                ok += 1
-
-                if processed % PRINT_EVERY == 0:
-                    rate = processed / max(1e-9, time.time() - start)
-                    print(
-                        f"[{processed}] ok={ok} yes={yes_count} no={no_count} maybe_external={maybe_external_count} "
-                        f"unknown={unknown_count} not_html={skipped_not_html} "
-                        f"403={err_403} 429={err_429} timeout={err_timeout} other={err_other} | {rate:.1f}/s"
-                    )
+        with open_writer(OUT_PATH, sink, columnar=args.columnar) as out_f:
+            asyncio.run(crawl(targets, queue_writer(qw, out_f), stats, qw))
 
     except KeyboardInterrupt:
         print("\nAvbruten (Ctrl+C) — filen är sparad ✅")
@@ -722,11 +612,11 @@ def main():
 
     print("KLART ✅")
     print(
-        f"Processade: {processed} | OK: {ok} | yes={yes_count} | no={no_count} | maybe_external={maybe_external_count} "
-        f"| unknown={unknown_count} | not_html={skipped_not_html}"
+        f"Processade: {stats['processed']} | OK: {stats['ok']} | yes={stats['yes']} | no={stats['no']} "
+        f"| maybe_external={stats['maybe_external']} | unknown={stats['unknown']} | not_html={stats['skipped_not_html']}"
     )
-    print(f"Errors: 403={err_403} 429={err_429} timeout={err_timeout} other={err_other}")
-    print(f"OUT: {OUT_PATH.resolve()}")
+    print(f"Errors: 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']}")
+    print(f"OUT: {(sink.path if sink else OUT_PATH).resolve()}")
 
 
 if __name__ == "__main__":
@@ -12,20 +12,27 @@
 # - Om du vill “refresh”-logik: använd companies.segment_groups_checked_at (TEXT ISO).
 
 import argparse
-import hashlib
-import json
 import sqlite3
+import sys
 import time
 from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.refresh_sql import RULES, RefreshRule, select_due
+
 # =========================
 # ÄNDRA HÄR
 # =========================
 DB_PATH = Path("data/db/companies.db.sqlite")
 OUT_DIR = Path("data/out/shards")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0
 RESUME = True
 PRINT_EVERY = 250
@@ -133,18 +140,6 @@ def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
-def _parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        ss = str(s).replace("Z", "+00:00")
-        if "T" not in ss and " " in ss:
-            ss = ss.replace(" ", "T")
-        return datetime.fromisoformat(ss)
-    except Exception:
-        return None
-
-
 def _has_column(con: sqlite3.Connection, table: str, col: str) -> bool:
     cur = con.cursor()
     cur.execute(f"PRAGMA table_info({table})")
@@ -160,28 +155,8 @@ def _require_columns(con: sqlite3.Connection) -> None:
         raise SystemExit("Saknar kolumn companies.segment_groups (kör migration).")
 
 
-def _in_shard(orgnr: str, shard_id: int, shard_total: int) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % shard_total) == shard_id
-
-
 def _load_done_set(path: Path) -> Set[str]:
-    done: Set[str] = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
+    return DoneIndex(path).load() | load_columnar_done(path)
 
 
 def _parse_groups_csv(raw: Optional[str]) -> List[str]:
@@ -200,19 +175,6 @@ def _to_groups_csv(groups: Iterable[str]) -> str:
     return ",".join(uniq)
 
 
-def _should_refresh(existing_groups: Optional[str], checked_at: Optional[str], *, has_checked_col: bool) -> bool:
-    # Kommentar: samma tänk som sni_groups-scriptet
-    if not has_checked_col:
-        return True
-    if not existing_groups or not str(existing_groups).strip():
-        return True
-    dt = _parse_iso(checked_at)
-    if not dt:
-        return True
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-
 def _segment_from_line_of_work(line_of_work: str) -> List[str]:
     k = (line_of_work or "").strip().lower()
     if not k or k in ("unknown", "okänd", '""', "__no__"):
@@ -240,40 +202,30 @@ def _pick_targets(
     *,
     limit: Optional[int],
     has_checked_col: bool,
+    shard: Optional[Tuple[int, int]] = None,
 ) -> List[Tuple[str, str, str, str, Optional[str], Optional[str]]]:
     """
     Returns: (orgnr, name, line_of_work, sni_text, segment_groups_before, segment_groups_checked_at)
     """
-    cur = con.cursor()
-
     select_cols = ["orgnr", "name", "line_of_work", "COALESCE(sni_text,'') AS sni_text", "segment_groups"]
     if has_checked_col:
+        # Kommentar: refresh + shard i SQL (due-index: migrations/add_refresh_due_indexes.py)
+        rule = RULES["segment_groups"]
+        refresh_days: Optional[int] = REFRESH_DAYS
         select_cols.append("segment_groups_checked_at")
     else:
+        # Kommentar: utan checked_at-kolumn => refresh ALLA (som förut), i orgnr-ordning
+        rule = RefreshRule("", "orgnr", RULES["segment_groups"].where)
+        refresh_days = None
         select_cols.append("NULL AS segment_groups_checked_at")
 
-    base_sql = f"""
-      SELECT {", ".join(select_cols)}
-      FROM companies
-      WHERE line_of_work IS NOT NULL AND TRIM(line_of_work) <> ''
-      ORDER BY orgnr ASC
-    """
-
-    if limit is None:
-        cur.execute(base_sql)
-        rows = cur.fetchall()
-    else:
-        cur.execute(base_sql + " LIMIT ?", (limit * 5,))
-        rows = cur.fetchall()
+    cur = select_due(con, rule, ", ".join(select_cols), refresh_days=refresh_days, limit=limit, shard=shard)
 
     out: List[Tuple[str, str, str, str, Optional[str], Optional[str]]] = []
-    for orgnr, name, line_of_work, sni_text, seg_before, checked_at in rows:
+    for orgnr, name, line_of_work, sni_text, seg_before, checked_at in cur:
         if not orgnr or not name:
             continue
-        if _should_refresh(seg_before, checked_at, has_checked_col=has_checked_col):
-            out.append((str(orgnr), str(name), str(line_of_work or ""), str(sni_text or ""), seg_before, checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((str(orgnr), str(name), str(line_of_work or ""), str(sni_text or ""), seg_before, checked_at))
     return out
 
 
@@ -281,6 +233,8 @@ def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--shard-id", type=int, required=True)
     ap.add_argument("--shard-total", type=int, default=4)
+    ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+    ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
     args = ap.parse_args()
 
     shard_id = int(args.shard_id)
@@ -299,11 +253,11 @@ def main() -> None:
         _require_columns(conn)
         has_checked_col = _has_column(conn, "companies", "segment_groups_checked_at")
 
-        done = _load_done_set(out_path) if RESUME else set()
+        sink = DbSink(SINK_DIR, "segment_groups", shard_id) if args.sink_db else None
+        done = (_load_done_set(out_path) | (sink.load() if sink else set())) if RESUME else set()
         limit = None if LIMIT == 0 else LIMIT
 
-        targets = _pick_targets(conn, limit=limit, has_checked_col=has_checked_col)
-        targets = [t for t in targets if _in_shard(t[0], shard_id, shard_total)]
+        targets = _pick_targets(conn, limit=limit, has_checked_col=has_checked_col, shard=(shard_id, shard_total))
         if RESUME and done:
             targets = [t for t in targets if t[0] not in done]
 
@@ -321,7 +275,7 @@ def main() -> None:
         start = time.time()
         ts = utcnow_iso()
 
-        with out_path.open("a", encoding="utf-8") as out_f:
+        with open_writer(out_path, sink, columnar=args.columnar) as out_f:
             for orgnr, name, line_of_work, sni_text, seg_before_raw, checked_before in targets:
                 processed += 1
                 try:
@@ -359,7 +313,7 @@ def main() -> None:
                         "shard_id": shard_id,
                         "shard_total": shard_total,
                     }
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    out_f.write_row(row)
 
                 except Exception:
                     err_other += 1
@@ -377,7 +331,7 @@ def main() -> None:
                         "shard_id": shard_id,
                         "shard_total": shard_total,
                     }
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    out_f.write_row(row)
 
                 if processed % PRINT_EVERY == 0:
                     rate = processed / max(1e-9, time.time() - start)
@@ -391,7 +345,7 @@ def main() -> None:
         print("Per segment (matchade företag):")
         for s in SEGMENTS:
             print(f"- {s.key}: {seg_counts.get(s.key, 0)}")
-        print(f"OUT: {out_path.resolve()}")
+        print(f"OUT: {(sink.path if sink else out_path).resolve()}")
 
     finally:
         conn.close()
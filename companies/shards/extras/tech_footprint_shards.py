@@ -2,26 +2,45 @@
 
 #klar 01-19, ger bra data 70-80% sanning tror jag (oklart svar från ai)
 import re
+import sys
 import time
-import json
+import asyncio
 import sqlite3
-import hashlib
 import argparse
-from datetime import datetime, timedelta, timezone
+import threading
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 from urllib.parse import urlsplit, urljoin
 
-import requests
-from requests.exceptions import ConnectionError, InvalidURL
-from urllib3.exceptions import LocationParseError
+import dns.exception
 
-import dns.resolver
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.dns_cache import CachedResolver
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.fetch import Fetcher, fetch_html, normalize_url, run_bounded
+from companies.shards.shared.keyword_matcher import KeywordMatcher
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+from companies.shards.shared.refresh_sql import RULES, select_due
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, default_owner, keepalive, queue_writer, track
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--shard-id", type=int, required=True)
 ap.add_argument("--shard-total", type=int, default=4)
-args = ap.parse_args()
+ap.add_argument("--queue", action="store_true", help="dra targets ur delad arbetskö i stället för md5-shard")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
+# Kommentar: strikt när skriptet körs självt (felstavad flagga = fel, inte default); importerad av
+# enrich_all_shards.py tål vi pipelinens egna flaggor (--only osv.), pipelinen validerar sina själv
+if __name__ == "__main__":
+    args = ap.parse_args()
+else:
+    args, _unknown = ap.parse_known_args()
 
 SHARD_ID = args.shard_id
 SHARD_TOTAL = args.shard_total
@@ -31,6 +50,7 @@ SHARD_TOTAL = args.shard_total
 # =========================
 DB_PATH = Path("data/db/companies.db.sqlite")
 OUT_PATH = Path(f"data/out/shards/tech_footprint_shard{SHARD_ID}.ndjson")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0              # 0 = ALLA
 RESUME = True
 PRINT_EVERY = 50
@@ -38,14 +58,24 @@ REFRESH_DAYS = 30      # Kommentar: rerun efter 30 dagar
 # =========================
 
 TIMEOUT_SECONDS = 12
-SLEEP_BETWEEN_REQUESTS = 0.15
+PER_DOMAIN_RATE = 6.0  # Kommentar: max requests/s per registrerad domän (token bucket)
+PER_DOMAIN_BURST = 2
+# Kommentar: delad sidcache mellan shards (samma sida hämtas en gång för hela enrichment-sviten)
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+# Kommentar: --queue => lease-baserad kö (valfritt antal workers), annars fast md5-shard
+QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+QUEUE_KIND = "tech"
+DNS_CACHE_PATH = Path("data/cache/dns_cache.sqlite")  # Kommentar: delas med outreach/control/domain_reputation.py
 MAX_BYTES = 450_000    # Kommentar: vi läser max ~450KB HTML per sida
 MAX_PAGES = 5          # Kommentar: liten crawl-budget
 
-session = requests.Session()
-session.headers.update({
-    "User-Agent": f"Mozilla/5.0 (Didup-TechFootprint/1.0; shard={SHARD_ID})"
-})
+# Kommentar: async-motorn – antal bolag samtidigt + anslutningstak
+CONCURRENCY = 100
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
+
+USER_AGENT = f"Mozilla/5.0 (Didup-TechFootprint/1.0; shard={SHARD_ID})"
 
 # Kommentar: interna sidor vi vill prova/leta efter
 TECH_PATH_HINTS = [
@@ -86,139 +116,18 @@ IT_SUPPORT_MEDIUM = [
     "infrastruktur", "systemförvaltning", "systemforvaltning"
 ]
 
+# Kommentar: alla tabeller ovan i en automat – combined_text scannas en gång för IT-support + Microsoft
+TECH_MATCHER = KeywordMatcher({
+    **{f"ms:{cat}": words for cat, words in MS_TRIGGERS.items()},
+    "ms_mail": MS_MAIL_TEXT,
+    "azure": AZURE_RESOURCE_HINTS,
+    "it_strong": IT_SUPPORT_STRONG,
+    "it_medium": IT_SUPPORT_MEDIUM,
+})
+
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
-def parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return None
-
-def needs_refresh(checked_at: Optional[str]) -> bool:
-    dt = parse_iso(checked_at)
-    if not dt:
-        return True
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-def in_shard(orgnr: str) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % SHARD_TOTAL) == SHARD_ID
-
-def _valid_hostname(host: str) -> bool:
-    if not host:
-        return False
-    host = host.strip().lower().rstrip(".")
-    if len(host) > 253:
-        return False
-    if any(c.isspace() for c in host):
-        return False
-    if ".." in host:
-        return False
-    labels = host.split(".")
-    if len(labels) < 2:
-        return False
-    for lab in labels:
-        if not lab or len(lab) > 63:
-            return False
-        if lab.startswith("-") or lab.endswith("-"):
-            return False
-        if not re.fullmatch(r"[a-z0-9-]+", lab):
-            return False
-    return True
-
-def _safe_url(url: str) -> bool:
-    try:
-        u = url.strip()
-        parts = urlsplit(u)
-        if parts.scheme not in ("http", "https"):
-            return False
-        host = parts.hostname or ""
-        return _valid_hostname(host)
-    except Exception:
-        return False
-
-def _is_retryable_status(code: int) -> bool:
-    # Kommentar: vi retryar INTE 403/429, bara timeout (timeout => ingen rad)
-    return code in (403, 429, 500, 502, 503, 504)
-
-def _is_dns_miss_error(e: Exception) -> bool:
-    msg = str(e).lower()
-    return (
-        "name or service not known" in msg
-        or "failed to resolve" in msg
-        or "nodename nor servname" in msg
-        or "temporary failure in name resolution" in msg
-        or "getaddrinfo failed" in msg
-    )
-
-def fetch_html(url: str) -> tuple[Optional[str], str]:
-    """
-    Returns (html_text_or_none, err_reason)
-    err_reason: "" | "403" | "429" | "timeout" | "other" | "not_html"
-    """
-    if not _safe_url(url):
-        return (None, "other")
-
-    try:
-        r = session.get(
-            url,
-            timeout=(3, TIMEOUT_SECONDS),
-            allow_redirects=True,
-            stream=True,
-        )
-
-        if _is_retryable_status(r.status_code):
-            r.close()
-            return (None, str(r.status_code))
-
-        if not (200 <= r.status_code < 400):
-            r.close()
-            return (None, "other")
-
-        ct = (r.headers.get("Content-Type") or "").lower()
-        if "text/html" not in ct and "application/xhtml" not in ct and not ct.startswith("text/"):
-            r.close()
-            return (None, "not_html")
-
-        # Kommentar: läs max MAX_BYTES
-        chunks = []
-        read = 0
-        for chunk in r.iter_content(chunk_size=32_768):
-            if not chunk:
-                break
-            chunks.append(chunk)
-            read += len(chunk)
-            if read >= MAX_BYTES:
-                break
-        r.close()
-
-        raw = b"".join(chunks)
-        html = raw.decode("utf-8", errors="ignore")
-        return (html, "")
-
-    except requests.Timeout:
-        return (None, "timeout")
-    except (LocationParseError, InvalidURL):
-        return (None, "other")
-    except (ConnectionError, requests.RequestException) as e:
-        if _is_dns_miss_error(e):
-            return (None, "other")
-        return (None, "other")
-    except Exception:
-        return (None, "other")
-
-def normalize_url(u: str) -> str:
-    u = (u or "").strip()
-    if not u:
-        return ""
-    if not u.startswith("http://") and not u.startswith("https://"):
-        u = "https://" + u
-    return u
-
 def strip_text(html: str) -> str:
     # Kommentar: snabb text-extraktion
     s = html.lower()
@@ -270,70 +179,70 @@ def extract_internal_links(base_url: str, html: str) -> list[str]:
             break
     return uniq
 
+_dns_resolver: Optional[CachedResolver] = None
+_dns_lock = threading.Lock()
+
+def _dns() -> CachedResolver:
+    # Kommentar: en delad resolver per process (skapas först när den behövs, så pipeline-import inte öppnar DB)
+    global _dns_resolver
+    with _dns_lock:
+        if _dns_resolver is None:
+            _dns_resolver = CachedResolver(DNS_CACHE_PATH)
+    return _dns_resolver
+
 def dns_lookup_m365(domain: str) -> tuple[bool, bool, bool]:
     """
     Returns (m365_mail, spf_hit, mx_hit)
     Kommentar: timeout bubbla upp som exception (vi hanterar i main => ingen rad)
+    Kommentar: svar (även NXDOMAIN/NoAnswer) cachas i DNS_CACHE_PATH så länge TTL gäller
     """
-    res = dns.resolver.Resolver(configure=True)
-    res.lifetime = 3.0
-    res.timeout = 2.0
-
-    spf_hit = False
-    mx_hit = False
+    res = _dns()
 
     # TXT/SPF
-    try:
-        answers = res.resolve(domain, "TXT")
-        for rr in answers:
-            txt = b"".join(getattr(rr, "strings", [])).decode("utf-8", errors="ignore").lower()
-            if "spf.protection.outlook.com" in txt:
-                spf_hit = True
-                break
-    except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
-        pass
+    spf_hit = any("spf.protection.outlook.com" in txt.lower() for txt in res.txt(domain))
 
     # MX
-    try:
-        answers = res.resolve(domain, "MX")
-        for rr in answers:
-            exch = str(rr.exchange).rstrip(".").lower()
-            if exch.endswith("mail.protection.outlook.com"):
-                mx_hit = True
-                break
-    except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
-        pass
+    mx_hit = any(exch.endswith("mail.protection.outlook.com") for exch in res.mx(domain))
 
     m365_mail = spf_hit or mx_hit
     return (m365_mail, spf_hit, mx_hit)
 
-def count_ms_categories(text: str) -> tuple[int, dict[str, bool]]:
+# Kommentar: found = TECH_MATCHER.found(text) kan skickas in så flera detektorer delar samma scan
+def count_ms_categories(text: str, found: Optional[set[str]] = None) -> tuple[int, dict[str, bool]]:
+    if found is None:
+        found = TECH_MATCHER.found(text)
     hit = {k: False for k in MS_TRIGGERS.keys()}
     for cat, words in MS_TRIGGERS.items():
         for w in words:
-            if w in text:
+            if w in found:
                 hit[cat] = True
                 break
     cnt = sum(1 for v in hit.values() if v)
     return cnt, hit
 
-def has_azure_resource_hints(text: str) -> bool:
-    return any(h in text for h in AZURE_RESOURCE_HINTS)
+def has_azure_resource_hints(text: str, found: Optional[set[str]] = None) -> bool:
+    if found is None:
+        found = TECH_MATCHER.found(text)
+    return any(h in found for h in AZURE_RESOURCE_HINTS)
 
-def detect_it_support(text: str) -> tuple[str, str]:
+def detect_it_support(text: str, found: Optional[set[str]] = None) -> tuple[str, str]:
     # Returns (signal, confidence)
-    if any(w in text for w in IT_SUPPORT_STRONG):
+    if found is None:
+        found = TECH_MATCHER.found(text)
+    if any(w in found for w in IT_SUPPORT_STRONG):
         return ("yes", "high")
-    if any(w in text for w in IT_SUPPORT_MEDIUM):
+    if any(w in found for w in IT_SUPPORT_MEDIUM):
         return ("yes", "medium")
     return ("no", "low")
 
-def detect_microsoft_from_web(text: str) -> tuple[str, Optional[str], str]:
+def detect_microsoft_from_web(text: str, found: Optional[set[str]] = None) -> tuple[str, Optional[str], str]:
     """
     Returns (status, strength, confidence) baserat på webbsignaler enbart
     """
-    cat_count, _hit = count_ms_categories(text)
-    azure_hint = has_azure_resource_hints(text)
+    if found is None:
+        found = TECH_MATCHER.found(text)
+    cat_count, _hit = count_ms_categories(text, found)
+    azure_hint = has_azure_resource_hints(text, found)
 
     if cat_count >= 2:
         # Kommentar: strong via 2+ kategorier
@@ -343,7 +252,7 @@ def detect_microsoft_from_web(text: str) -> tuple[str, Optional[str], str]:
         return ("yes", "strong", conf)
 
     # Kommentar: weak via mail-text eller 1 kategori (svag)
-    if any(w in text for w in MS_MAIL_TEXT):
+    if any(w in found for w in MS_MAIL_TEXT):
         return ("yes", "weak", "medium")
 
     if cat_count == 1:
@@ -351,57 +260,75 @@ def detect_microsoft_from_web(text: str) -> tuple[str, Optional[str], str]:
 
     return ("no", None, "low")
 
+def web_signals_final(found: set[str]) -> bool:
+    """
+    True när mer text inte kan ändra raden: IT-support redan yes/high och Microsoft från webben redan strong/high
+    (träffar kan bara läggas till, och web strong vinner över DNS i slutbeslutet).
+    """
+    if not any(w in found for w in IT_SUPPORT_STRONG):
+        return False
+    cat_count, _hit = count_ms_categories("", found)
+    return cat_count >= 3 or (cat_count >= 2 and has_azure_resource_hints("", found))
+
+_OPEN_BLOCKS = (("<script", "</script>"), ("<style", "</style>"), ("<!--", "-->"))
+
+def _clean_cut(html_lower: str) -> int:
+    # Kommentar: längsta prefix som slutar efter en hel tagg och inte mitt i script/style/kommentar
+    #  => strip_text(prefix) är en del av strip_text(hela sidan)
+    cut = html_lower.rfind(">") + 1
+    for open_, close in _OPEN_BLOCKS:
+        i = html_lower.rfind(open_, 0, cut)
+        if i != -1 and html_lower.find(close, i, cut) == -1:
+            cut = i
+    return cut
+
+class _StopWhenFinal:
+    """
+    stop-predikat för fetch_html, delas av alla sidor för ett bolag: strip_text + TECH_MATCHER per hel bit
+    (varje byte en gång) och avbryt när web_signals_final. Träffar över en bitgräns missas => stannar hellre för sent.
+    """
+
+    def __init__(self) -> None:
+        self.found: set[str] = set()
+        self.final = False
+        self._pending = ""
+
+    def __call__(self, piece: str) -> bool:
+        self._pending += piece.lower()
+        cut = _clean_cut(self._pending)
+        if cut:
+            self.found |= TECH_MATCHER.found(strip_text(self._pending[:cut]))
+            self._pending = self._pending[cut:]
+            self.final = web_signals_final(self.found)
+        return self.final
+
+    def next_page(self) -> None:
+        self._pending = ""
+
 def load_done_set(path: Path) -> set[str]:
-    done = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
-
-def pick_targets(conn: sqlite3.Connection, limit: Optional[int]) -> list[tuple[str, str, str, Optional[str]]]:
-    cur = conn.cursor()
-
-    # Kommentar: vi tar bara bolag med website, och bara de som behöver refresh
-    if limit is None:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, tech_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            """
-        )
-        rows = cur.fetchall()
-    else:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, tech_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            LIMIT ?
-            """,
-            (limit * 5,),
-        )
-        rows = cur.fetchall()
+    # Kommentar: sidecar-index (<out>.done) – bara svansen efter senaste checkpoint JSON-parsas
+    return DoneIndex(path).load() | load_columnar_done(path)
+
+def pick_targets(
+    conn: sqlite3.Connection,
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> list[tuple[str, str, str, Optional[str]]]:
+    # Kommentar: refresh-regeln + shard körs i SQL (due-index: migrations/add_refresh_due_indexes.py)
+    cur = select_due(
+        conn,
+        RULES[QUEUE_KIND],
+        "orgnr, name, website, tech_checked_at",
+        refresh_days=REFRESH_DAYS,
+        limit=limit,
+        shard=shard,
+    )
 
     out = []
-    for orgnr, name, website, checked_at in rows:
+    for orgnr, name, website, checked_at in cur:
         if not orgnr or not website:
             continue
-        if needs_refresh(checked_at):
-            out.append((orgnr, name or "", website, checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((orgnr, name or "", website, checked_at))
     return out
 
 def domain_from_website(url: str) -> str:
@@ -409,178 +336,215 @@ def domain_from_website(url: str) -> str:
     host = (parts.hostname or "").strip().lower().rstrip(".")
     return host
 
+async def process_target(
+    fetcher: Fetcher,
+    stats: Counter,
+    target: tuple[str, str, str, Optional[str]],
+) -> Optional[dict]:
+    """
+    Tech footprint för ett bolag. Returnerar NDJSON-rad, eller None vid timeout (körs om senare).
+    """
+    orgnr, name, website, _prev_checked_at = target
+    base_url = normalize_url(website)
+
+    # Kommentar: timeout-hantering per orgnr
+    timeout_flag = False
+
+    row = {
+        "orgnr": orgnr,
+        "name": name,
+        "website": base_url,
+        "checked_at": utcnow_iso(),
+        "err_reason": "",
+        "microsoft_status": "unknown",
+        "microsoft_strength": None,
+        "microsoft_confidence": "low",
+        "it_support_signal": "unknown",
+        "it_support_confidence": "low",
+    }
+
+    # 1) DNS-check (hög signal för mail)
+    # Kommentar: dnspython är blockerande => kör i tråd så event-loopen inte står still
+    domain = domain_from_website(base_url)
+    try:
+        m365_mail, _spf_hit, _mx_hit = await asyncio.to_thread(dns_lookup_m365, domain)
+    except dns.exception.Timeout:
+        stats["err_timeout"] += 1
+        return None
+    except Exception:
+        # Kommentar: DNS-fel ska inte döda allt; vi fortsätter med webben
+        m365_mail = False
+
+    # 2) Hämta startsidan
+    # Kommentar: läsningen avbryts så fort signalerna är slutgiltiga (resten av sidan/crawlen kan inte ändra raden)
+    stop = _StopWhenFinal()
+    html, err = await fetch_html(fetcher, base_url, max_bytes=MAX_BYTES, stop=stop)
+
+    # Kommentar: timeout => skriv INTE rad
+    if err == "timeout":
+        stats["err_timeout"] += 1
+        return None
+
+    # 403/429/other/not_html på startsidan => unknown + skriv rad
+    if err in ("403", "429"):
+        row["err_reason"] = err
+        if err == "403":
+            stats["err_403"] += 1
+        else:
+            stats["err_429"] += 1
+        return row
+
+    if err:
+        if err == "not_html":
+            stats["skipped_not_html"] += 1
+            row["err_reason"] = "not_html"
+        else:
+            stats["err_other"] += 1
+            row["err_reason"] = "other"
+        return row
+
+    # Kommentar: samla text från crawlade sidor (max budget)
+    all_texts: list[str] = []
+    t0 = strip_text(html or "")
+    all_texts.append(t0)
+
+    visited = set([base_url])
+    queue: list[str] = []
+
+    # Kommentar: prova vanliga paths direkt
+    for p in TECH_PATH_HINTS:
+        u = urljoin(base_url.rstrip("/") + "/", p.lstrip("/"))
+        if u not in visited:
+            queue.append(u)
+
+    # Kommentar: och länkar från startsidan (endast interna)
+    queue.extend(extract_internal_links(base_url, html or ""))
+
+    pages_used = 1
+    while queue and pages_used < MAX_PAGES and not stop.final:
+        u = queue.pop(0)
+        if u in visited:
+            continue
+        visited.add(u)
+
+        stop.next_page()
+        h2, e2 = await fetch_html(fetcher, u, max_bytes=MAX_BYTES, stop=stop)
+
+        if e2 == "timeout":
+            timeout_flag = True
+            break
+
+        if e2 in ("403", "429"):
+            pages_used += 1
+            continue
+
+        if e2 or not h2:
+            pages_used += 1
+            continue
+
+        pages_used += 1
+        all_texts.append(strip_text(h2))
+
+    # Kommentar: timeout under crawl => skriv INTE rad
+    if timeout_flag:
+        stats["err_timeout"] += 1
+        return None
+
+    combined_text = " ".join(all_texts)
+    found = TECH_MATCHER.found(combined_text)
+
+    # 3) IT-support
+    it_signal, it_conf = detect_it_support(combined_text, found)
+    row["it_support_signal"] = it_signal
+    row["it_support_confidence"] = it_conf
+
+    # 4) Microsoft från webben
+    ms_status_web, ms_strength_web, ms_conf_web = detect_microsoft_from_web(combined_text, found)
+
+    # 5) Slutbeslut för Microsoft (web strong vinner, annars DNS mail => weak/high)
+    if ms_status_web == "yes" and ms_strength_web == "strong":
+        row["microsoft_status"] = "yes"
+        row["microsoft_strength"] = "strong"
+        row["microsoft_confidence"] = ms_conf_web
+    elif m365_mail:
+        row["microsoft_status"] = "yes"
+        row["microsoft_strength"] = "weak"
+        row["microsoft_confidence"] = "high"
+    elif ms_status_web == "yes":
+        row["microsoft_status"] = "yes"
+        row["microsoft_strength"] = ms_strength_web or "weak"
+        row["microsoft_confidence"] = ms_conf_web
+    else:
+        row["microsoft_status"] = "no"
+        row["microsoft_strength"] = None
+        row["microsoft_confidence"] = "low"
+
+    stats["ok"] += 1
+    return row
+
+def _print_progress(stats: Counter, start: float) -> None:
+    processed = stats["processed"]
+    rate = processed / max(1e-9, time.time() - start)
+    print(
+        f"[{processed}] ok={stats['ok']} not_html={stats['skipped_not_html']} "
+        f"403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']} | {rate:.1f}/s"
+    )
+
+async def crawl(targets: list[tuple[str, str, str, Optional[str]]], out_f, stats: Counter, qw: Optional[QueueWorker] = None) -> None:
+    start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        read_timeout=TIMEOUT_SECONDS,
+        scheduler=PolitenessScheduler(rate_per_sec=PER_DOMAIN_RATE, burst=PER_DOMAIN_BURST),
+        cache=cache,
+    ) as fetcher, keepalive(qw):
+        async for row in run_bounded(targets, track(qw, lambda t: process_target(fetcher, stats, t)), CONCURRENCY):
+            stats["processed"] += 1
+            if row is not None:
+                # 6) skriv rad
+                out_f.write_row(row)
+
+            if stats["processed"] % PRINT_EVERY == 0:
+                _print_progress(stats, start)
+
 def main():
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DB saknas: {DB_PATH}")
 
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    done = load_done_set(OUT_PATH) if RESUME else set()
+    # Kommentar: --sink-db => rader som ännu inte mergats räknas också som klara
+    sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID) if args.sink_db else None
+    done = (load_done_set(OUT_PATH) | (sink.load() if sink else set())) if RESUME else set()
     limit = None if LIMIT == 0 else LIMIT
 
     conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
     conn.execute("PRAGMA journal_mode=WAL;")
 
-    targets = pick_targets(conn, limit)
-    targets = [(o, n, w, c) for (o, n, w, c) in targets if in_shard(o)]
-
-    if RESUME and done:
-        targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
-
-    print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS})")
+    targets = pick_targets(conn, limit, shard=None if args.queue else (SHARD_ID, SHARD_TOTAL))
+    qw: Optional[QueueWorker] = None
+    if args.queue:
+        # Kommentar: kö-läge – ingen fast md5-shard, alla workers drar batchar ur samma kö
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
+        qw = QueueWorker(WorkQueue(QUEUE_PATH), QUEUE_KIND, default_owner(QUEUE_KIND, SHARD_ID))
+        added = qw.queue.enqueue(QUEUE_KIND, targets)
+        print(f"Kö: {QUEUE_KIND} nya={added} {qw.queue.counts(QUEUE_KIND)} (worker={qw.owner}, CONCURRENCY={CONCURRENCY})")
+        targets = qw.targets()
+    else:
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
 
-    processed = ok = skipped_not_html = 0
-    err_403 = err_429 = err_timeout = err_other = 0
+        print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS}, CONCURRENCY={CONCURRENCY})")
 
-    start = time.time()
+    stats: Counter = Counter()
 
     try:
-        with OUT_PATH.open("a", encoding="utf-8") as out_f:
-            for orgnr, name, website, _prev_checked_at in targets:
-                processed += 1
-                base_url = normalize_url(website)
-
-                # Kommentar: timeout-hantering per orgnr
-                timeout_flag = False
-
-                row = {
-                    "orgnr": orgnr,
-                    "name": name,
-                    "website": base_url,
-                    "checked_at": utcnow_iso(),
-                    "err_reason": "",
-                    "microsoft_status": "unknown",
-                    "microsoft_strength": None,
-                    "microsoft_confidence": "low",
-                    "it_support_signal": "unknown",
-                    "it_support_confidence": "low",
-                }
-
-                # 1) DNS-check (hög signal för mail)
-                domain = domain_from_website(base_url)
-                try:
-                    m365_mail, _spf_hit, _mx_hit = dns_lookup_m365(domain)
-                except dns.exception.Timeout:
-                    err_timeout += 1
-                    continue
-                except Exception:
-                    # Kommentar: DNS-fel ska inte döda allt; vi fortsätter med webben
-                    m365_mail = False
-
-                # 2) Hämta startsidan
-                html, err = fetch_html(base_url)
-                time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                # Kommentar: timeout => skriv INTE rad
-                if err == "timeout":
-                    err_timeout += 1
-                    continue
-
-                # 403/429/other/not_html på startsidan => unknown + skriv rad
-                if err in ("403", "429"):
-                    row["err_reason"] = err
-                    if err == "403":
-                        err_403 += 1
-                    else:
-                        err_429 += 1
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    continue
-
-                if err:
-                    if err == "not_html":
-                        skipped_not_html += 1
-                        row["err_reason"] = "not_html"
-                    else:
-                        err_other += 1
-                        row["err_reason"] = "other"
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    continue
-
-                # Kommentar: samla text från crawlade sidor (max budget)
-                all_texts: list[str] = []
-                t0 = strip_text(html or "")
-                all_texts.append(t0)
-
-                visited = set([base_url])
-                queue: list[str] = []
-
-                # Kommentar: prova vanliga paths direkt
-                for p in TECH_PATH_HINTS:
-                    u = urljoin(base_url.rstrip("/") + "/", p.lstrip("/"))
-                    if u not in visited:
-                        queue.append(u)
-
-                # Kommentar: och länkar från startsidan (endast interna)
-                queue.extend(extract_internal_links(base_url, html or ""))
-
-                pages_used = 1
-                while queue and pages_used < MAX_PAGES:
-                    u = queue.pop(0)
-                    if u in visited:
-                        continue
-                    visited.add(u)
-
-                    h2, e2 = fetch_html(u)
-                    time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                    if e2 == "timeout":
-                        timeout_flag = True
-                        break
-
-                    if e2 in ("403", "429"):
-                        pages_used += 1
-                        continue
-
-                    if e2 or not h2:
-                        pages_used += 1
-                        continue
-
-                    pages_used += 1
-                    all_texts.append(strip_text(h2))
-
-                # Kommentar: timeout under crawl => skriv INTE rad
-                if timeout_flag:
-                    err_timeout += 1
-                    continue
-
-                combined_text = " ".join(all_texts)
-
-                # 3) IT-support
-                it_signal, it_conf = detect_it_support(combined_text)
-                row["it_support_signal"] = it_signal
-                row["it_support_confidence"] = it_conf
-
-                # 4) Microsoft från webben
-                ms_status_web, ms_strength_web, ms_conf_web = detect_microsoft_from_web(combined_text)
-
-                # 5) Slutbeslut för Microsoft (web strong vinner, annars DNS mail => weak/high)
-                if ms_status_web == "yes" and ms_strength_web == "strong":
-                    row["microsoft_status"] = "yes"
-                    row["microsoft_strength"] = "strong"
-                    row["microsoft_confidence"] = ms_conf_web
-                elif m365_mail:
-                    row["microsoft_status"] = "yes"
-                    row["microsoft_strength"] = "weak"
-                    row["microsoft_confidence"] = "high"
-                elif ms_status_web == "yes":
-                    row["microsoft_status"] = "yes"
-                    row["microsoft_strength"] = ms_strength_web or "weak"
-                    row["microsoft_confidence"] = ms_conf_web
-                else:
-                    row["microsoft_status"] = "no"
-                    row["microsoft_strength"] = None
-                    row["microsoft_confidence"] = "low"
-
-                # 6) skriv rad
-                out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                ok += 1
-
-                if processed % PRINT_EVERY == 0:
-                    rate = processed / max(1e-9, time.time() - start)
-                    print(
-                        f"[{processed}] ok={ok} not_html={skipped_not_html} "
-                        f"403={err_403} 429={err_429} timeout={err_timeout} other={err_other} | {rate:.1f}/s"
-                    )
+        with open_writer(OUT_PATH, sink, columnar=args.columnar) as out_f:
+            asyncio.run(crawl(targets, queue_writer(qw, out_f), stats, qw))
 
     except KeyboardInterrupt:
         print("\nAvbruten (Ctrl+C) — filen är sparad ✅")
@@ -588,9 +552,9 @@ def main():
         conn.close()
 
     print("KLART ✅")
-    print(f"Processade: {processed} | OK: {ok} | not_html: {skipped_not_html}")
-    print(f"Errors: 403={err_403} 429={err_429} timeout={err_timeout} other={err_other}")
-    print(f"OUT: {OUT_PATH.resolve()}")
+    print(f"Processade: {stats['processed']} | OK: {stats['ok']} | not_html: {stats['skipped_not_html']}")
+    print(f"Errors: 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']}")
+    print(f"OUT: {(sink.path if sink else OUT_PATH).resolve()}")
 
 if __name__ == "__main__":
     main()
@@ -2,24 +2,40 @@
 
 
 import re
+import sys
 import time
-import json
+import asyncio
 import sqlite3
-import hashlib
 import argparse
-from datetime import datetime, timedelta, timezone
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
-from urllib.parse import urlsplit
 
-import requests
-from requests.exceptions import ConnectionError, InvalidURL
-from urllib3.exceptions import LocationParseError
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.fetch import Fetcher, fetch_html, normalize_url, run_bounded
+from companies.shards.shared.keyword_matcher import KeywordMatcher
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+from companies.shards.shared.refresh_sql import RULES, select_due
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, default_owner, keepalive, queue_writer, track
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--shard-id", type=int, required=True)
 ap.add_argument("--shard-total", type=int, default=4)
-args = ap.parse_args()
+ap.add_argument("--queue", action="store_true", help="dra targets ur delad arbetskö i stället för md5-shard")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
+# Kommentar: strikt när skriptet körs självt (felstavad flagga = fel, inte default); importerad av
+# enrich_all_shards.py tål vi pipelinens egna flaggor (--only osv.), pipelinen validerar sina själv
+if __name__ == "__main__":
+    args = ap.parse_args()
+else:
+    args, _unknown = ap.parse_known_args()
 
 SHARD_ID = args.shard_id
 SHARD_TOTAL = args.shard_total
@@ -29,6 +45,7 @@ SHARD_TOTAL = args.shard_total
 # =========================
 DB_PATH = Path("data/db/companies.db.sqlite")
 OUT_PATH = Path(f"data/out/shards/site_review_shard{SHARD_ID}.ndjson")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0              # 0 = ALLA
 RESUME = True
 PRINT_EVERY = 50
@@ -36,13 +53,22 @@ REFRESH_DAYS = 30      # Kommentar: rerun efter 30 dagar
 # =========================
 
 TIMEOUT_SECONDS = 12
-SLEEP_BETWEEN_REQUESTS = 0.15
+PER_DOMAIN_RATE = 6.0  # Kommentar: max requests/s per registrerad domän (token bucket)
+PER_DOMAIN_BURST = 2
+# Kommentar: delad sidcache mellan shards (samma sida hämtas en gång för hela enrichment-sviten)
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+# Kommentar: --queue => lease-baserad kö (valfritt antal workers), annars fast md5-shard
+QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+QUEUE_KIND = "site_review"
 MAX_BYTES = 500_000    # Kommentar: vi läser max ~500KB HTML
 
-session = requests.Session()
-session.headers.update({
-    "User-Agent": f"Mozilla/5.0 (Didup-WebReview/1.0; shard={SHARD_ID})"
-})
+# Kommentar: async-motorn – antal bolag samtidigt + anslutningstak
+CONCURRENCY = 100
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
+
+USER_AGENT = f"Mozilla/5.0 (Didup-WebReview/1.0; shard={SHARD_ID})"
 
 CTA_WORDS = [
     "kontakta", "kontakt", "boka", "offert", "kostnadsfri", "prisförslag", "priser",
@@ -53,6 +79,24 @@ SERVICE_HINTS = [
     "tjänst", "tjänster", "service", "services"
 ]
 
+# Kommentar: tech-fingerprints i prioritetsordning (första tabellen med träff vinner)
+TECH_FINGERPRINTS = {
+    "wordpress": ["wp-content", "wp-includes"],
+    "shopify": ["cdn.shopify.com", "x-shopify"],
+    "wix": ["wix.com", "wixsite"],
+    "nextjs": ["__next", "nextjs"],
+}
+ADDRESS_WORDS = ["besöksadress", "adress", "postadress"]
+
+# Kommentar: sidans keyword-tabeller i en automat – html_lower scannas en gång per sida
+PAGE_MATCHER = KeywordMatcher({
+    "cta": CTA_WORDS,
+    "contact": ["kontakt"],
+    "address": ADDRESS_WORDS,
+    "og_image": ["og:image"],
+    **TECH_FINGERPRINTS,
+})
+
 EMAIL_RE = re.compile(r"[a-z0-9._%+\-]+@[a-z0-9.\-]+\.[a-z]{2,}", re.I)
 TEL_RE = re.compile(r"(?:\+46|0)\s?\d[\d\s\-]{6,}", re.I)
 ORGNR_RE = re.compile(r"\b\d{6}\-\d{4}\b")
@@ -60,138 +104,13 @@ ORGNR_RE = re.compile(r"\b\d{6}\-\d{4}\b")
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
-def parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return None
-
-def needs_refresh(checked_at: Optional[str]) -> bool:
-    dt = parse_iso(checked_at)
-    if not dt:
-        return True
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-def in_shard(orgnr: str) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % SHARD_TOTAL) == SHARD_ID
-
-def _valid_hostname(host: str) -> bool:
-    if not host:
-        return False
-    host = host.strip().lower().rstrip(".")
-    if len(host) > 253:
-        return False
-    if any(c.isspace() for c in host):
-        return False
-    if ".." in host:
-        return False
-    labels = host.split(".")
-    if len(labels) < 2:
-        return False
-    for lab in labels:
-        if not lab or len(lab) > 63:
-            return False
-        if lab.startswith("-") or lab.endswith("-"):
-            return False
-        if not re.fullmatch(r"[a-z0-9-]+", lab):
-            return False
-    return True
-
-def _safe_url(url: str) -> bool:
-    try:
-        u = url.strip()
-        parts = urlsplit(u)
-        if parts.scheme not in ("http", "https"):
-            return False
-        host = parts.hostname or ""
-        return _valid_hostname(host)
-    except Exception:
-        return False
-
-def _is_retryable_status(code: int) -> bool:
-    # Kommentar: vi retryar INTE 403/429, bara timeout (men vi vill kunna särskilja dessa koder)
-    return code in (403, 429, 500, 502, 503, 504)
-
-def _is_dns_miss_error(e: Exception) -> bool:
-    msg = str(e).lower()
-    return (
-        "name or service not known" in msg
-        or "failed to resolve" in msg
-        or "nodename nor servname" in msg
-        or "temporary failure in name resolution" in msg
-        or "getaddrinfo failed" in msg
-    )
-
-def fetch_html(url: str) -> tuple[Optional[str], str]:
-    """
-    Returns (html_text_or_none, err_reason)
-    err_reason: "" | "403" | "429" | "timeout" | "other" | "not_html"
-    """
-    if not _safe_url(url):
-        return (None, "other")
-
-    try:
-        r = session.get(
-            url,
-            timeout=(3, TIMEOUT_SECONDS),
-            allow_redirects=True,
-            stream=True,
-        )
-
-        if _is_retryable_status(r.status_code):
-            r.close()
-            return (None, str(r.status_code))
-
-        if not (200 <= r.status_code < 400):
-            r.close()
-            return (None, "other")
-
-        ct = (r.headers.get("Content-Type") or "").lower()
-        if "text/html" not in ct and "application/xhtml" not in ct and not ct.startswith("text/"):
-            r.close()
-            return (None, "not_html")
-
-        # Kommentar: läs max MAX_BYTES
-        chunks = []
-        read = 0
-        for chunk in r.iter_content(chunk_size=32_768):
-            if not chunk:
-                break
-            chunks.append(chunk)
-            read += len(chunk)
-            if read >= MAX_BYTES:
-                break
-        r.close()
-
-        raw = b"".join(chunks)
-        html = raw.decode("utf-8", errors="ignore")
-        return (html, "")
-
-    except requests.Timeout:
-        return (None, "timeout")
-    except (LocationParseError, InvalidURL):
-        return (None, "other")
-    except (ConnectionError, requests.RequestException) as e:
-        if _is_dns_miss_error(e):
-            return (None, "other")
-        return (None, "other")
-    except Exception:
-        return (None, "other")
-
-def fingerprint_tech(html_lower: str) -> str:
+def fingerprint_tech(html_lower: str, found: Optional[set[str]] = None) -> str:
     # Kommentar: enkel, billig fingerprint
-    if "wp-content" in html_lower or "wp-includes" in html_lower:
-        return "wordpress"
-    if "cdn.shopify.com" in html_lower or "x-shopify" in html_lower:
-        return "shopify"
-    if "wix.com" in html_lower or "wixsite" in html_lower:
-        return "wix"
-    if "__next" in html_lower or "nextjs" in html_lower:
-        return "nextjs"
+    if found is None:
+        found = PAGE_MATCHER.found(html_lower)
+    for tech, marks in TECH_FINGERPRINTS.items():
+        if any(m in found for m in marks):
+            return tech
     return ""
 
 def extract_internal_links(html_lower: str) -> list[str]:
@@ -212,6 +131,7 @@ def extract_internal_links(html_lower: str) -> list[str]:
 def compute_score(url: str, html: str) -> tuple[int, list[str]]:
     flags: list[str] = []
     html_lower = html.lower()
+    found = PAGE_MATCHER.found(html_lower)
 
     points = 0
 
@@ -225,13 +145,13 @@ def compute_score(url: str, html: str) -> tuple[int, list[str]]:
     has_email = EMAIL_RE.search(html_lower) is not None
     has_tel = TEL_RE.search(html_lower) is not None
     has_form = "<form" in html_lower
-    if has_email or has_tel or has_form or ("kontakt" in html_lower):
+    if has_email or has_tel or has_form or ("kontakt" in found):
         points += 2
     else:
         flags.append("no_contact")
 
     # 3) CTA-ord
-    cta_hits = sum(1 for w in CTA_WORDS if w in html_lower)
+    cta_hits = sum(1 for w in CTA_WORDS if w in found)
     if cta_hits >= 2:
         points += 1
     else:
@@ -250,7 +170,7 @@ def compute_score(url: str, html: str) -> tuple[int, list[str]]:
 
     # 5) Orgnr/adress (seriöshet)
     has_orgnr = ORGNR_RE.search(html_lower) is not None
-    has_addressish = ("besöksadress" in html_lower) or ("adress" in html_lower) or ("postadress" in html_lower)
+    has_addressish = any(w in found for w in ADDRESS_WORDS)
     if has_orgnr or has_addressish:
         points += 1
     else:
@@ -258,7 +178,7 @@ def compute_score(url: str, html: str) -> tuple[int, list[str]]:
 
     # 6) Bilder (proxy, vi laddar inte ner)
     img_count = html_lower.count("<img")
-    has_og_image = 'property="og:image"' in html_lower or "og:image" in html_lower
+    has_og_image = "og:image" in found  # Kommentar: 'property="og:image"' innehåller "og:image"
     if img_count >= 3 or has_og_image:
         points += 1
     else:
@@ -276,7 +196,7 @@ def compute_score(url: str, html: str) -> tuple[int, list[str]]:
         flags.append("thin_content")
 
     # 8) Tech fingerprint (info + liten poäng för “modern CMS”)
-    tech = fingerprint_tech(html_lower)
+    tech = fingerprint_tech(html_lower, found)
     if tech:
         points += 1
     else:
@@ -287,66 +207,31 @@ def compute_score(url: str, html: str) -> tuple[int, list[str]]:
     return score, flags
 
 def load_done_set(path: Path) -> set[str]:
-    done = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
-
-def pick_targets(conn: sqlite3.Connection, limit: Optional[int]) -> list[tuple[str, str, str, Optional[str]]]:
-    cur = conn.cursor()
-
-    # Kommentar: vi tar bara bolag med website, och bara de som behöver refresh
-    if limit is None:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, site_review_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            """
-        )
-        rows = cur.fetchall()
-    else:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, site_review_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            LIMIT ?
-            """,
-            (limit * 5,),
-        )
-        rows = cur.fetchall()
+    # Kommentar: sidecar-index (<out>.done) – bara svansen efter senaste checkpoint JSON-parsas
+    return DoneIndex(path).load() | load_columnar_done(path)
+
+def pick_targets(
+    conn: sqlite3.Connection,
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> list[tuple[str, str, str, Optional[str]]]:
+    # Kommentar: refresh-regeln + shard körs i SQL (due-index: migrations/add_refresh_due_indexes.py)
+    cur = select_due(
+        conn,
+        RULES[QUEUE_KIND],
+        "orgnr, name, website, site_review_checked_at",
+        refresh_days=REFRESH_DAYS,
+        limit=limit,
+        shard=shard,
+    )
 
     out = []
-    for orgnr, name, website, checked_at in rows:
+    for orgnr, name, website, checked_at in cur:
         if not orgnr or not website:
             continue
-        if needs_refresh(checked_at):
-            out.append((orgnr, name or "", website, checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((orgnr, name or "", website, checked_at))
     return out
 
-def normalize_url(u: str) -> str:
-    u = (u or "").strip()
-    if not u:
-        return ""
-    if not u.startswith("http://") and not u.startswith("https://"):
-        u = "https://" + u
-    return u
-
 def _format_score_counts(score_counts: dict[int, int]) -> str:
     # Kommentar: alltid 1..10 i output
     parts = []
@@ -354,97 +239,133 @@ def _format_score_counts(score_counts: dict[int, int]) -> str:
         parts.append(f"{s}={score_counts.get(s, 0)}")
     return " ".join(parts)
 
+async def process_target(
+    fetcher: Fetcher,
+    stats: Counter,
+    score_counts: dict[int, int],
+    target: tuple[str, str, str, Optional[str]],
+) -> Optional[dict]:
+    """
+    Site review för ett bolag. Returnerar NDJSON-rad, eller None vid timeout (körs om senare).
+    """
+    orgnr, name, website, _prev_checked_at = target
+    url = normalize_url(website)
+
+    html, err = await fetch_html(fetcher, url, max_bytes=MAX_BYTES)
+
+    # Kommentar: timeout = temporärt => skriv INTE rad (så den kan köras om)
+    if err == "timeout":
+        stats["err_timeout"] += 1
+        return None
+
+    row = {
+        "orgnr": orgnr,
+        "name": name,
+        "website": url,
+        "checked_at": utcnow_iso(),
+        "err_reason": "",
+        "site_score": None,
+        "site_flags": [],
+    }
+
+    if err in ("403", "429"):
+        if err == "403":
+            stats["err_403"] += 1
+        else:
+            stats["err_429"] += 1
+        row["err_reason"] = err
+
+    elif err:
+        if err == "not_html":
+            stats["skipped_not_html"] += 1
+            row["err_reason"] = "not_html"
+        else:
+            stats["err_other"] += 1
+            row["err_reason"] = "other"
+
+    else:
+        score, flags = compute_score(url, html or "")
+        row["site_score"] = score
+        row["site_flags"] = flags
+        stats["ok"] += 1
+        score_counts[score] = score_counts.get(score, 0) + 1
+
+    return row
+
+def _print_progress(stats: Counter, score_counts: dict[int, int], start: float) -> None:
+    processed = stats["processed"]
+    rate = processed / max(1e-9, time.time() - start)
+    print(
+        f"[{processed}] ok={stats['ok']} not_html={stats['skipped_not_html']} "
+        f"403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']} | {rate:.1f}/s\n"
+        f"Scores: {_format_score_counts(score_counts)}"
+    )
+
+async def crawl(
+    targets: list[tuple[str, str, str, Optional[str]]],
+    out_f,
+    stats: Counter,
+    score_counts: dict[int, int],
+    qw: Optional[QueueWorker] = None,
+) -> None:
+    start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        read_timeout=TIMEOUT_SECONDS,
+        scheduler=PolitenessScheduler(rate_per_sec=PER_DOMAIN_RATE, burst=PER_DOMAIN_BURST),
+        cache=cache,
+    ) as fetcher, keepalive(qw):
+        async for row in run_bounded(
+            targets, track(qw, lambda t: process_target(fetcher, stats, score_counts, t)), CONCURRENCY
+        ):
+            stats["processed"] += 1
+            if row is not None:
+                out_f.write_row(row)
+
+            if stats["processed"] % PRINT_EVERY == 0:
+                _print_progress(stats, score_counts, start)
+
 def main():
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DB saknas: {DB_PATH}")
 
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    done = load_done_set(OUT_PATH) if RESUME else set()
+    # Kommentar: --sink-db => rader som ännu inte mergats räknas också som klara
+    sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID) if args.sink_db else None
+    done = (load_done_set(OUT_PATH) | (sink.load() if sink else set())) if RESUME else set()
     limit = None if LIMIT == 0 else LIMIT
 
     conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
     conn.execute("PRAGMA journal_mode=WAL;")
 
-    targets = pick_targets(conn, limit)
-    targets = [(o, n, w, c) for (o, n, w, c) in targets if in_shard(o)]
-
-    if RESUME and done:
-        targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
+    targets = pick_targets(conn, limit, shard=None if args.queue else (SHARD_ID, SHARD_TOTAL))
+    qw: Optional[QueueWorker] = None
+    if args.queue:
+        # Kommentar: kö-läge – ingen fast md5-shard, alla workers drar batchar ur samma kö
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
+        qw = QueueWorker(WorkQueue(QUEUE_PATH), QUEUE_KIND, default_owner(QUEUE_KIND, SHARD_ID))
+        added = qw.queue.enqueue(QUEUE_KIND, targets)
+        print(f"Kö: {QUEUE_KIND} nya={added} {qw.queue.counts(QUEUE_KIND)} (worker={qw.owner}, CONCURRENCY={CONCURRENCY})")
+        targets = qw.targets()
+    else:
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
 
-    print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS})")
+        print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS}, CONCURRENCY={CONCURRENCY})")
 
-    processed = ok = skipped_not_html = 0
-    err_403 = err_429 = err_timeout = err_other = 0
+    stats: Counter = Counter()
 
     # Kommentar: score-fördelning (bara för OK-rader)
     score_counts: dict[int, int] = {s: 0 for s in range(1, 11)}
 
-    start = time.time()
-
     try:
-        with OUT_PATH.open("a", encoding="utf-8") as out_f:
-            for orgnr, name, website, prev_checked_at in targets:
-                processed += 1
-
-                url = normalize_url(website)
-
-                html, err = fetch_html(url)
-                time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                # Kommentar: timeout = temporärt => skriv INTE rad (så den kan köras om)
-                if err == "timeout":
-                    err_timeout += 1
-                    if processed % PRINT_EVERY == 0:
-                        rate = processed / max(1e-9, time.time() - start)
-                        print(
-                            f"[{processed}] ok={ok} 403={err_403} 429={err_429} timeout={err_timeout} other={err_other} | {rate:.1f}/s\n"
-                            f"Scores: {_format_score_counts(score_counts)}"
-                        )
-                    continue
-
-                row = {
-                    "orgnr": orgnr,
-                    "name": name,
-                    "website": url,
-                    "checked_at": utcnow_iso(),
-                    "err_reason": "",
-                    "site_score": None,
-                    "site_flags": [],
-                }
-
-                if err in ("403", "429"):
-                    if err == "403":
-                        err_403 += 1
-                    else:
-                        err_429 += 1
-                    row["err_reason"] = err
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-                elif err:
-                    if err == "not_html":
-                        skipped_not_html += 1
-                        row["err_reason"] = "not_html"
-                    else:
-                        err_other += 1
-                        row["err_reason"] = "other"
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-                else:
-                    score, flags = compute_score(url, html or "")
-                    row["site_score"] = score
-                    row["site_flags"] = flags
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    ok += 1
-                    score_counts[score] = score_counts.get(score, 0) + 1
-
-                if processed % PRINT_EVERY == 0:
-                    rate = processed / max(1e-9, time.time() - start)
-                    print(
-                        f"[{processed}] ok={ok} not_html={skipped_not_html} "
-                        f"403={err_403} 429={err_429} timeout={err_timeout} other={err_other} | {rate:.1f}/s\n"
-                        f"Scores: {_format_score_counts(score_counts)}"
-                    )
+        with open_writer(OUT_PATH, sink, columnar=args.columnar) as out_f:
+            asyncio.run(crawl(targets, queue_writer(qw, out_f), stats, score_counts, qw))
 
     except KeyboardInterrupt:
         print("\nAvbruten (Ctrl+C) — filen är sparad ✅")
@@ -452,10 +373,10 @@ def main():
         conn.close()
 
     print("KLART ✅")
-    print(f"Processade: {processed} | OK: {ok} | not_html: {skipped_not_html}")
-    print(f"Errors: 403={err_403} 429={err_429} timeout={err_timeout} other={err_other}")
+    print(f"Processade: {stats['processed']} | OK: {stats['ok']} | not_html: {stats['skipped_not_html']}")
+    print(f"Errors: 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']}")
     print(f"Scores: {_format_score_counts(score_counts)}")
-    print(f"OUT: {OUT_PATH.resolve()}")
+    print(f"OUT: {(sink.path if sink else OUT_PATH).resolve()}")
 
 if __name__ == "__main__":
     main()
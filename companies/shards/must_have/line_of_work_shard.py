@@ -2,24 +2,41 @@
 # Kommentar: shard-script som klassar bolag baserat på website + SNI och skriver NDJSON (ingen DB-write)
 
 import re
+import sys
 import time
-import json
+import asyncio
 import sqlite3
-import hashlib
 import argparse
-from datetime import datetime, timedelta, timezone
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 from urllib.parse import urlsplit, urljoin
 
-import requests
-from requests.exceptions import ConnectionError, InvalidURL
-from urllib3.exceptions import LocationParseError
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.fetch import Fetcher, fetch_html, normalize_url, run_bounded, safe_url
+from companies.shards.shared.keyword_matcher import KeywordMatcher
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+from companies.shards.shared.refresh_sql import RULES, select_due
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, default_owner, keepalive, queue_writer, track
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--shard-id", type=int, required=True)
 ap.add_argument("--shard-total", type=int, default=4)
-args = ap.parse_args()
+ap.add_argument("--queue", action="store_true", help="dra targets ur delad arbetskö i stället för md5-shard")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
+# Kommentar: strikt när skriptet körs självt (felstavad flagga = fel, inte default); importerad av
+# enrich_all_shards.py tål vi pipelinens egna flaggor (--only osv.), pipelinen validerar sina själv
+if __name__ == "__main__":
+    args = ap.parse_args()
+else:
+    args, _unknown = ap.parse_known_args()
 
 SHARD_ID = args.shard_id
 SHARD_TOTAL = args.shard_total
@@ -29,6 +46,7 @@ SHARD_TOTAL = args.shard_total
 # =========================
 DB_PATH = Path("data/db/companies.db.sqlite")
 OUT_PATH = Path(f"data/out/shards/line_of_work_shard{SHARD_ID}.ndjson")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0              # 0 = ALLA
 RESUME = True
 PRINT_EVERY = 50
@@ -36,148 +54,30 @@ REFRESH_DAYS = 120     # Kommentar: rerun klassning efter X dagar
 # =========================
 
 TIMEOUT_SECONDS = 12
-SLEEP_BETWEEN_REQUESTS = 0.20
+PER_DOMAIN_RATE = 5.0  # Kommentar: max requests/s per registrerad domän (token bucket)
+PER_DOMAIN_BURST = 2
+# Kommentar: delad sidcache mellan shards (samma sida hämtas en gång för hela enrichment-sviten)
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+# Kommentar: --queue => lease-baserad kö (valfritt antal workers), annars fast md5-shard
+QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+QUEUE_KIND = "line_of_work"
 MAX_BYTES = 400_000
 
 MAX_PAGES = 3  # Kommentar: 2 i praktiken, 3 om vi behöver
 
-session = requests.Session()
-session.headers.update({
-    "User-Agent": f"Mozilla/5.0 (Didup-LineOfWork/1.0; shard={SHARD_ID})"
-})
+# Kommentar: async-motorn – antal bolag samtidigt + anslutningstak
+CONCURRENCY = 100
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
+
+USER_AGENT = f"Mozilla/5.0 (Didup-LineOfWork/1.0; shard={SHARD_ID})"
 
 HREF_RE = re.compile(r'href=["\']([^"\']+)["\']', re.I)
 
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
-def parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return None
-
-def needs_refresh(checked_at: Optional[str]) -> bool:
-    dt = parse_iso(checked_at)
-    if not dt:
-        return True
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-def in_shard(orgnr: str) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % SHARD_TOTAL) == SHARD_ID
-
-def _valid_hostname(host: str) -> bool:
-    if not host:
-        return False
-    host = host.strip().lower().rstrip(".")
-    if len(host) > 253:
-        return False
-    if any(c.isspace() for c in host):
-        return False
-    if ".." in host:
-        return False
-    labels = host.split(".")
-    if len(labels) < 2:
-        return False
-    for lab in labels:
-        if not lab or len(lab) > 63:
-            return False
-        if lab.startswith("-") or lab.endswith("-"):
-            return False
-        if not re.fullmatch(r"[a-z0-9-]+", lab):
-            return False
-    return True
-
-def _safe_url(url: str) -> bool:
-    try:
-        u = url.strip()
-        parts = urlsplit(u)
-        if parts.scheme not in ("http", "https"):
-            return False
-        return _valid_hostname(parts.hostname or "")
-    except Exception:
-        return False
-
-def _is_retryable_status(code: int) -> bool:
-    return code in (403, 429, 500, 502, 503, 504)
-
-def _is_dns_miss_error(e: Exception) -> bool:
-    msg = str(e).lower()
-    return (
-        "name or service not known" in msg
-        or "failed to resolve" in msg
-        or "nodename nor servname" in msg
-        or "temporary failure in name resolution" in msg
-        or "getaddrinfo failed" in msg
-    )
-
-def normalize_url(u: str) -> str:
-    u = (u or "").strip()
-    if not u:
-        return ""
-    if not u.startswith("http://") and not u.startswith("https://"):
-        u = "https://" + u
-    return u
-
-def fetch_html(url: str) -> tuple[Optional[str], str]:
-    """
-    Returns (html_text_or_none, err_reason)
-    err_reason: "" | "403" | "429" | "timeout" | "other" | "not_html"
-    """
-    if not _safe_url(url):
-        return (None, "other")
-
-    try:
-        r = session.get(
-            url,
-            timeout=(3, TIMEOUT_SECONDS),
-            allow_redirects=True,
-            stream=True,
-        )
-
-        if _is_retryable_status(r.status_code):
-            r.close()
-            return (None, str(r.status_code))
-
-        if not (200 <= r.status_code < 400):
-            r.close()
-            return (None, "other")
-
-        ct = (r.headers.get("Content-Type") or "").lower()
-        if "text/html" not in ct and "application/xhtml" not in ct and not ct.startswith("text/"):
-            r.close()
-            return (None, "not_html")
-
-        chunks = []
-        read = 0
-        for chunk in r.iter_content(chunk_size=32_768):
-            if not chunk:
-                break
-            chunks.append(chunk)
-            read += len(chunk)
-            if read >= MAX_BYTES:
-                break
-        r.close()
-
-        raw = b"".join(chunks)
-        html = raw.decode("utf-8", errors="ignore")
-        return (html, "")
-
-    except requests.Timeout:
-        return (None, "timeout")
-    except (LocationParseError, InvalidURL):
-        return (None, "other")
-    except (ConnectionError, requests.RequestException) as e:
-        if _is_dns_miss_error(e):
-            return (None, "other")
-        return (None, "other")
-    except Exception:
-        return (None, "other")
-
 def strip_html_to_text(html: str) -> str:
     # Kommentar: billig text-extraktion (bra nog för keyword-match)
     s = html.lower()
@@ -218,7 +118,7 @@ def extract_internal_candidate_links(base_url: str, html: str) -> list[str]:
         # Kommentar: bara samma host
         if up.netloc != parts.netloc:
             continue
-        if not _safe_url(u):
+        if not safe_url(u):
             continue
 
         path = (up.path or "").lower()
@@ -272,6 +172,9 @@ CATEGORIES: dict[str, dict] = {
     "industrial_services": {"raw": ["industriservice"], "kw": ["industriservice", "service", "underhåll", "maintenance", "installation", "montage"]},
 }
 
+# Kommentar: alla kategori-keywords i en automat (byggs en gång) => texten scannas en gång oavsett antal kategorier
+CATEGORY_MATCHER = KeywordMatcher({cat: meta["kw"] for cat, meta in CATEGORIES.items()})
+
 # Kommentar: grupper för “samma sektor”-check
 GROUPS: dict[str, str] = {
     "architecture": "construction_sector",
@@ -360,12 +263,13 @@ def classify_from_text(text: str) -> tuple[str, str, float]:
     if not text or len(text) < 200:
         return ("", "", 0.0)
 
+    found = CATEGORY_MATCHER.found(text)
     scores: dict[str, float] = {}
     for cat, meta in CATEGORIES.items():
         kw = meta["kw"]
         hit = 0
         for k in kw:
-            if k in text:
+            if k in found:
                 hit += 1
         if hit:
             # Kommentar: viktning (många olika träffar => högre score)
@@ -396,56 +300,29 @@ def combine_pages_text(texts: list[str]) -> str:
     return joined[:200_000]
 
 def load_done_set(path: Path) -> set[str]:
-    done = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
-
-def pick_targets(conn: sqlite3.Connection, limit: Optional[int]) -> list[tuple[str, str, str, Optional[str], Optional[str]]]:
-    cur = conn.cursor()
-
-    # Kommentar: vi tar bara bolag med website, och som behöver refresh på line_of_work_updated_at
-    if limit is None:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, sni_text, line_of_work_updated_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            """
-        )
-        rows = cur.fetchall()
-    else:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, sni_text, line_of_work_updated_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) != ''
-            LIMIT ?
-            """,
-            (limit * 5,),
-        )
-        rows = cur.fetchall()
+    # Kommentar: sidecar-index (<out>.done) – bara svansen efter senaste checkpoint JSON-parsas
+    return DoneIndex(path).load() | load_columnar_done(path)
+
+def pick_targets(
+    conn: sqlite3.Connection,
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> list[tuple[str, str, str, Optional[str], Optional[str]]]:
+    # Kommentar: refresh-regeln + shard körs i SQL (due-index: migrations/add_refresh_due_indexes.py)
+    cur = select_due(
+        conn,
+        RULES[QUEUE_KIND],
+        "orgnr, name, website, sni_text, line_of_work_updated_at",
+        refresh_days=REFRESH_DAYS,
+        limit=limit,
+        shard=shard,
+    )
 
     out = []
-    for orgnr, name, website, sni_text, low_checked_at in rows:
+    for orgnr, name, website, sni_text, low_checked_at in cur:
         if not orgnr or not website:
             continue
-        if needs_refresh(low_checked_at):
-            out.append((orgnr, name or "", website, sni_text or "", low_checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((orgnr, name or "", website, sni_text or "", low_checked_at))
     return out
 
 def bucket(conf: float) -> str:
@@ -488,159 +365,195 @@ def decide_final(w_label: str, w_conf: float, sni_text_val: str) -> tuple[str, f
         return ("unknown", 0.25, "sni")
     return (w_label, w_conf, "website")
 
+async def process_target(
+    fetcher: Fetcher,
+    stats: Counter,
+    bucket_counts: dict[str, int],
+    target: tuple[str, str, str, Optional[str], Optional[str]],
+) -> Optional[dict]:
+    """
+    Klassar ett bolag. Returnerar NDJSON-rad, eller None vid timeout på startsidan (körs om senare).
+    """
+    orgnr, name, website, sni_text_val, _prev_checked_at = target
+
+    base_url = normalize_url(website)
+    urls_used: list[str] = []
+    page_texts: list[str] = []
+
+    # 1) start
+    html, err = await fetch_html(fetcher, base_url, max_bytes=MAX_BYTES)
+
+    # Kommentar: timeout = temporärt => skriv INTE rad (så den kan köras om)
+    if err == "timeout":
+        stats["err_timeout"] += 1
+        return None
+
+    row = {
+        "orgnr": orgnr,
+        "name": name,
+        "website": base_url,
+        "checked_at": utcnow_iso(),
+        "err_reason": "",
+        "sni_text": sni_text_val or "",
+        "w_label": "",
+        "w_raw": "",
+        "w_conf": 0.0,
+        "w_bucket": "LOW",
+        "final_label": "unknown",
+        "final_conf": 0.0,
+        "final_bucket": "LOW",
+        "source": "sni",
+        "urls_used": [],
+    }
+
+    if err in ("403", "429"):
+        if err == "403":
+            stats["err_403"] += 1
+        else:
+            stats["err_429"] += 1
+        row["err_reason"] = err
+        # Kommentar: vid block => fall tillbaka på unknown/sni
+        return row
+
+    if err:
+        if err == "not_html":
+            stats["err_not_html"] += 1
+            row["err_reason"] = "not_html"
+        else:
+            stats["err_other"] += 1
+            row["err_reason"] = "other"
+        return row
+
+    urls_used.append(base_url)
+    page_texts.append(strip_html_to_text(html or ""))
+
+    # 2) intern “bra” sida
+    cand_links = extract_internal_candidate_links(base_url, html or "")
+    pages_fetched = 1
+
+    for u in cand_links:
+        if pages_fetched >= MAX_PAGES:
+            break
+        h2, e2 = await fetch_html(fetcher, u, max_bytes=MAX_BYTES)
+
+        if e2 == "timeout":
+            stats["err_timeout"] += 1
+            continue
+        if e2 in ("403", "429"):
+            if e2 == "403":
+                stats["err_403"] += 1
+            else:
+                stats["err_429"] += 1
+            continue
+        if e2:
+            continue
+
+        urls_used.append(u)
+        page_texts.append(strip_html_to_text(h2 or ""))
+        pages_fetched += 1
+
+        # Kommentar: försök stoppa tidigt om vi redan fått tydlig text
+        if sum(len(t) for t in page_texts) > 20_000:
+            break
+
+    text = combine_pages_text(page_texts)
+    w_label, w_raw, w_conf = classify_from_text(text)
+
+    # Kommentar: bestäm final enligt överenskommen regel
+    final_label, final_conf, source = decide_final(w_label, w_conf, sni_text_val or "")
+
+    # Kommentar: konflikt-indikator (enkelt)
+    if w_label and (source == "sni") and bucket(w_conf) in ("MID", "HIGH"):
+        stats["conflict"] += 1
+
+    w_bucket = bucket(w_conf)
+    bucket_counts[w_bucket] += 1
+
+    row.update({
+        "w_label": w_label or "",
+        "w_raw": w_raw or "",
+        "w_conf": float(round(w_conf, 4)),
+        "w_bucket": w_bucket,
+        "final_label": final_label or "unknown",
+        "final_conf": float(round(final_conf, 4)),
+        "final_bucket": bucket(final_conf),
+        "source": source,
+        "urls_used": urls_used,
+    })
+
+    stats["ok"] += 1
+    return row
+
+def _print_progress(stats: Counter, bucket_counts: dict[str, int], start: float) -> None:
+    processed = stats["processed"]
+    rate = processed / max(1e-9, time.time() - start)
+    print(f"[{processed}] ok={stats['ok']} 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} "
+          f"other={stats['err_other']} not_html={stats['err_not_html']} | {rate:.2f}/s "
+          f"| buckets: {bucket_counts} conflict={stats['conflict']}")
+
+async def crawl(
+    targets: list[tuple[str, str, str, Optional[str], Optional[str]]],
+    out_f,
+    stats: Counter,
+    bucket_counts: dict[str, int],
+    qw: Optional[QueueWorker] = None,
+) -> None:
+    start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        read_timeout=TIMEOUT_SECONDS,
+        scheduler=PolitenessScheduler(rate_per_sec=PER_DOMAIN_RATE, burst=PER_DOMAIN_BURST),
+        cache=cache,
+    ) as fetcher, keepalive(qw):
+        async for row in run_bounded(
+            targets, track(qw, lambda t: process_target(fetcher, stats, bucket_counts, t)), CONCURRENCY
+        ):
+            stats["processed"] += 1
+            if row is not None:
+                out_f.write_row(row)
+
+            if stats["processed"] % PRINT_EVERY == 0:
+                _print_progress(stats, bucket_counts, start)
+
 def main() -> None:
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DB saknas: {DB_PATH}")
 
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    done = load_done_set(OUT_PATH) if RESUME else set()
+    # Kommentar: --sink-db => rader som ännu inte mergats räknas också som klara
+    sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID) if args.sink_db else None
+    done = (load_done_set(OUT_PATH) | (sink.load() if sink else set())) if RESUME else set()
     limit = None if LIMIT == 0 else LIMIT
 
     conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
     conn.execute("PRAGMA journal_mode=WAL;")
 
-    targets = pick_targets(conn, limit)
-    targets = [(o, n, w, s, c) for (o, n, w, s, c) in targets if in_shard(o)]
-
-    if RESUME and done:
-        targets = [(o, n, w, s, c) for (o, n, w, s, c) in targets if o not in done]
-
-    print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS})")
+    targets = pick_targets(conn, limit, shard=None if args.queue else (SHARD_ID, SHARD_TOTAL))
+    qw: Optional[QueueWorker] = None
+    if args.queue:
+        # Kommentar: kö-läge – ingen fast md5-shard, alla workers drar batchar ur samma kö
+        if RESUME and done:
+            targets = [(o, n, w, s, c) for (o, n, w, s, c) in targets if o not in done]
+        qw = QueueWorker(WorkQueue(QUEUE_PATH), QUEUE_KIND, default_owner(QUEUE_KIND, SHARD_ID))
+        added = qw.queue.enqueue(QUEUE_KIND, targets)
+        print(f"Kö: {QUEUE_KIND} nya={added} {qw.queue.counts(QUEUE_KIND)} (worker={qw.owner}, CONCURRENCY={CONCURRENCY})")
+        targets = qw.targets()
+    else:
+        if RESUME and done:
+            targets = [(o, n, w, s, c) for (o, n, w, s, c) in targets if o not in done]
 
-    processed = ok = 0
-    err_403 = err_429 = err_timeout = err_other = err_not_html = 0
+        print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, REFRESH_DAYS={REFRESH_DAYS}, CONCURRENCY={CONCURRENCY})")
 
+    stats: Counter = Counter()
     bucket_counts = {"HIGH": 0, "MID": 0, "LOW": 0}
-    conflict = 0
-
-    start = time.time()
 
     try:
-        with OUT_PATH.open("a", encoding="utf-8") as out_f:
-            for orgnr, name, website, sni_text_val, prev_checked_at in targets:
-                processed += 1
-
-                base_url = normalize_url(website)
-                urls_used: list[str] = []
-                page_texts: list[str] = []
-
-                # 1) start
-                html, err = fetch_html(base_url)
-                time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                # Kommentar: timeout = temporärt => skriv INTE rad (så den kan köras om)
-                if err == "timeout":
-                    err_timeout += 1
-                    if processed % PRINT_EVERY == 0:
-                        rate = processed / max(1e-9, time.time() - start)
-                        print(f"[{processed}] ok={ok} 403={err_403} 429={err_429} timeout={err_timeout} other={err_other} not_html={err_not_html} | {rate:.2f}/s "
-                              f"| buckets: {bucket_counts} conflict={conflict}")
-                    continue
-
-                row = {
-                    "orgnr": orgnr,
-                    "name": name,
-                    "website": base_url,
-                    "checked_at": utcnow_iso(),
-                    "err_reason": "",
-                    "sni_text": sni_text_val or "",
-                    "w_label": "",
-                    "w_raw": "",
-                    "w_conf": 0.0,
-                    "w_bucket": "LOW",
-                    "final_label": "unknown",
-                    "final_conf": 0.0,
-                    "final_bucket": "LOW",
-                    "source": "sni",
-                    "urls_used": [],
-                }
-
-                if err in ("403", "429"):
-                    if err == "403":
-                        err_403 += 1
-                    else:
-                        err_429 += 1
-                    row["err_reason"] = err
-                    # Kommentar: vid block => fall tillbaka på unknown/sni
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    continue
-
-                if err:
-                    if err == "not_html":
-                        err_not_html += 1
-                        row["err_reason"] = "not_html"
-                    else:
-                        err_other += 1
-                        row["err_reason"] = "other"
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                    continue
-
-                urls_used.append(base_url)
-                page_texts.append(strip_html_to_text(html or ""))
-
-                # 2) intern “bra” sida
-                cand_links = extract_internal_candidate_links(base_url, html or "")
-                pages_fetched = 1
-
-                for u in cand_links:
-                    if pages_fetched >= MAX_PAGES:
-                        break
-                    h2, e2 = fetch_html(u)
-                    time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                    if e2 == "timeout":
-                        err_timeout += 1
-                        continue
-                    if e2 in ("403", "429"):
-                        if e2 == "403":
-                            err_403 += 1
-                        else:
-                            err_429 += 1
-                        continue
-                    if e2:
-                        continue
-
-                    urls_used.append(u)
-                    page_texts.append(strip_html_to_text(h2 or ""))
-                    pages_fetched += 1
-
-                    # Kommentar: försök stoppa tidigt om vi redan fått tydlig text
-                    if sum(len(t) for t in page_texts) > 20_000:
-                        break
-
-                text = combine_pages_text(page_texts)
-                w_label, w_raw, w_conf = classify_from_text(text)
-
-                # Kommentar: bestäm final enligt överenskommen regel
-                final_label, final_conf, source = decide_final(w_label, w_conf, sni_text_val or "")
-
-                # Kommentar: konflikt-indikator (enkelt)
-                if w_label and (source == "sni") and bucket(w_conf) in ("MID", "HIGH"):
-                    conflict += 1
-
-                w_bucket = bucket(w_conf)
-                bucket_counts[w_bucket] += 1
-
-                row.update({
-                    "w_label": w_label or "",
-                    "w_raw": w_raw or "",
-                    "w_conf": float(round(w_conf, 4)),
-                    "w_bucket": w_bucket,
-                    "final_label": final_label or "unknown",
-                    "final_conf": float(round(final_conf, 4)),
-                    "final_bucket": bucket(final_conf),
-                    "source": source,
-                    "urls_used": urls_used,
-                })
-
-                out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-                ok += 1
-
-                if processed % PRINT_EVERY == 0:
-                    rate = processed / max(1e-9, time.time() - start)
-                    print(f"[{processed}] ok={ok} 403={err_403} 429={err_429} timeout={err_timeout} other={err_other} not_html={err_not_html} | {rate:.2f}/s "
-                          f"| buckets: {bucket_counts} conflict={conflict}")
+        with open_writer(OUT_PATH, sink, columnar=args.columnar) as out_f:
+            asyncio.run(crawl(targets, queue_writer(qw, out_f), stats, bucket_counts, qw))
 
     except KeyboardInterrupt:
         print("\nAvbruten (Ctrl+C) — filen är sparad ✅")
@@ -648,10 +561,10 @@ def main() -> None:
         conn.close()
 
     print("KLART ✅")
-    print(f"Processade: {processed} | OK: {ok}")
-    print(f"Errors: 403={err_403} 429={err_429} timeout={err_timeout} other={err_other} not_html={err_not_html}")
-    print(f"Buckets: {bucket_counts} | conflict={conflict}")
-    print(f"OUT: {OUT_PATH.resolve()}")
+    print(f"Processade: {stats['processed']} | OK: {stats['ok']}")
+    print(f"Errors: 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']} not_html={stats['err_not_html']}")
+    print(f"Buckets: {bucket_counts} | conflict={stats['conflict']}")
+    print(f"OUT: {(sink.path if sink else OUT_PATH).resolve()}")
 
 if __name__ == "__main__":
     main()
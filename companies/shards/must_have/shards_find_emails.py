@@ -11,27 +11,43 @@
 # - Stoppar direkt på 403/429 per domän (ingen extra crawl på den domänen)
 
 import re
+import sys
 import time
-import json
+import asyncio
 import sqlite3
-import hashlib
-import random
 import html as html_lib
-from datetime import datetime, timedelta, timezone
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 import argparse
-from urllib.parse import urljoin, urlparse, urlsplit, unquote
+from urllib.parse import urljoin, urlparse, unquote
 
-import requests
-from bs4 import BeautifulSoup
-from urllib3.exceptions import LocationParseError
-from requests.exceptions import InvalidURL, ConnectionError
+from lxml import etree
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.fetch import Fetcher, header_encoding, normalize_url, run_bounded, safe_url
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+from companies.shards.shared.refresh_sql import RULES, select_due
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, default_owner, keepalive, queue_writer, track
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--shard-id", type=int, required=True)
 ap.add_argument("--shard-total", type=int, default=4)
-args = ap.parse_args()
+ap.add_argument("--queue", action="store_true", help="dra targets ur delad arbetskö i stället för md5-shard")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
+# Kommentar: strikt när skriptet körs självt (felstavad flagga = fel, inte default); importerad av
+# enrich_all_shards.py tål vi pipelinens egna flaggor (--only osv.), pipelinen validerar sina själv
+if __name__ == "__main__":
+    args = ap.parse_args()
+else:
+    args, _unknown = ap.parse_known_args()
 
 SHARD_ID = args.shard_id
 SHARD_TOTAL = args.shard_total
@@ -41,6 +57,7 @@ SHARD_TOTAL = args.shard_total
 # =========================
 DB_PATH = Path("data/db/companies.db.sqlite")
 OUT_PATH = Path(f"data/out/shards/emails_found_shard{SHARD_ID}.ndjson")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0
 RESUME = True
 PRINT_EVERY = 100
@@ -50,10 +67,23 @@ MAX_EMAILS_PER_COMPANY = 3
 
 # Nätverk
 TIMEOUT_SEC = 7
-RETRY_COUNT = 1
 
-# Bas-sleep (vi lägger jitter runt detta)
-SLEEP_BETWEEN_REQUESTS_SEC = 0.20
+# Async-motorn: antal bolag samtidigt + anslutningstak
+CONCURRENCY = 100
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
+
+# Per-domän takt (token bucket) istället för fast sleep efter varje request.
+# Jitter på väntetiden så vi inte blir "maskinella" över tid (24/7-safe)
+PER_DOMAIN_RATE = 5.0
+PER_DOMAIN_BURST = 2
+PER_DOMAIN_JITTER = 0.75
+# Kommentar: delad sidcache mellan shards (samma sida hämtas en gång för hela enrichment-sviten)
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+# Kommentar: --queue => lease-baserad kö (valfritt antal workers), annars fast md5-shard
+QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+QUEUE_KIND = "emails"
 
 # 24/7-safe kontaktcrawl cap (max antal fetch per domän i detta script)
 # Notera: startsida räknas också in
@@ -104,48 +134,16 @@ CFEMAIL_RE = re.compile(r"data-cfemail=['\"]([0-9a-fA-F]+)['\"]")
 # Cloudflare l/email-protection#hex i href
 CFPROTECT_HREF_RE = re.compile(r"/cdn-cgi/l/email-protection#([0-9a-fA-F]+)")
 
-session = requests.Session()
-session.headers.update({
-    "User-Agent": USER_AGENT,
+EXTRA_HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "sv-SE,sv;q=0.9,en;q=0.7",
-})
+}
 
 
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
-def parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return None
-
-
-def needs_email_refresh(emails: Optional[str], checked_at: Optional[str]) -> bool:
-    if not emails or not str(emails).strip():
-        return True
-
-    dt = parse_iso(checked_at)
-    if not dt:
-        return True
-
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-
-def normalize_url(url: str) -> str:
-    url = (url or "").strip()
-    if not url:
-        return ""
-    if not url.startswith(("http://", "https://")):
-        url = "https://" + url
-    return url
-
-
 def same_domain(a: str, b: str) -> bool:
     try:
         ha = urlparse(a).netloc.lower()
@@ -155,71 +153,7 @@ def same_domain(a: str, b: str) -> bool:
         return False
 
 
-def _valid_hostname(host: str) -> bool:
-    if not host:
-        return False
-
-    host = host.strip().lower().rstrip(".")
-    if len(host) > 253:
-        return False
-
-    if any(c.isspace() for c in host):
-        return False
-    if ".." in host:
-        return False
-
-    labels = host.split(".")
-    if len(labels) < 2:
-        return False
-
-    for lab in labels:
-        if not lab or len(lab) > 63:
-            return False
-        if lab.startswith("-") or lab.endswith("-"):
-            return False
-        if not re.fullmatch(r"[a-z0-9-]+", lab):
-            return False
-
-    return True
-
-
-def _safe_url(url: str) -> bool:
-    try:
-        u = (url or "").strip()
-        if not u:
-            return False
-        parts = urlsplit(u)
-        if parts.scheme not in ("http", "https"):
-            return False
-        host = parts.hostname or ""
-        return _valid_hostname(host)
-    except Exception:
-        return False
-
-
-def _is_retryable_status(code: int) -> bool:
-    return code in (403, 429, 500, 502, 503, 504)
-
-
-def _is_dns_miss_error(e: Exception) -> bool:
-    msg = str(e).lower()
-    return (
-        "failed to resolve" in msg
-        or "name or service not known" in msg
-        or "nodename nor servname" in msg
-        or "getaddrinfo failed" in msg
-        or "temporary failure in name resolution" in msg
-    )
-
-
-def _sleep_jitter(base: float) -> None:
-    # Liten jitter så vi inte blir "maskinella" över tid (24/7-safe)
-    lo = max(0.0, base * 0.9)
-    hi = base * 1.75
-    time.sleep(random.uniform(lo, hi))
-
-
-def fetch_html_snippet(url: str) -> tuple[Optional[str], str]:
+async def fetch_html_snippet(fetcher: Fetcher, url: str) -> tuple[Optional[str], str]:
     """
     Returns (html, err_code)
     err_code: "" | "403" | "429" | "timeout" | "other"
@@ -228,41 +162,21 @@ def fetch_html_snippet(url: str) -> tuple[Optional[str], str]:
     if not url:
         return (None, "other")
 
-    if not _safe_url(url):
+    if not safe_url(url):
         return (None, "other")
 
-    for attempt in range(RETRY_COUNT + 1):
-        try:
-            with session.get(url, timeout=TIMEOUT_SEC, allow_redirects=True, stream=True) as r:
-                if _is_retryable_status(r.status_code):
-                    return (None, str(r.status_code))
-
-                if r.status_code >= 400:
-                    return (None, "")
-
-                buf = bytearray()
-                for chunk in r.iter_content(chunk_size=8192):
-                    if not chunk:
-                        break
-                    buf.extend(chunk)
-                    if len(buf) >= MAX_READ_BYTES:
-                        break
+    r = await fetcher.get(url, max_bytes=MAX_READ_BYTES)
+    if r.err:
+        # DNS-miss räknas som vanlig miss (inte retry/fel)
+        if r.dns_miss:
+            return (None, "")
+        return (None, r.err)
 
-                encoding = r.encoding or "utf-8"
-                return (bytes(buf).decode(encoding, errors="ignore"), "")
+    if r.status >= 400:
+        return (None, "")
 
-        except (LocationParseError, InvalidURL):
-            return (None, "other")
-        except requests.Timeout:
-            return (None, "timeout")
-        except (ConnectionError, requests.RequestException) as e:
-            if _is_dns_miss_error(e):
-                return (None, "")
-            return (None, "other")
-        except Exception:
-            time.sleep(0.35 + attempt * 0.35)
-
-    return (None, "other")
+    # Kommentar: samma avkodning som requests-versionen (r.encoding)
+    return (r.text(header_encoding(r)), "")
 
 
 def _clean_email_candidate(em: str) -> str:
@@ -349,6 +263,7 @@ def _cf_decode_hex(cfhex: str) -> Optional[str]:
 
 
 def _extract_cf_protected_emails(html: str) -> list[str]:
+    # Kommentar: regex på rå HTML (inte scannern) – fångar även hex i <script>-mallar och kommentarer
     if not html:
         return []
     out: list[str] = []
@@ -371,61 +286,124 @@ def _extract_cf_protected_emails(html: str) -> list[str]:
     return out
 
 
-def extract_emails_from_html(html: str) -> list[str]:
+class _PageScan:
+    """
+    lxml parser-target: EN genomgång av sidan (inget träd byggs), samlar allt som mail/kontakt-logiken behöver:
+    mailto/email-protection-hrefs, attributvärden (ATTR_KEYS), synlig text och länkar + länktext.
+    """
+
+    ATTR_KEYS = ("data-email", "data-mail", "data-contact", "aria-label", "title", "content", "value")
+    SKIP_TEXT = {"script", "style", "template"}
+
+    def __init__(self) -> None:
+        self.a_hrefs: list[str] = []                  # <a href> i dokumentordning
+        self.attr_values: list[str] = []
+        self.text: list[str] = []
+        self.links: list[tuple[str, list[str]]] = []  # (href, länktextens delar) i dokumentordning
+        self._buf: list[str] = []
+        self._skip = 0
+        self._open_a: list[tuple[str, list[str]]] = []
+
+    def _flush(self) -> None:
+        # Kommentar: som get_text(" ", strip=True) – varje textnod strippas, tomma hoppas över
+        if not self._buf:
+            return
+        s = "".join(self._buf).strip()
+        self._buf = []
+        if s:
+            self.text.append(s)
+            for _href, parts in self._open_a:
+                parts.append(s)
+
+    def start(self, tag, attrib) -> None:
+        self._flush()
+        tag = str(tag).lower()
+        if tag in self.SKIP_TEXT:
+            self._skip += 1
+
+        href = attrib.get("href")
+        for k in self.ATTR_KEYS:
+            v = attrib.get(k)
+            if v:
+                self.attr_values.append(v)
+
+        if tag == "a" and href is not None:
+            link = (href, [])
+            self.a_hrefs.append(href)
+            self.links.append(link)
+            self._open_a.append(link)
+
+    def end(self, tag) -> None:
+        self._flush()
+        tag = str(tag).lower()
+        if tag in self.SKIP_TEXT and self._skip:
+            self._skip -= 1
+        elif tag == "a" and self._open_a:
+            self._open_a.pop()
+
+    def data(self, data) -> None:
+        if not self._skip:
+            self._buf.append(data)
+
+    def close(self) -> "_PageScan":
+        self._flush()
+        self._open_a.clear()
+        return self
+
+
+def scan_html(html: str) -> _PageScan:
+    # Kommentar: recover-parsern tål trasig HTML; går något ändå fel används det som hunnit samlas
+    scan = _PageScan()
+    if not html:
+        return scan
+    parser = etree.HTMLParser(target=scan, recover=True, remove_comments=True)
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        scan.close()
+    return scan
+
+
+def extract_emails_from_html(html: str, scan: Optional[_PageScan] = None) -> list[str]:
     if not html:
         return []
 
     emails: list[str] = []
+    if scan is None:
+        scan = scan_html(html)
 
-    # 1) Cloudflare skyddade mail
+    # 1) Cloudflare skyddade mail (data-cfemail + /cdn-cgi/l/email-protection#hex)
     emails.extend(_extract_cf_protected_emails(html))
 
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-
-        # 2) mailto: (URL-decoding + HTML unescape)
-        for a in soup.select("a[href]"):
-            href = (a.get("href") or "").strip()
-            href_l = href.lower()
-
-            if href_l.startswith("mailto:"):
-                raw = href.split(":", 1)[1].split("?", 1)[0]
-                raw = _clean_email_candidate(raw)
-                if raw and not _is_blocklisted(raw):
-                    emails.append(raw)
-
-            # 3) Cloudflare /cdn-cgi l/email-protection länkar kan ligga i href
-            if "/cdn-cgi/l/email-protection#" in href_l:
-                mm = CFPROTECT_HREF_RE.search(href_l)
-                if mm:
-                    dec = _cf_decode_hex(mm.group(1))
-                    if dec:
-                        emails.append(dec)
-
-        # 4) Attribut-scan (utan extra requests)
-        # Vanliga ställen där mail gömmer sig: data-email, aria-label, title, content, value
-        ATTR_KEYS = ("data-email", "data-mail", "data-contact", "aria-label", "title", "content", "value")
-        try:
-            for tag in soup.find_all(True):
-                for k in ATTR_KEYS:
-                    v = tag.get(k)
-                    if not v:
-                        continue
-                    v = html_lib.unescape(str(v))
-                    v = unquote(v)
-                    emails.extend(extract_emails_from_text(v))
-        except Exception:
-            pass
-
-        # 5) Textinnehåll
-        try:
-            text = soup.get_text(" ", strip=True)
-            emails.extend(extract_emails_from_text(text))
-        except Exception:
-            pass
-
-    except Exception:
-        pass
+    # 2) mailto: (URL-decoding + HTML unescape)
+    for href in scan.a_hrefs:
+        href = href.strip()
+        href_l = href.lower()
+
+        if href_l.startswith("mailto:"):
+            raw = href.split(":", 1)[1].split("?", 1)[0]
+            raw = _clean_email_candidate(raw)
+            if raw and not _is_blocklisted(raw):
+                emails.append(raw)
+
+        # 3) Cloudflare /cdn-cgi l/email-protection länkar kan ligga i href
+        if "/cdn-cgi/l/email-protection#" in href_l:
+            mm = CFPROTECT_HREF_RE.search(href_l)
+            if mm:
+                dec = _cf_decode_hex(mm.group(1))
+                if dec:
+                    emails.append(dec)
+
+    # 4) Attribut-scan (utan extra requests)
+    # Vanliga ställen där mail gömmer sig: data-email, aria-label, title, content, value
+    for v in scan.attr_values:
+        v = html_lib.unescape(v)
+        v = unquote(v)
+        emails.extend(extract_emails_from_text(v))
+
+    # 5) Textinnehåll
+    emails.extend(extract_emails_from_text(" ".join(scan.text)))
 
     # 6) Regex på rå HTML (som backup)
     # (Vi unescape+unquote lite först för att fånga encodat innehåll)
@@ -476,34 +454,30 @@ def cap_emails(emails: list[str], max_n: int) -> list[str]:
     return prioritize_emails(uniq)[:max_n]
 
 
-def find_contact_links(base_url: str, html: str) -> list[str]:
+def find_contact_links(base_url: str, html: str, scan: Optional[_PageScan] = None) -> list[str]:
     if not html:
         return []
 
     base_url = normalize_url(base_url)
-
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-    except Exception:
-        soup = None
+    if scan is None:
+        scan = scan_html(html)
 
     candidates: list[str] = []
 
-    if soup is not None:
-        # Försök hitta kontaktlänkar och prioritera "footer/header" liknande
-        # (enkelt: vi kollar alla länkar, men låter keyword match styra urvalet)
-        for a in soup.select("a[href]"):
-            href = (a.get("href") or "").strip()
-            text = (a.get_text(" ", strip=True) or "").strip().lower()
-            href_l = href.lower()
+    # Försök hitta kontaktlänkar och prioritera "footer/header" liknande
+    # (enkelt: vi kollar alla länkar, men låter keyword match styra urvalet)
+    for href, parts in scan.links:
+        href = href.strip()
+        text = " ".join(parts).lower()
+        href_l = href.lower()
 
-            if not href or href.startswith(("javascript:", "mailto:", "tel:")):
-                continue
+        if not href or href.startswith(("javascript:", "mailto:", "tel:")):
+            continue
 
-            if any(k in text for k in CONTACT_KEYWORDS) or any(k in href_l for k in CONTACT_KEYWORDS):
-                full = urljoin(base_url, href)
-                if same_domain(base_url, full):
-                    candidates.append(full)
+        if any(k in text for k in CONTACT_KEYWORDS) or any(k in href_l for k in CONTACT_KEYWORDS):
+            full = urljoin(base_url, href)
+            if same_domain(base_url, full):
+                candidates.append(full)
 
     # Path hints (gissningar)
     for path in CONTACT_PATH_HINTS:
@@ -521,265 +495,277 @@ def find_contact_links(base_url: str, html: str) -> list[str]:
     return out[:MAX_CONTACT_LINKS_TO_CONSIDER]
 
 
-def pick_targets(conn: sqlite3.Connection, limit: Optional[int]) -> list[tuple[str, str, str, Optional[str], Optional[str]]]:
-    cur = conn.cursor()
-
-    if limit is None:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, emails, emails_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) <> ''
-            ORDER BY emails_checked_at IS NOT NULL, emails_checked_at ASC
-            """
-        )
-        rows = cur.fetchall()
-    else:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, emails, emails_checked_at
-            FROM companies
-            WHERE website IS NOT NULL AND TRIM(website) <> ''
-            ORDER BY emails_checked_at IS NOT NULL, emails_checked_at ASC
-            LIMIT ?
-            """,
-            (limit * 5,),
-        )
-        rows = cur.fetchall()
+def pick_targets(
+    conn: sqlite3.Connection,
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> list[tuple[str, str, str, Optional[str], Optional[str]]]:
+    # Kommentar: refresh-regeln + shard körs i SQL (due-index: migrations/add_refresh_due_indexes.py)
+    cur = select_due(
+        conn,
+        RULES[QUEUE_KIND],
+        "orgnr, name, website, emails, emails_checked_at",
+        refresh_days=REFRESH_DAYS,
+        limit=limit,
+        shard=shard,
+    )
 
     out = []
-    for orgnr, name, website, emails, checked_at in rows:
+    for orgnr, name, website, emails, checked_at in cur:
         if not orgnr or not name or not website:
             continue
-        if needs_email_refresh(emails, checked_at):
-            out.append((orgnr, name, website, emails, checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((orgnr, name, website, emails, checked_at))
     return out
 
 
 def load_done_set(path: Path) -> set[str]:
-    done = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
+    # Kommentar: sidecar-index (<out>.done) – bara svansen efter senaste checkpoint JSON-parsas
+    return DoneIndex(path).load() | load_columnar_done(path)
 
 
-def in_shard(orgnr: str) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % SHARD_TOTAL) == SHARD_ID
+async def process_target(
+    fetcher: Fetcher,
+    stats: Counter,
+    target: tuple[str, str, str, Optional[str], Optional[str]],
+) -> Optional[dict]:
+    """
+    Letar mail för ett bolag. Returnerar NDJSON-rad, eller None vid retry (timeout).
+    """
+    orgnr, name, website, emails_before, checked_before = target
+    website = normalize_url(website)
+
+    found_emails: list[str] = []
+    status = "not_found"
+    err_reason = ""
+
+    # Retry ENDAST på timeout
+    had_timeout = False
+
+    # 24/7-safe cap per domän
+    fetches_used = 0
+    blocked_by_waf = False  # sätts om 403/429 så vi inte fortsätter crawla
+
+    # 1) startsida
+    html_home, err = await fetch_html_snippet(fetcher, website)
+    fetches_used += 1
+
+    if err:
+        if err == "403":
+            stats["err_403"] += 1
+            err_reason = "403"
+            blocked_by_waf = True
+        elif err == "429":
+            stats["err_429"] += 1
+            err_reason = "429"
+            blocked_by_waf = True
+        elif err == "timeout":
+            stats["err_timeout"] += 1
+            had_timeout = True
+            err_reason = "timeout"
+        else:
+            stats["err_other"] += 1
+            err_reason = "other"
+
+    contact_links: list[str] = []
+
+    if html_home:
+        # Kommentar: startsidan parsas en gång – både mail och kontaktlänkar läses ur samma scan
+        scan_home = scan_html(html_home)
+        found_emails = extract_emails_from_html(html_home, scan_home)
+        found_emails = cap_emails(found_emails, MAX_EMAILS_PER_COMPANY)
+
+        # Hämta kontaktlänkar (utan att nödvändigtvis besöka alla)
+        contact_links = find_contact_links(website, html_home, scan_home)
+
+        # Plan:
+        # - Kör initialt bara 1–2 kontaktlänkar om vi inte redan är fulla
+        # - Om fortfarande inga mail -> eskalera och prova fler, men aldrig över cap
+        def can_fetch_more() -> bool:
+            return (not blocked_by_waf) and (fetches_used < MAX_FETCHES_PER_DOMAIN)
+
+        def handle_err(e: str) -> None:
+            nonlocal had_timeout, err_reason, blocked_by_waf
+            if not e:
+                return
+            if e == "403":
+                stats["err_403"] += 1
+                if not err_reason:
+                    err_reason = "403"
+                blocked_by_waf = True
+            elif e == "429":
+                stats["err_429"] += 1
+                if not err_reason:
+                    err_reason = "429"
+                blocked_by_waf = True
+            elif e == "timeout":
+                stats["err_timeout"] += 1
+                had_timeout = True
+                if not err_reason:
+                    err_reason = "timeout"
+            else:
+                stats["err_other"] += 1
+                if not err_reason:
+                    err_reason = "other"
+
+        # 2) Kontaktlänkar (initial)
+        if len(found_emails) < MAX_EMAILS_PER_COMPANY and contact_links and can_fetch_more():
+            tries = 0
+            for link in contact_links:
+                if tries >= INITIAL_CONTACT_TRIES:
+                    break
+                if not can_fetch_more():
+                    break
+
+                html_contact, err2 = await fetch_html_snippet(fetcher, link)
+                fetches_used += 1
 
+                handle_err(err2)
+                if blocked_by_waf:
+                    break
+                if not html_contact:
+                    tries += 1
+                    continue
+
+                cand = extract_emails_from_html(html_contact)
+                if cand:
+                    merged = found_emails + cand
+                    found_emails = cap_emails(merged, MAX_EMAILS_PER_COMPANY)
+                    if len(found_emails) >= MAX_EMAILS_PER_COMPANY:
+                        break
 
-def main():
-    if not DB_PATH.exists():
-        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+                tries += 1
 
-    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # 3) Eskalering: prova fler kontaktlänkar vid behov (utan att ändra grundlogiken)
+        if (not found_emails) and contact_links and can_fetch_more():
+            for link in contact_links[INITIAL_CONTACT_TRIES:]:
+                if not can_fetch_more():
+                    break
 
-    done = load_done_set(OUT_PATH) if RESUME else set()
-    limit = None if LIMIT == 0 else LIMIT
+                html_contact, err2 = await fetch_html_snippet(fetcher, link)
+                fetches_used += 1
 
-    conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
-    conn.execute("PRAGMA journal_mode=WAL;")
+                handle_err(err2)
+                if blocked_by_waf:
+                    break
+                if not html_contact:
+                    continue
 
-    targets = pick_targets(conn, limit)
-    targets = [(o, n, w, e, c) for (o, n, w, e, c) in targets if in_shard(o)]
+                cand = extract_emails_from_html(html_contact)
+                if not cand:
+                    continue
 
-    if RESUME and done:
-        targets = [(o, n, w, e, c) for (o, n, w, e, c) in targets if o not in done]
+                merged = found_emails + cand
+                found_emails = cap_emails(merged, MAX_EMAILS_PER_COMPANY)
 
-    print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL})")
+                if found_emails:
+                    break
 
-    processed = hits = misses = fetch_fail = 0
-    err_403 = err_429 = err_timeout = err_other = 0
+    else:
+        if not err:
+            stats["fetch_fail"] += 1
+        status = "fetch_failed"
+
+    if found_emails:
+        stats["hits"] += 1
+        status = "found"
+        err_reason = ""
+    else:
+        stats["misses"] += 1
+        if status != "fetch_failed":
+            status = "not_found"
+
+        # retry bara timeout
+        if had_timeout:
+            status = "retry"
 
+    # Om retry -> skriv INTE till OUT, så den kan köras om senare
+    if status == "retry":
+        return None
+
+    return {
+        "orgnr": orgnr,
+        "name": name,
+        "website": website,
+        "status": status,          # found / not_found / fetch_failed
+        "err_reason": err_reason,  # 403/429/timeout/other/""
+        "emails": ",".join(found_emails),
+        "checked_at": utcnow_iso(),
+        "db_emails_before": (emails_before or ""),
+        "db_emails_checked_at_before": (checked_before or ""),
+        "fetches_used": fetches_used,  # extra debug (hjälper dig mäta slowdown vs hitrate)
+    }
+
+
+def _print_progress(stats: Counter, start: float) -> None:
+    processed = stats["processed"]
+    rate = processed / max(1e-9, time.time() - start)
+    print(
+        f"[{processed}] hits={stats['hits']} misses={stats['misses']} fetch_fail={stats['fetch_fail']} "
+        f"403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']} | {rate:.1f}/s"
+    )
+
+
+async def crawl(targets: list[tuple[str, str, str, Optional[str], Optional[str]]], out_f, stats: Counter, qw: Optional[QueueWorker] = None) -> None:
     start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        connect_timeout=TIMEOUT_SEC,
+        read_timeout=TIMEOUT_SEC,
+        headers=EXTRA_HEADERS,
+        scheduler=PolitenessScheduler(
+            rate_per_sec=PER_DOMAIN_RATE,
+            burst=PER_DOMAIN_BURST,
+            jitter=PER_DOMAIN_JITTER,
+        ),
+        cache=cache,
+    ) as fetcher, keepalive(qw):
+        async for row in run_bounded(targets, track(qw, lambda t: process_target(fetcher, stats, t)), CONCURRENCY):
+            stats["processed"] += 1
+            if row is not None:
+                out_f.write_row(row)
+
+            if stats["processed"] % PRINT_EVERY == 0:
+                _print_progress(stats, start)
 
-    try:
-        with OUT_PATH.open("a", encoding="utf-8") as out_f:
-            for orgnr, name, website, emails_before, checked_before in targets:
-                processed += 1
-                website = normalize_url(website)
 
-                found_emails: list[str] = []
-                status = "not_found"
-                err_reason = ""
+def main():
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+
+    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-                # Retry ENDAST på timeout
-                had_timeout = False
+    # Kommentar: --sink-db => rader som ännu inte mergats räknas också som klara
+    sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID) if args.sink_db else None
+    done = (load_done_set(OUT_PATH) | (sink.load() if sink else set())) if RESUME else set()
+    limit = None if LIMIT == 0 else LIMIT
 
-                # 24/7-safe cap per domän
-                fetches_used = 0
-                blocked_by_waf = False  # sätts om 403/429 så vi inte fortsätter crawla
+    conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
+    conn.execute("PRAGMA journal_mode=WAL;")
 
-                # 1) startsida
-                html_home, err = fetch_html_snippet(website)
-                fetches_used += 1
-                _sleep_jitter(SLEEP_BETWEEN_REQUESTS_SEC)
-
-                if err:
-                    if err == "403":
-                        err_403 += 1
-                        err_reason = "403"
-                        blocked_by_waf = True
-                    elif err == "429":
-                        err_429 += 1
-                        err_reason = "429"
-                        blocked_by_waf = True
-                    elif err == "timeout":
-                        err_timeout += 1
-                        had_timeout = True
-                        err_reason = "timeout"
-                    else:
-                        err_other += 1
-                        err_reason = "other"
-
-                contact_links: list[str] = []
-
-                if html_home:
-                    found_emails = extract_emails_from_html(html_home)
-                    found_emails = cap_emails(found_emails, MAX_EMAILS_PER_COMPANY)
-
-                    # Hämta kontaktlänkar (utan att nödvändigtvis besöka alla)
-                    contact_links = find_contact_links(website, html_home)
-
-                    # Plan:
-                    # - Kör initialt bara 1–2 kontaktlänkar om vi inte redan är fulla
-                    # - Om fortfarande inga mail -> eskalera och prova fler, men aldrig över cap
-                    def can_fetch_more() -> bool:
-                        return (not blocked_by_waf) and (fetches_used < MAX_FETCHES_PER_DOMAIN)
-
-                    def handle_err(e: str) -> None:
-                        nonlocal err_403, err_429, err_timeout, err_other, had_timeout, err_reason, blocked_by_waf
-                        if not e:
-                            return
-                        if e == "403":
-                            err_403 += 1
-                            if not err_reason:
-                                err_reason = "403"
-                            blocked_by_waf = True
-                        elif e == "429":
-                            err_429 += 1
-                            if not err_reason:
-                                err_reason = "429"
-                            blocked_by_waf = True
-                        elif e == "timeout":
-                            err_timeout += 1
-                            had_timeout = True
-                            if not err_reason:
-                                err_reason = "timeout"
-                        else:
-                            err_other += 1
-                            if not err_reason:
-                                err_reason = "other"
-
-                    # 2) Kontaktlänkar (initial)
-                    if len(found_emails) < MAX_EMAILS_PER_COMPANY and contact_links and can_fetch_more():
-                        tries = 0
-                        for link in contact_links:
-                            if tries >= INITIAL_CONTACT_TRIES:
-                                break
-                            if not can_fetch_more():
-                                break
-
-                            html_contact, err2 = fetch_html_snippet(link)
-                            fetches_used += 1
-                            _sleep_jitter(SLEEP_BETWEEN_REQUESTS_SEC)
-
-                            handle_err(err2)
-                            if blocked_by_waf:
-                                break
-                            if not html_contact:
-                                tries += 1
-                                continue
-
-                            cand = extract_emails_from_html(html_contact)
-                            if cand:
-                                merged = found_emails + cand
-                                found_emails = cap_emails(merged, MAX_EMAILS_PER_COMPANY)
-                                if len(found_emails) >= MAX_EMAILS_PER_COMPANY:
-                                    break
-
-                            tries += 1
-
-                    # 3) Eskalering: prova fler kontaktlänkar vid behov (utan att ändra grundlogiken)
-                    if (not found_emails) and contact_links and can_fetch_more():
-                        for link in contact_links[INITIAL_CONTACT_TRIES:]:
-                            if not can_fetch_more():
-                                break
-
-                            html_contact, err2 = fetch_html_snippet(link)
-                            fetches_used += 1
-                            _sleep_jitter(SLEEP_BETWEEN_REQUESTS_SEC)
-
-                            handle_err(err2)
-                            if blocked_by_waf:
-                                break
-                            if not html_contact:
-                                continue
-
-                            cand = extract_emails_from_html(html_contact)
-                            if not cand:
-                                continue
-
-                            merged = found_emails + cand
-                            found_emails = cap_emails(merged, MAX_EMAILS_PER_COMPANY)
-
-                            if found_emails:
-                                break
-
-                else:
-                    if not err:
-                        fetch_fail += 1
-                    status = "fetch_failed"
+    targets = pick_targets(conn, limit, shard=None if args.queue else (SHARD_ID, SHARD_TOTAL))
+    qw: Optional[QueueWorker] = None
+    if args.queue:
+        # Kommentar: kö-läge – ingen fast md5-shard, alla workers drar batchar ur samma kö
+        if RESUME and done:
+            targets = [(o, n, w, e, c) for (o, n, w, e, c) in targets if o not in done]
+        qw = QueueWorker(WorkQueue(QUEUE_PATH), QUEUE_KIND, default_owner(QUEUE_KIND, SHARD_ID))
+        added = qw.queue.enqueue(QUEUE_KIND, targets)
+        print(f"Kö: {QUEUE_KIND} nya={added} {qw.queue.counts(QUEUE_KIND)} (worker={qw.owner}, CONCURRENCY={CONCURRENCY})")
+        targets = qw.targets()
+    else:
+        if RESUME and done:
+            targets = [(o, n, w, e, c) for (o, n, w, e, c) in targets if o not in done]
 
-                if found_emails:
-                    hits += 1
-                    status = "found"
-                    err_reason = ""
-                else:
-                    misses += 1
-                    if status != "fetch_failed":
-                        status = "not_found"
-
-                    # retry bara timeout
-                    if had_timeout:
-                        status = "retry"
-
-                # Om retry -> skriv INTE till OUT, så den kan köras om senare
-                if status != "retry":
-                    row = {
-                        "orgnr": orgnr,
-                        "name": name,
-                        "website": website,
-                        "status": status,          # found / not_found / fetch_failed
-                        "err_reason": err_reason,  # 403/429/timeout/other/""
-                        "emails": ",".join(found_emails),
-                        "checked_at": utcnow_iso(),
-                        "db_emails_before": (emails_before or ""),
-                        "db_emails_checked_at_before": (checked_before or ""),
-                        "fetches_used": fetches_used,  # extra debug (hjälper dig mäta slowdown vs hitrate)
-                    }
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-                if processed % PRINT_EVERY == 0:
-                    rate = processed / max(1e-9, time.time() - start)
-                    print(
-                        f"[{processed}] hits={hits} misses={misses} fetch_fail={fetch_fail} "
-                        f"403={err_403} 429={err_429} timeout={err_timeout} other={err_other} | {rate:.1f}/s"
-                    )
+        print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, CONCURRENCY={CONCURRENCY})")
+
+    stats: Counter = Counter()
+
+    try:
+        with open_writer(OUT_PATH, sink, columnar=args.columnar) as out_f:
+            asyncio.run(crawl(targets, queue_writer(qw, out_f), stats, qw))
 
     except KeyboardInterrupt:
         print("\nAvbruten (Ctrl+C) — filen är sparad ✅")
@@ -787,12 +773,12 @@ def main():
         conn.close()
 
     print("KLART ✅")
-    print(f"Processade: {processed}")
-    print(f"HITS: {hits}")
-    print(f"MISSES: {misses}")
-    print(f"Fetch-fail: {fetch_fail}")
-    print(f"Errors: 403={err_403} 429={err_429} timeout={err_timeout} other={err_other}")
-    print(f"OUT: {OUT_PATH.resolve()}")
+    print(f"Processade: {stats['processed']}")
+    print(f"HITS: {stats['hits']}")
+    print(f"MISSES: {stats['misses']}")
+    print(f"Fetch-fail: {stats['fetch_fail']}")
+    print(f"Errors: 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']}")
+    print(f"OUT: {(sink.path if sink else OUT_PATH).resolve()}")
 
 
 if __name__ == "__main__":
@@ -1,21 +1,33 @@
 import re
+import sys
 import time
-import json
+import asyncio
 import sqlite3
-import hashlib
-from datetime import datetime, timedelta, timezone
+from collections import Counter
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 import argparse
 
-import requests
-from urllib.parse import urlsplit
-from urllib3.exceptions import LocationParseError
-from requests.exceptions import InvalidURL, ConnectionError
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.shared.columnar_out import load_columnar_done
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneIndex
+from companies.shards.shared.fetch import HTML_TEXT_ENCODING, Fetcher, FetchResult, looks_like_html, run_bounded, safe_url
+from companies.shards.shared.keyword_matcher import KeywordMatcher
+from companies.shards.shared.dns_prefilter import DnsPrefilter
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler, domain_key
+from companies.shards.shared.refresh_sql import RULES, select_due
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, default_owner, keepalive, queue_writer, track
 
 ap = argparse.ArgumentParser()
 ap.add_argument("--shard-id", type=int, required=True)
 ap.add_argument("--shard-total", type=int, default=4)
+ap.add_argument("--queue", action="store_true", help="dra targets ur delad arbetskö i stället för md5-shard")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
 args = ap.parse_args()
 
 SHARD_ID = args.shard_id
@@ -27,13 +39,32 @@ SHARD_TOTAL = args.shard_total
 DB_PATH = Path("data/db/companies.db.sqlite")
 
 OUT_PATH = Path(f"data/out/shards/websites_guess_shard{SHARD_ID}.ndjson")
+SINK_DIR = Path("data/out/sinkdb")  # --sink-db
 LIMIT = 0  # 0 = ALLA
 RESUME = True
 PRINT_EVERY = 50
 # =========================
 
 TIMEOUT_SECONDS = 10
-SLEEP_BETWEEN_REQUESTS = 0.2
+PER_DOMAIN_RATE = 5.0   # Kommentar: max requests/s per registrerad domän (token bucket)
+PER_DOMAIN_BURST = 2
+# Kommentar: delad sidcache mellan shards (samma sida hämtas en gång för hela enrichment-sviten)
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+# Kommentar: --queue => lease-baserad kö (valfritt antal workers), annars fast md5-shard
+QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+QUEUE_KIND = "websites"
+SNIPPET_BYTES = 20_000
+PROBE_CONCURRENCY = 8   # Kommentar: antal domänkandidater per bolag som probas samtidigt
+
+# Kommentar: DNS-förfilter – kandidater som inte finns (NXDOMAIN) probas aldrig över HTTP
+USE_DNS_PREFILTER = True
+DNS_CONCURRENCY = 200   # Kommentar: max DNS-frågor i luften totalt
+
+# Kommentar: async-motorn – antal bolag samtidigt + anslutningstak
+CONCURRENCY = 100
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
 
 TLDS = ["se", "com"]
 REFRESH_DAYS = 90
@@ -55,37 +86,17 @@ PARKED_WEAK = [
     "godaddy",
     "this domain",
 ]
+PARKED_MATCHER = KeywordMatcher({"strong": PARKED_STRONG, "weak": PARKED_WEAK})
+PARKED_STRONG_MATCHER = KeywordMatcher({"strong": PARKED_STRONG})
 
-session = requests.Session()
-session.headers.update({
-    # Kommentar: håll UA enkel/normal. Det här är “botigt” men ok.
-    "User-Agent": f"Mozilla/5.0 (Didup-Site-Guesser/1.0; shard={SHARD_ID})"
-})
+# Kommentar: håll UA enkel/normal. Det här är “botigt” men ok.
+USER_AGENT = f"Mozilla/5.0 (Didup-Site-Guesser/1.0; shard={SHARD_ID})"
 
 
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
-def parse_iso(s: Optional[str]) -> Optional[datetime]:
-    if not s:
-        return None
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return None
-
-
-def needs_refresh(website: Optional[str], checked_at: Optional[str]) -> bool:
-    if not website or not str(website).strip():
-        return True
-    dt = parse_iso(checked_at)
-    if not dt:
-        return True
-    cutoff = datetime.now(timezone.utc) - timedelta(days=REFRESH_DAYS)
-    return dt < cutoff
-
-
 def _normalize_swedish(s: str) -> str:
     return s.replace("å", "a").replace("ä", "a").replace("ö", "o").replace("é", "e")
 
@@ -208,198 +219,100 @@ def url_variants(domain: str) -> list[str]:
     return [f"https://{domain}"]
 
 
-def looks_like_html(headers: dict) -> bool:
-    ct = (headers.get("Content-Type") or "").lower()
-    return ("text/html" in ct) or ("application/xhtml" in ct) or ct.startswith("text/")
-
-
 def is_parked_html(html_lower: str) -> bool:
-    if any(k in html_lower for k in PARKED_STRONG):
+    found = PARKED_MATCHER.found(html_lower)
+    if any(k in found for k in PARKED_STRONG):
         return True
-    weak_hits = sum(1 for k in PARKED_WEAK if k in html_lower)
+    weak_hits = sum(1 for k in PARKED_WEAK if k in found)
     return weak_hits >= 2
 
 
-def _valid_hostname(host: str) -> bool:
-    if not host:
-        return False
-
-    host = host.strip().lower().rstrip(".")
-    if len(host) > 253:
-        return False
+def _err_code(res: FetchResult) -> str:
+    # Kommentar: DNS-miss räknas som vanlig miss (inte fel), samma som förut
+    if res.dns_miss:
+        return ""
+    return res.err
 
-    if any(c.isspace() for c in host):
-        return False
-    if ".." in host:
-        return False
 
-    labels = host.split(".")
-    if len(labels) < 2:
-        return False
+async def _head_ok(fetcher: Fetcher, url: str) -> tuple[bool, bool, str]:
+    """
+    Returns (ok, is_html-ish, err_code)
+    err_code: "" | "403" | "429" | "timeout" | "other"
+    """
+    if not safe_url(url):
+        return (False, False, "other")
 
-    for lab in labels:
-        if not lab or len(lab) > 63:
-            return False
-        if lab.startswith("-") or lab.endswith("-"):
-            return False
-        if not re.fullmatch(r"[a-z0-9-]+", lab):
-            return False
+    r = await fetcher.head(url)
+    if r.err:
+        return (False, False, _err_code(r))
 
-    return True
+    if r.status == 405:
+        rg = await fetcher.get(url, max_bytes=0)
+        if rg.err:
+            return (False, False, _err_code(rg))
+        if not (200 <= rg.status < 400):
+            return (False, False, "")
+        return (True, True, "")
 
+    if not (200 <= r.status < 400):
+        return (False, False, "")
 
-def _safe_url(url: str) -> bool:
-    try:
-        u = url.strip()
-        parts = urlsplit(u)
-        if parts.scheme not in ("http", "https"):
-            return False
-        host = parts.hostname or ""
-        return _valid_hostname(host)
-    except Exception:
-        return False
-
-
-def _is_retryable_status(code: int) -> bool:
-    # Kommentar: detta är “problem status”, men vi kommer INTE retrya dem längre
-    return code in (403, 429, 500, 502, 503, 504)
-
-
-def _is_dns_miss_error(e: Exception) -> bool:
-    msg = str(e).lower()
-    return (
-        "name or service not known" in msg
-        or "failed to resolve" in msg
-        or "nodename nor servname" in msg
-        or "temporary failure in name resolution" in msg
-        or "getaddrinfo failed" in msg
-    )
+    return (True, looks_like_html(r.content_type), "")
 
 
-def _head_ok(url: str) -> tuple[bool, bool, str]:
+class _StopOnStrongParked:
     """
-    Returns (ok, is_html-ish, err_code)
-    err_code: "" | "403" | "429" | "timeout" | "other"
+    stop-predikat för snippet-hämtningen: en stark parkerings-markör avgör is_parked_html => resten behövs inte.
     """
-    if not _safe_url(url):
-        return (False, False, "other")
 
-    try:
-        r = session.head(
-            url,
-            timeout=(3, TIMEOUT_SECONDS),
-            allow_redirects=True,
-        )
-
-        if r.status_code == 405:
-            try:
-                rg = session.get(
-                    url,
-                    timeout=(3, TIMEOUT_SECONDS),
-                    allow_redirects=True,
-                    stream=True,
-                )
-                rg.close()
-
-                if _is_retryable_status(rg.status_code):
-                    return (False, False, str(rg.status_code))
-
-                if not (200 <= rg.status_code < 400):
-                    return (False, False, "")
-
-                return (True, True, "")
-            except requests.Timeout:
-                return (False, False, "timeout")
-            except (ConnectionError, requests.RequestException) as e:
-                if _is_dns_miss_error(e):
-                    return (False, False, "")
-                return (False, False, "other")
-
-        if _is_retryable_status(r.status_code):
-            return (False, False, str(r.status_code))
-
-        if not (200 <= r.status_code < 400):
-            return (False, False, "")
+    OVERLAP = max(len(k) for k in PARKED_STRONG) - 1
 
-        return (True, looks_like_html(r.headers), "")
+    def __init__(self) -> None:
+        self._tail = ""
 
-    except (LocationParseError, InvalidURL):
-        return (False, False, "other")
-    except requests.Timeout:
-        return (False, False, "timeout")
-    except (ConnectionError, requests.RequestException) as e:
-        if _is_dns_miss_error(e):
-            return (False, False, "")
-        return (False, False, "other")
-    except Exception as e:
-        if _is_dns_miss_error(e):
-            return (False, False, "")
-        return (False, False, "other")
+    def __call__(self, piece: str) -> bool:
+        # Kommentar: lite överlapp så en markör som delas mellan två chunkar ändå hittas
+        text = self._tail + piece.lower()
+        self._tail = text[-self.OVERLAP:]
+        return bool(PARKED_STRONG_MATCHER.found(text))
 
 
-def _get_snippet_lower(url: str) -> tuple[str, str]:
+async def _get_snippet_lower(fetcher: Fetcher, url: str) -> tuple[str, str]:
     """
     Returns (snippet_lower, err_code)
     err_code: "" | "403" | "429" | "timeout" | "other"
     """
-    if not _safe_url(url):
+    if not safe_url(url):
         return ("", "other")
 
-    try:
-        r = session.get(
-            url,
-            timeout=(3, TIMEOUT_SECONDS),
-            allow_redirects=True,
-            stream=True,
-        )
-
-        if _is_retryable_status(r.status_code):
-            r.close()
-            return ("", str(r.status_code))
-
-        if not (200 <= r.status_code < 400):
-            r.close()
-            return ("", "")
-
-        if not looks_like_html(r.headers):
-            r.close()
-            return ("", "")
-
-        chunk = r.raw.read(20_000, decode_content=True)
-        r.close()
-
-        try:
-            return ((chunk.decode("utf-8", errors="ignore") or "").lower(), "")
-        except Exception:
-            return ("", "other")
-
-    except (LocationParseError, InvalidURL):
-        return ("", "other")
-    except requests.Timeout:
-        return ("", "timeout")
-    except (ConnectionError, requests.RequestException) as e:
-        if _is_dns_miss_error(e):
-            return ("", "")
-        return ("", "other")
-    except Exception as e:
-        if _is_dns_miss_error(e):
-            return ("", "")
-        return ("", "other")
+    r = await fetcher.get(
+        url, max_bytes=SNIPPET_BYTES, stop=_StopOnStrongParked(), stop_encoding=HTML_TEXT_ENCODING, html_only=True
+    )
+    if r.err:
+        return ("", _err_code(r))
+
+    if not (200 <= r.status < 400):
+        return ("", "")
+
+    if not r.is_html:
+        return ("", "")
 
+    return ((r.text(HTML_TEXT_ENCODING) or "").lower(), "")
 
-def fetch_probe(url: str) -> tuple[bool, bool, str]:
+
+async def fetch_probe(fetcher: Fetcher, url: str) -> tuple[bool, bool, str]:
     """
     Returns (ok, parked, err_code)
     err_code: "" | "403" | "429" | "timeout" | "other"
     """
-    ok, is_html, err = _head_ok(url)
+    ok, is_html, err = await _head_ok(fetcher, url)
     if not ok:
         return (False, False, err)
 
     if not is_html:
         return (True, False, "")
 
-    snippet, err2 = _get_snippet_lower(url)
+    snippet, err2 = await _get_snippet_lower(fetcher, url)
     if err2:
         return (False, False, err2)
 
@@ -409,63 +322,178 @@ def fetch_probe(url: str) -> tuple[bool, bool, str]:
     return (True, False, "")
 
 
-def pick_targets(conn: sqlite3.Connection, limit: Optional[int]) -> list[tuple[str, str, Optional[str], Optional[str]]]:
-    cur = conn.cursor()
-
-    if limit is None:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, website_checked_at
-            FROM companies
-            ORDER BY website_checked_at IS NOT NULL, website_checked_at ASC
-            """
-        )
-        rows = cur.fetchall()
-    else:
-        cur.execute(
-            """
-            SELECT orgnr, name, website, website_checked_at
-            FROM companies
-            ORDER BY website_checked_at IS NOT NULL, website_checked_at ASC
-            LIMIT ?
-            """,
-            (limit * 5,),
-        )
-        rows = cur.fetchall()
+async def _probe_after(prev: Optional[asyncio.Task], fetcher: Fetcher, url: str) -> tuple[bool, bool, str]:
+    # Kommentar: vänta in högre rankad kandidat på samma domän först => dess 403/429-spärr (PolitenessScheduler)
+    # sätts i samma ordning som sekventiellt, en lägre rankad kandidat kan inte spärra domänen före den
+    if prev is not None:
+        await asyncio.gather(prev, return_exceptions=True)
+    return await fetch_probe(fetcher, url)
+
+
+def pick_targets(
+    conn: sqlite3.Connection,
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> list[tuple[str, str, Optional[str], Optional[str]]]:
+    # Kommentar: refresh-regeln + shard körs i SQL (due-index: migrations/add_refresh_due_indexes.py)
+    cur = select_due(
+        conn,
+        RULES[QUEUE_KIND],
+        "orgnr, name, website, website_checked_at",
+        refresh_days=REFRESH_DAYS,
+        limit=limit,
+        shard=shard,
+    )
 
     out = []
-    for orgnr, name, website, checked_at in rows:
+    for orgnr, name, website, checked_at in cur:
         if not orgnr or not name:
             continue
-        if needs_refresh(website, checked_at):
-            out.append((orgnr, name, website, checked_at))
-            if limit is not None and len(out) >= limit:
-                break
+        out.append((orgnr, name, website, checked_at))
     return out
 
 
 def load_done_set(path: Path) -> set[str]:
-    done = set()
-    if not path.exists():
-        return done
-    with path.open("r", encoding="utf-8") as rf:
-        for line in rf:
-            line = line.strip()
-            if not line:
+    # Kommentar: sidecar-index (<out>.done) – bara svansen efter senaste checkpoint JSON-parsas
+    return DoneIndex(path).load() | load_columnar_done(path)
+
+
+async def process_target(
+    fetcher: Fetcher,
+    stats: Counter,
+    target: tuple[str, str, Optional[str], Optional[str]],
+    prefilter: Optional[DnsPrefilter] = None,
+) -> Optional[dict]:
+    """
+    Gissar website för ett bolag. Returnerar NDJSON-rad, eller None vid retry (timeout).
+    """
+    orgnr, name, existing_website, existing_checked_at = target
+
+    cleaned = clean_company_name(name)
+    slugs = slug_variants(cleaned)
+    domains = domain_candidates(slugs)
+
+    if prefilter is not None:
+        # Kommentar: DNS-miss gav ändå bara en tyst miss i proben => samma resultat, färre requests
+        kept = await prefilter.filter(domains)
+        stats["dns_dropped"] += len(domains) - len(kept)
+        domains = kept
+
+    found_url = None
+    status = "not_found"
+    err_reason = ""  # Kommentar: spara varför vi missade
+
+    # Kommentar: NU retryar vi ENDAST timeout (för att inte fastna på WAF)
+    had_timeout = False
+
+    # Kommentar: alla kandidater i rankad ordning; probas samtidigt (fönster om PROBE_CONCURRENCY)
+    # men resultaten gås igenom i ordning => samma "första träff vinner" + samma räknare som sekventiellt
+    # Kommentar: kandidater på samma registrerade domän (t.ex. www.-varianten) körs efter varandra, i rankordning
+    urls = [u for d in domains for u in url_variants(d)]
+    tasks: list[Optional[asyncio.Task]] = [None] * len(urls)
+    last_by_domain: dict[str, asyncio.Task] = {}
+
+    def _start(i: int) -> None:
+        if i < len(urls) and tasks[i] is None:
+            key = domain_key(urls[i])
+            tasks[i] = asyncio.ensure_future(_probe_after(last_by_domain.get(key), fetcher, urls[i]))
+            last_by_domain[key] = tasks[i]
+
+    try:
+        for i in range(PROBE_CONCURRENCY):
+            _start(i)
+
+        for i, url in enumerate(urls):
+            _start(i + PROBE_CONCURRENCY - 1)
+            ok, parked, err = await tasks[i]
+
+            if not ok:
+                if err == "403":
+                    stats["err_403"] += 1
+                    err_reason = "403"
+                elif err == "429":
+                    stats["err_429"] += 1
+                    err_reason = "429"
+                elif err == "timeout":
+                    stats["err_timeout"] += 1
+                    had_timeout = True
+                    err_reason = "timeout"
+                elif err:
+                    stats["err_other"] += 1
+                    err_reason = "other"
+                continue
+
+            if parked:
+                stats["parked_skips"] += 1
+                status = "parked"
                 continue
-            try:
-                obj = json.loads(line)
-                o = (obj.get("orgnr") or "").strip()
-                if o:
-                    done.add(o)
-            except Exception:
-                pass
-    return done
+
+            found_url = url
+            status = "found"
+            err_reason = ""
+            break
+    finally:
+        # Kommentar: träff (eller avbrott) => lägre rankade probes behövs inte, avbryt dem direkt
+        pending = [t for t in tasks if t is not None and not t.done()]
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    if found_url:
+        stats["hits"] += 1
+    else:
+        stats["misses"] += 1
+        # Kommentar: retry bara om vi hade timeout (tillfälligt)
+        if had_timeout:
+            status = "retry"
+        else:
+            status = "not_found"
+
+    # Kommentar: om retry -> skriv inte, så den kan köras om senare
+    if status == "retry":
+        return None
+
+    return {
+        "orgnr": orgnr,
+        "name": name,
+        "found_website": found_url or "",
+        "status": status,              # found / parked / not_found
+        "err_reason": err_reason,      # 403 / 429 / timeout / other / ""
+        "checked_at": utcnow_iso(),
+        "db_website_before": (existing_website or ""),
+        "db_checked_at_before": (existing_checked_at or ""),
+    }
+
+
+def _print_progress(stats: Counter, start: float) -> None:
+    processed = stats["processed"]
+    rate = processed / max(1e-9, time.time() - start)
+    print(
+        f"[{processed}] hits={stats['hits']} misses={stats['misses']} parked={stats['parked_skips']} dns_dropped={stats['dns_dropped']} "
+        f"403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']} | {rate:.1f}/s"
+    )
 
 
-def in_shard(orgnr: str) -> bool:
-    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
-    return (int(h, 16) % SHARD_TOTAL) == SHARD_ID
+async def crawl(targets: list[tuple[str, str, Optional[str], Optional[str]]], out_f, stats: Counter, qw: Optional[QueueWorker] = None) -> None:
+    start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    prefilter = DnsPrefilter(concurrency=DNS_CONCURRENCY) if USE_DNS_PREFILTER else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        read_timeout=TIMEOUT_SECONDS,
+        scheduler=PolitenessScheduler(rate_per_sec=PER_DOMAIN_RATE, burst=PER_DOMAIN_BURST),
+        cache=cache,
+    ) as fetcher, keepalive(qw):
+        async for row in run_bounded(targets, track(qw, lambda t: process_target(fetcher, stats, t, prefilter)), CONCURRENCY):
+            stats["processed"] += 1
+            if row is not None:
+                out_f.write_row(row)
+
+            if stats["processed"] % PRINT_EVERY == 0:
+                _print_progress(stats, start)
 
 
 def main():
@@ -474,105 +502,35 @@ def main():
 
     OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    done = load_done_set(OUT_PATH) if RESUME else set()
+    # Kommentar: --sink-db => rader som ännu inte mergats räknas också som klara
+    sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID) if args.sink_db else None
+    done = (load_done_set(OUT_PATH) | (sink.load() if sink else set())) if RESUME else set()
     limit = None if LIMIT == 0 else LIMIT
 
     conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
     conn.execute("PRAGMA journal_mode=WAL;")
 
-    targets = pick_targets(conn, limit)
-    targets = [(o, n, w, c) for (o, n, w, c) in targets if in_shard(o)]
-
-    if RESUME and done:
-        targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
-
-    print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL})")
+    targets = pick_targets(conn, limit, shard=None if args.queue else (SHARD_ID, SHARD_TOTAL))
+    qw: Optional[QueueWorker] = None
+    if args.queue:
+        # Kommentar: kö-läge – ingen fast md5-shard, alla workers drar batchar ur samma kö
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
+        qw = QueueWorker(WorkQueue(QUEUE_PATH), QUEUE_KIND, default_owner(QUEUE_KIND, SHARD_ID))
+        added = qw.queue.enqueue(QUEUE_KIND, targets)
+        print(f"Kö: {QUEUE_KIND} nya={added} {qw.queue.counts(QUEUE_KIND)} (worker={qw.owner}, CONCURRENCY={CONCURRENCY})")
+        targets = qw.targets()
+    else:
+        if RESUME and done:
+            targets = [(o, n, w, c) for (o, n, w, c) in targets if o not in done]
 
-    processed = hits = misses = parked_skips = 0
-    err_403 = err_429 = err_timeout = err_other = 0
+        print(f"Targets: {len(targets)} (LIMIT={LIMIT}, RESUME={RESUME}, SHARD={SHARD_ID}/{SHARD_TOTAL}, CONCURRENCY={CONCURRENCY})")
 
-    start = time.time()
+    stats: Counter = Counter()
 
     try:
-        with OUT_PATH.open("a", encoding="utf-8") as out_f:
-            for orgnr, name, existing_website, existing_checked_at in targets:
-                processed += 1
-
-                cleaned = clean_company_name(name)
-                slugs = slug_variants(cleaned)
-                domains = domain_candidates(slugs)
-
-                found_url = None
-                status = "not_found"
-                err_reason = ""  # Kommentar: spara varför vi missade
-
-                # Kommentar: NU retryar vi ENDAST timeout (för att inte fastna på WAF)
-                had_timeout = False
-
-                for domain in domains:
-                    for url in url_variants(domain):
-                        ok, parked, err = fetch_probe(url)
-                        time.sleep(SLEEP_BETWEEN_REQUESTS)
-
-                        if not ok:
-                            if err == "403":
-                                err_403 += 1
-                                err_reason = "403"
-                            elif err == "429":
-                                err_429 += 1
-                                err_reason = "429"
-                            elif err == "timeout":
-                                err_timeout += 1
-                                had_timeout = True
-                                err_reason = "timeout"
-                            elif err:
-                                err_other += 1
-                                err_reason = "other"
-                            continue
-
-                        if parked:
-                            parked_skips += 1
-                            status = "parked"
-                            continue
-
-                        found_url = url
-                        status = "found"
-                        err_reason = ""
-                        break
-
-                    if found_url:
-                        break
-
-                if found_url:
-                    hits += 1
-                else:
-                    misses += 1
-                    # Kommentar: retry bara om vi hade timeout (tillfälligt)
-                    if had_timeout:
-                        status = "retry"
-                    else:
-                        status = "not_found"
-
-                # Kommentar: om retry -> skriv inte, så den kan köras om senare
-                if status != "retry":
-                    row = {
-                        "orgnr": orgnr,
-                        "name": name,
-                        "found_website": found_url or "",
-                        "status": status,              # found / parked / not_found
-                        "err_reason": err_reason,      # 403 / 429 / timeout / other / ""
-                        "checked_at": utcnow_iso(),
-                        "db_website_before": (existing_website or ""),
-                        "db_checked_at_before": (existing_checked_at or ""),
-                    }
-                    out_f.write(json.dumps(row, ensure_ascii=False) + "\n")
-
-                if processed % PRINT_EVERY == 0:
-                    rate = processed / max(1e-9, time.time() - start)
-                    print(
-                        f"[{processed}] hits={hits} misses={misses} parked={parked_skips} "
-                        f"403={err_403} 429={err_429} timeout={err_timeout} other={err_other} | {rate:.1f}/s"
-                    )
+        with open_writer(OUT_PATH, sink, columnar=args.columnar) as out_f:
+            asyncio.run(crawl(targets, queue_writer(qw, out_f), stats, qw))
 
     except KeyboardInterrupt:
         print("\nAvbruten (Ctrl+C) — filen är sparad ✅")
@@ -580,9 +538,12 @@ def main():
         conn.close()
 
     print("KLART ✅")
-    print(f"Processade: {processed} | HITS: {hits} | MISSES: {misses} | Parked: {parked_skips}")
-    print(f"Errors: 403={err_403} 429={err_429} timeout={err_timeout} other={err_other}")
-    print(f"OUT: {OUT_PATH.resolve()}")
+    print(
+        f"Processade: {stats['processed']} | HITS: {stats['hits']} | MISSES: {stats['misses']} "
+        f"| Parked: {stats['parked_skips']}"
+    )
+    print(f"Errors: 403={stats['err_403']} 429={stats['err_429']} timeout={stats['err_timeout']} other={stats['err_other']}")
+    print(f"OUT: {(sink.path if sink else OUT_PATH).resolve()}")
 
 
 if __name__ == "__main__":
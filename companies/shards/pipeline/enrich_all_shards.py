@@ -0,0 +1,234 @@
+# companies/shards/pipeline/enrich_all_shards.py
+# Single-pass enrichment: EN crawl per bolag i stället för fem separata shard-program
+# - startsidan hämtas en gång, sedan kandidatlänkarna (unionen av find_contact_links,
+#   extract_internal_links, extract_internal_career_links, extract_internal_candidate_links)
+#   via en gemensam sidmängd per bolag (SitePages) => varje URL hämtas max en gång
+# - extractors = shardernas egna process_target (emails, tech, site_review, hiring, line_of_work)
+#   så besluten (detect_microsoft_from_web, compute_score, hard_hiring_decision_strict,
+#   classify_from_text ...) och NDJSON-formatet är exakt samma => apply_out_shards_to_db.py oförändrad
+# - samma --shard-id/--shard-total som shardsen => samma OUT-filer, samma resume/done-set
+# - en extractor som får timeout skriver ingen rad (som förut), de andra skriver ändå
+# - --sink-db: varje extractor skriver till sin WAL-sidodatabas (merge_sink_dbs.py) i stället för NDJSON
+# - --columnar: Arrow IPC-segment (zstd) i stället för NDJSON (companies/shards/shared/columnar_out.py)
+#
+# Kör:
+#   python companies/shards/pipeline/enrich_all_shards.py --shard-id 0 --shard-total 4
+#   python companies/shards/pipeline/enrich_all_shards.py --shard-id 0 --only emails,tech
+
+import argparse
+import asyncio
+import sqlite3
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Optional, Union
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from companies.shards.extras import hiring_review_shards, tech_footprint_shards, web_review
+from companies.shards.must_have import line_of_work_shard, shards_find_emails
+from companies.shards.shared.columnar_out import ColumnarWriter
+from companies.shards.shared.db_sink import DbSink, open_writer
+from companies.shards.shared.done_index import DoneWriter
+from companies.shards.shared.fetch import Fetcher, normalize_url, run_bounded
+from companies.shards.shared.page_cache import PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+from companies.shards.shared.site_pages import SitePages
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--shard-id", type=int, required=True)
+ap.add_argument("--shard-total", type=int, default=4)
+ap.add_argument("--only", type=str, default="", help="kommaseparerat urval, t.ex. emails,tech")
+ap.add_argument("--sink-db", action="store_true", help="skriv direkt till WAL-sidodatabaser i stället för NDJSON")
+ap.add_argument("--columnar", action="store_true", help="skriv Arrow IPC-segment (zstd) i stället för NDJSON, kräver pyarrow")
+args = ap.parse_args()
+
+SHARD_ID = args.shard_id
+SHARD_TOTAL = args.shard_total
+
+# =========================
+# ÄNDRA HÄR
+# =========================
+DB_PATH = Path("data/db/companies.db.sqlite")
+LIMIT = 0              # 0 = ALLA (per extractor, som i shardsen)
+PRINT_EVERY = 50
+# =========================
+
+TIMEOUT_SECONDS = 12
+PER_DOMAIN_RATE = 5.0  # Kommentar: lägsta av shardsens takt – nu går alla extractors mot samma domän
+PER_DOMAIN_BURST = 2
+USE_PAGE_CACHE = True
+PAGE_CACHE_DIR = Path("data/cache/pages")
+
+# Kommentar: antal bolag samtidigt (varje bolag kör sina extractors parallellt)
+CONCURRENCY = 60
+MAX_CONNECTIONS = 200
+PER_HOST_LIMIT = 2
+
+USER_AGENT = f"Mozilla/5.0 (Didup-Enrich/1.0; shard={SHARD_ID})"
+
+
+@dataclass
+class Extractor:
+    name: str
+    mod: ModuleType
+    max_bytes: int
+    extra: Optional[dict] = None          # Kommentar: score_counts / bucket_counts för de shards som har det
+    stats: Counter = field(default_factory=Counter)
+    targets: dict[str, tuple] = field(default_factory=dict)
+    sink: Optional[DbSink] = None
+    out_f: Optional[Union[DbSink, ColumnarWriter, DoneWriter]] = None
+
+    async def run(self, pages: SitePages, target: tuple) -> Optional[dict]:
+        if self.extra is None:
+            return await self.mod.process_target(pages, self.stats, target)
+        return await self.mod.process_target(pages, self.stats, self.extra, target)
+
+    def print_progress(self, start: float) -> None:
+        print(f"  {self.name}:", end=" ")
+        if self.extra is None:
+            self.mod._print_progress(self.stats, start)
+        else:
+            self.mod._print_progress(self.stats, self.extra, start)
+
+
+def build_extractors() -> list[Extractor]:
+    return [
+        Extractor("emails", shards_find_emails, shards_find_emails.MAX_READ_BYTES),
+        Extractor("tech", tech_footprint_shards, tech_footprint_shards.MAX_BYTES),
+        Extractor("site_review", web_review, web_review.MAX_BYTES, extra={s: 0 for s in range(1, 11)}),
+        Extractor("hiring", hiring_review_shards, hiring_review_shards.MAX_BYTES),
+        Extractor("line_of_work", line_of_work_shard, line_of_work_shard.MAX_BYTES, extra={"HIGH": 0, "MID": 0, "LOW": 0}),
+    ]
+
+
+def select_targets(conn: sqlite3.Connection, x: Extractor, limit: Optional[int]) -> None:
+    # Kommentar: exakt samma urval som när sharden körs själv (refresh-regler + shard + resume)
+    done = (x.mod.load_done_set(x.mod.OUT_PATH) | (x.sink.load() if x.sink else set())) if x.mod.RESUME else set()
+    for t in x.mod.pick_targets(conn, limit, shard=(SHARD_ID, SHARD_TOTAL)):
+        if t[0] not in done:
+            x.targets[t[0]] = t
+
+
+async def process_company(
+    fetcher: Fetcher,
+    extractors: list[Extractor],
+    orgnr: str,
+) -> tuple[SitePages, list[tuple[Extractor, Optional[dict]]]]:
+    active = [x for x in extractors if orgnr in x.targets]
+    website = active[0].targets[orgnr][2]
+
+    pages = SitePages(fetcher, max_bytes=max(x.max_bytes for x in active))
+    try:
+        # 1) startsidan en gång (alla extractors börjar där)
+        await pages.get(normalize_url(website), max_bytes=pages.max_bytes)
+
+        # 2) extractors parallellt – deras kontakt/tech/karriär/kandidat-länkar går via samma sidmängd
+        rows = await asyncio.gather(*(x.run(pages, x.targets[orgnr]) for x in active))
+    finally:
+        await pages.close()
+
+    return pages, list(zip(active, rows))
+
+
+def _print_progress(stats: Counter, extractors: list[Extractor], start: float) -> None:
+    companies = stats["companies"]
+    rate = companies / max(1e-9, time.time() - start)
+    print(f"[{companies}] pages={stats['page_requests']} reused={stats['page_reused']} | {rate:.1f} bolag/s")
+    for x in extractors:
+        if x.targets:
+            x.print_progress(start)
+
+
+async def crawl(orgnrs: list[str], extractors: list[Extractor], stats: Counter) -> None:
+    start = time.time()
+    cache = PageCache(PAGE_CACHE_DIR) if USE_PAGE_CACHE else None
+    async with Fetcher(
+        USER_AGENT,
+        max_connections=MAX_CONNECTIONS,
+        per_host=PER_HOST_LIMIT,
+        read_timeout=TIMEOUT_SECONDS,
+        headers=shards_find_emails.EXTRA_HEADERS,
+        scheduler=PolitenessScheduler(rate_per_sec=PER_DOMAIN_RATE, burst=PER_DOMAIN_BURST),
+        cache=cache,
+    ) as fetcher:
+        async for pages, results in run_bounded(
+            orgnrs, lambda o: process_company(fetcher, extractors, o), CONCURRENCY
+        ):
+            stats["companies"] += 1
+            stats["page_requests"] += pages.requests
+            stats["page_reused"] += pages.reused
+
+            for x, row in results:
+                x.stats["processed"] += 1
+                if row is not None:
+                    x.out_f.write_row(row)
+
+            if stats["companies"] % PRINT_EVERY == 0:
+                _print_progress(stats, extractors, start)
+
+
+def main() -> None:
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+
+    extractors = build_extractors()
+    only = {s.strip() for s in args.only.split(",") if s.strip()}
+    if only:
+        unknown = only - {x.name for x in extractors}
+        if unknown:
+            raise SystemExit(f"Okänd extractor: {', '.join(sorted(unknown))}")
+        extractors = [x for x in extractors if x.name in only]
+    if args.sink_db:
+        for x in extractors:
+            x.sink = DbSink(x.mod.SINK_DIR, x.mod.QUEUE_KIND, SHARD_ID)
+
+    limit = None if LIMIT == 0 else LIMIT
+
+    conn = sqlite3.connect(f"file:{DB_PATH.as_posix()}?mode=ro", uri=True)
+    conn.execute("PRAGMA journal_mode=WAL;")
+
+    try:
+        for x in extractors:
+            select_targets(conn, x, limit)
+    finally:
+        conn.close()
+
+    # Kommentar: unionen av bolag – varje bolag crawlas en gång oavsett hur många extractors som behöver det
+    orgnrs: list[str] = []
+    seen: set[str] = set()
+    for x in extractors:
+        for o in x.targets:
+            if o not in seen:
+                seen.add(o)
+                orgnrs.append(o)
+
+    per = ", ".join(f"{x.name}={len(x.targets)}" for x in extractors)
+    print(f"Bolag: {len(orgnrs)} ({per}) SHARD={SHARD_ID}/{SHARD_TOTAL}, CONCURRENCY={CONCURRENCY}")
+
+    stats: Counter = Counter()
+    opened: list[Union[DbSink, ColumnarWriter, DoneWriter]] = []
+    try:
+        for x in extractors:
+            x.out_f = open_writer(x.mod.OUT_PATH, x.sink, columnar=args.columnar)
+            opened.append(x.out_f)
+
+        asyncio.run(crawl(orgnrs, extractors, stats))
+
+    except KeyboardInterrupt:
+        print("\nAvbruten (Ctrl+C) — filerna är sparade ✅")
+    finally:
+        for f in opened:
+            f.close()
+
+    print("KLART ✅")
+    print(f"Bolag: {stats['companies']} | sidor hämtade: {stats['page_requests']} | återanvända: {stats['page_reused']}")
+    for x in extractors:
+        print(f"{x.name}: processade={x.stats['processed']} timeout={x.stats['err_timeout']} OUT: {(x.sink.path if x.sink else x.mod.OUT_PATH).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
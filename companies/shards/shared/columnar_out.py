@@ -0,0 +1,238 @@
+# companies/shards/shared/columnar_out.py
+# Kompakt kolumnformat för shard-output (--columnar): Arrow IPC-stream med zstd i stället för NDJSON
+# - nycklarna (db_emails_checked_at_before ...) lagras en gång i schemat, värdena kolumnvis + zstd per batch
+#   => upprepade ISO-tider/statusar komprimeras till en bråkdel
+# - en segmentfil per körning bredvid NDJSON: <out-stem>.<utc-tid>-<pid>.arrows
+#   (stream-formatet kräver ingen footer => en krasch tappar bara batchen som inte hunnit skrivas)
+# - schemat låses vid första batchen (str/int/float/bool, annat som JSON-text); värden/nycklar som inte passar
+#   hamnar i kolumnen _extra (JSON) => raderna läses tillbaka som samma dict som json.loads(NDJSON-raden)
+#   (enda skillnaden: en nyckel som saknas i en rad kommer tillbaka som None)
+# - pyarrow är valfritt: utan det fungerar allt som förut, bara --columnar och läsning av .arrows kräver det
+#
+# Användning:
+#   with ColumnarWriter(OUT_PATH) as out_f:
+#       out_f.write_row(row)
+#   for row in iter_columnar_rows(path): ...
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+COLUMNAR_EXT = ".arrows"
+BATCH_ROWS = 2000
+BATCH_SEC = 30.0
+COMPRESSION = "zstd"
+EXTRA_COL = "_extra"
+JSON_META = b"json"
+
+_INT64_MIN = -(2 ** 63)
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _try_import_pyarrow():
+    try:
+        import pyarrow  # type: ignore
+        import pyarrow.ipc  # type: ignore  # noqa: F401
+        return pyarrow
+    except Exception:
+        return None
+
+
+PYARROW = _try_import_pyarrow()
+
+
+def require_pyarrow():
+    if PYARROW is None:
+        raise SystemExit("pyarrow saknas – pip install pyarrow (eller kör utan --columnar)")
+    return PYARROW
+
+
+def is_columnar(path: Path) -> bool:
+    return Path(path).suffix == COLUMNAR_EXT
+
+
+def segment_paths(out_path: Path) -> list[Path]:
+    # Kommentar: "<stem>." så shard1 inte matchar shard10
+    out_path = Path(out_path)
+    if not out_path.parent.exists():
+        return []
+    return sorted(out_path.parent.glob(f"{out_path.stem}.*{COLUMNAR_EXT}"))
+
+
+# -------------------------
+# schema
+# -------------------------
+def _kind_of(values: list[Any]) -> str:
+    types = {type(v) for v in values if v is not None}
+    if not types or types == {str}:
+        return "str"
+    if types == {bool}:
+        return "bool"
+    if types == {int} and all(_INT64_MIN <= v <= _INT64_MAX for v in values if v is not None):
+        return "int"
+    if types == {float}:
+        return "float"
+    return "json"
+
+
+def _fits(kind: str, v: Any) -> bool:
+    if v is None or kind == "json":
+        return True
+    if kind == "str":
+        return isinstance(v, str)
+    if kind == "bool":
+        return isinstance(v, bool)
+    if kind == "int":
+        return type(v) is int and _INT64_MIN <= v <= _INT64_MAX
+    return type(v) is float
+
+
+def _arrow_type(pa, kind: str):
+    return {"str": pa.string(), "bool": pa.bool_(), "int": pa.int64(), "float": pa.float64()}.get(kind, pa.string())
+
+
+# -------------------------
+# write
+# -------------------------
+class ColumnarWriter:
+    """
+    Samma gränssnitt som DoneWriter/DbSink. Batch var BATCH_ROWS rad eller BATCH_SEC sekund och vid close.
+    """
+
+    def __init__(self, out_path: Path) -> None:
+        self.pa = require_pyarrow()
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.path = out_path.with_name(f"{out_path.stem}.{ts}-{os.getpid()}{COLUMNAR_EXT}")
+        self._kinds: dict[str, str] = {}
+        self._schema = None
+        self._sink = None
+        self._writer = None
+        self._rows: list[dict] = []
+        self._last_flush = time.monotonic()
+        self._closed = False
+        # Kommentar: anropas efter varje skriven batch (work_queue.queue_writer sätter done då)
+        self.checkpoint_hooks: list[Callable[[], None]] = []
+
+    def __enter__(self) -> "ColumnarWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write_row(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= BATCH_ROWS or time.monotonic() - self._last_flush >= BATCH_SEC:
+            self.checkpoint()
+
+    def _open(self) -> None:
+        # Kommentar: schemat = nycklarna i första batchen, i radordning
+        pa = self.pa
+        keys: dict[str, None] = {}
+        for r in self._rows:
+            keys.update(dict.fromkeys(r))
+        keys.pop(EXTRA_COL, None)
+        fields = []
+        for k in keys:
+            kind = _kind_of([r.get(k) for r in self._rows])
+            self._kinds[k] = kind
+            meta = {JSON_META: b"1"} if kind == "json" else None
+            fields.append(pa.field(k, _arrow_type(pa, kind), metadata=meta))
+        fields.append(pa.field(EXTRA_COL, pa.string()))
+        self._schema = pa.schema(fields)
+        self._sink = pa.OSFile(self.path.as_posix(), "wb")
+        self._writer = pa.ipc.new_stream(
+            self._sink, self._schema, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        )
+
+    def checkpoint(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        if self._writer is None:
+            self._open()
+
+        cols: dict[str, list] = {k: [] for k in self._kinds}
+        extra: list[Optional[str]] = []
+        for r in self._rows:
+            rest: dict[str, Any] = {}
+            for k, kind in self._kinds.items():
+                v = r.get(k)
+                if not _fits(kind, v):
+                    rest[k] = v
+                    v = None
+                elif kind == "json" and v is not None:
+                    v = json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+                cols[k].append(v)
+            for k, v in r.items():
+                if k not in self._kinds:
+                    rest[k] = v
+            extra.append(json.dumps(rest, ensure_ascii=False, separators=(",", ":")) if rest else None)
+        cols[EXTRA_COL] = extra
+
+        self._writer.write_batch(self.pa.record_batch(list(cols.values()), schema=self._schema))
+        self._rows.clear()
+        for hook in self.checkpoint_hooks:
+            hook()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.checkpoint()
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+        self._closed = True
+
+
+# -------------------------
+# read
+# -------------------------
+def _iter_batches(path: Path) -> Iterator[Any]:
+    pa = require_pyarrow()
+    with pa.memory_map(Path(path).as_posix(), "r") as src:
+        try:
+            reader = pa.ipc.open_stream(src)
+        except pa.ArrowInvalid:
+            return  # Kommentar: tom/halv fil (writern har inte hunnit skriva schemat)
+        while True:
+            try:
+                batch = reader.read_next_batch()
+            except StopIteration:
+                return
+            except (pa.ArrowInvalid, OSError):
+                return  # Kommentar: avbruten skrivning – allt före sista hela batchen är giltigt
+            yield batch
+
+
+def iter_columnar_rows(path: Path) -> Iterator[dict[str, Any]]:
+    for batch in _iter_batches(path):
+        json_cols = [f.name for f in batch.schema if f.metadata and f.metadata.get(JSON_META)]
+        for r in batch.to_pylist():
+            for k in json_cols:
+                if r[k] is not None:
+                    r[k] = json.loads(r[k])
+            extra = r.pop(EXTRA_COL, None)
+            if extra:
+                r.update(json.loads(extra))
+            yield r
+
+
+def count_columnar_rows(path: Path) -> int:
+    return sum(b.num_rows for b in _iter_batches(path))
+
+
+def load_columnar_done(out_path: Path) -> set[str]:
+    # Kommentar: resume – bara orgnr-kolumnen, inga dicts
+    done: set[str] = set()
+    for p in segment_paths(out_path):
+        for b in _iter_batches(p):
+            if "orgnr" in b.schema.names:
+                done.update(o.strip() for o in b.column("orgnr").to_pylist() if o and o.strip())
+    return done
@@ -0,0 +1,105 @@
+# companies/shards/shared/db_sink.py
+# Direkt-till-DB-läge för shards (--sink-db): resultaten skrivs som färdiga staging-rader i en WAL-sidodatabas
+# per shard i stället för NDJSON + separat apply (ingen dict -> JSON -> parse -> SQL)
+# - en fil per (kind, shard): data/out/sinkdb/<kind>_shard<N>.sqlite, tabell results = applierns staging-schema
+# - raden görs om med applierns egen parse (BULK_SPECS) => exakt samma fält/regler som NDJSON-vägen
+# - commit var COMMIT_EVERY rad eller COMMIT_SEC sekund (mergern ser färska rader inom sekunder)
+# - companies/apply/merge_sink_dbs.py viker in raderna i companies i stora transaktioner och tar bort dem
+# - resume: orgnr som ligger kvar i results (redan mergade är inte längre due i pick_targets)
+#
+# Användning (samma gränssnitt som DoneWriter):
+#   sink = DbSink(SINK_DIR, QUEUE_KIND, SHARD_ID)
+#   with open_writer(OUT_PATH, sink) as out_f:
+#       out_f.write_row(row)
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from companies.apply.apply_out_shards_to_db import BULK_SPECS
+from companies.shards.shared.columnar_out import ColumnarWriter
+from companies.shards.shared.done_index import DoneIndex, DoneWriter
+
+DEFAULT_SINK_DIR = Path("data/out/sinkdb")
+COMMIT_EVERY = 200
+COMMIT_SEC = 5.0
+BUSY_TIMEOUT_MS = 30_000
+
+
+def sink_path(sink_dir: Path, kind: str, shard_id: int) -> Path:
+    return Path(sink_dir) / f"{kind}_shard{shard_id}.sqlite"
+
+
+def connect_sink(path: Path, kind: str) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path.as_posix())
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    # Kommentar: AUTOINCREMENT => seq återanvänds aldrig efter att mergern raderat (radordning = skrivordning)
+    cols = BULK_SPECS[kind].columns()
+    cols[0] = "seq INTEGER PRIMARY KEY AUTOINCREMENT"
+    conn.execute(f"CREATE TABLE IF NOT EXISTS results ({', '.join(cols)})")
+    conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('kind', ?)", (kind,))
+    conn.commit()
+    return conn
+
+
+class DbSink:
+    def __init__(self, sink_dir: Path, kind: str, shard_id: int) -> None:
+        self.kind = kind
+        self.spec = BULK_SPECS[kind]
+        self.path = sink_path(sink_dir, kind, shard_id)
+        self.conn: Optional[sqlite3.Connection] = connect_sink(self.path, kind)
+        n = len(self.spec.fields) + 3
+        self._insert_sql = f"INSERT INTO results VALUES (NULL, {', '.join(['?'] * n)})"
+        self._batch: list[tuple] = []
+        self._last_commit = time.monotonic()
+        # Kommentar: anropas efter varje commit (work_queue.queue_writer sätter done då)
+        self.checkpoint_hooks: list[Callable[[], None]] = []
+
+    def load(self) -> set[str]:
+        return {r[0] for r in self.conn.execute("SELECT DISTINCT orgnr FROM results")}
+
+    def __enter__(self) -> "DbSink":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write_row(self, row: dict) -> None:
+        staged = self.spec.parse(row)
+        if staged is None:
+            return
+        self._batch.append(staged)
+        if len(self._batch) >= COMMIT_EVERY or time.monotonic() - self._last_commit >= COMMIT_SEC:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._batch:
+            self.conn.executemany(self._insert_sql, self._batch)
+            self.conn.commit()
+            self._batch.clear()
+        self._last_commit = time.monotonic()
+        for hook in self.checkpoint_hooks:
+            hook()
+
+    def close(self) -> None:
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+
+
+def open_writer(out_path: Path, sink: Optional[DbSink], columnar: bool = False) -> Union[DbSink, ColumnarWriter, DoneWriter]:
+    # Kommentar: sink-läge, kolumnsegment (--columnar) eller NDJSON + done-index som förut
+    if sink is not None:
+        return sink
+    if columnar:
+        return ColumnarWriter(out_path)
+    return DoneIndex(out_path).writer()
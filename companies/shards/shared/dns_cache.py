@@ -0,0 +1,202 @@
+# companies/shards/shared/dns_cache.py
+# Persistent DNS-svarscache (SQLite) + delad resolver för tech footprint och domain reputation
+# - cachar svar per (namn, typ) så länge TTL:en i svaret gäller (rerun efter REFRESH_DAYS frågar bara om utgångna)
+# - negativa svar (NXDOMAIN / NoAnswer) cachas också, TTL från SOA i authority (RFC 2308) annars NEGATIVE_TTL_SEC
+# - timeout cachas aldrig och bubblar upp som dns.exception.Timeout (tech skriver ingen rad då)
+# - SERVFAIL/NoNameservers => tomt svar, cachas inte
+# - trådsäker (tech kör lookups i asyncio.to_thread)
+#
+# Användning:
+#   dns_res = CachedResolver()
+#   dns_res.txt("acme.se")  -> ["v=spf1 include:spf.protection.outlook.com -all", ...]
+#   dns_res.mx("acme.se")   -> ["acme-se.mail.protection.outlook.com"]
+#   dns_res.a("2.0.0.127.zen.spamhaus.org") -> ["127.0.0.2"]
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import dns.exception
+import dns.rdatatype
+import dns.resolver
+
+DEFAULT_DNS_CACHE_PATH = Path("data/cache/dns_cache.sqlite")
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_LIFETIME = 3.0
+NEGATIVE_TTL_SEC = 3600
+MIN_TTL_SEC = 60
+MAX_TTL_SEC = 7 * 24 * 3600
+BUSY_TIMEOUT_MS = 10_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dns_answers (
+    name        TEXT NOT NULL,
+    rdtype      TEXT NOT NULL,
+    status      TEXT NOT NULL,          -- ok | nxdomain | noanswer
+    records     TEXT NOT NULL,          -- JSON-lista med strängar
+    fetched_at  REAL NOT NULL,
+    expires_at  REAL NOT NULL,
+    PRIMARY KEY (name, rdtype)
+);
+"""
+
+
+@dataclass
+class DnsAnswer:
+    status: str              # ok | nxdomain | noanswer | servfail
+    records: list[str]
+    cached: bool = False
+
+
+def _norm_name(name: str) -> str:
+    return (name or "").strip().lower().rstrip(".")
+
+
+def _rdata_to_str(rdtype: str, rdata) -> str:
+    if rdtype == "TXT":
+        parts = []
+        for p in getattr(rdata, "strings", []) or []:
+            try:
+                parts.append(p.decode("utf-8", "ignore"))
+            except Exception:
+                parts.append(str(p))
+        return "".join(parts) if parts else str(rdata).strip().strip('"')
+    if rdtype == "MX":
+        return str(rdata.exchange).rstrip(".").lower()
+    return str(rdata).rstrip(".")
+
+
+def _negative_ttl(response, default: float) -> float:
+    # Kommentar: RFC 2308 – min(SOA TTL, SOA minimum) från authority-sektionen
+    try:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return float(min(rrset.ttl, rrset[0].minimum))
+    except Exception:
+        pass
+    return default
+
+
+class CachedResolver:
+    def __init__(
+        self,
+        db_path: Path = DEFAULT_DNS_CACHE_PATH,
+        *,
+        timeout: float = DEFAULT_TIMEOUT,
+        lifetime: float = DEFAULT_LIFETIME,
+        negative_ttl: float = NEGATIVE_TTL_SEC,
+        min_ttl: float = MIN_TTL_SEC,
+        max_ttl: float = MAX_TTL_SEC,
+    ) -> None:
+        self.resolver = dns.resolver.Resolver(configure=True)
+        self.resolver.timeout = timeout
+        self.resolver.lifetime = lifetime
+        self.negative_ttl = negative_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path.as_posix(), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        self.conn.executescript(SCHEMA)
+
+        self.hits = 0
+        self.queries = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    def _clamp(self, ttl: float) -> float:
+        return max(self.min_ttl, min(self.max_ttl, float(ttl)))
+
+    def _get_cached(self, name: str, rdtype: str) -> Optional[DnsAnswer]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT status, records, expires_at FROM dns_answers WHERE name = ? AND rdtype = ?",
+                (name, rdtype),
+            ).fetchone()
+        if row is None or row[2] <= time.time():
+            return None
+        return DnsAnswer(status=row[0], records=json.loads(row[1]), cached=True)
+
+    def _store(self, name: str, rdtype: str, ans: DnsAnswer, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO dns_answers(name, rdtype, status, records, fetched_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (name, rdtype, ans.status, json.dumps(ans.records), now, now + self._clamp(ttl)),
+            )
+
+    def resolve(self, name: str, rdtype: str) -> DnsAnswer:
+        """
+        Cachad lookup. Kastar dns.exception.Timeout vid timeout (cachas inte).
+        """
+        name = _norm_name(name)
+        rdtype = rdtype.upper()
+        if not name:
+            return DnsAnswer(status="nxdomain", records=[])
+
+        cached = self._get_cached(name, rdtype)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.queries += 1
+        try:
+            answers = self.resolver.resolve(name, rdtype)
+            ans = DnsAnswer(status="ok", records=[_rdata_to_str(rdtype, r) for r in answers])
+            ttl = answers.rrset.ttl if answers.rrset is not None else self.negative_ttl
+        except dns.resolver.NXDOMAIN as e:
+            ans = DnsAnswer(status="nxdomain", records=[])
+            try:
+                resp = e.response(e.qnames()[0])
+            except Exception:
+                resp = None
+            ttl = _negative_ttl(resp, self.negative_ttl) if resp is not None else self.negative_ttl
+        except dns.resolver.NoAnswer as e:
+            ans = DnsAnswer(status="noanswer", records=[])
+            try:
+                resp = e.response()
+            except Exception:
+                resp = None
+            ttl = _negative_ttl(resp, self.negative_ttl) if resp is not None else self.negative_ttl
+        except dns.resolver.NoNameservers:
+            return DnsAnswer(status="servfail", records=[])
+
+        try:
+            self._store(name, rdtype, ans, ttl)
+        except sqlite3.Error:
+            # Kommentar: cachen är best effort
+            pass
+        return ans
+
+    def txt(self, name: str) -> list[str]:
+        return self.resolve(name, "TXT").records
+
+    def mx(self, name: str) -> list[str]:
+        return self.resolve(name, "MX").records
+
+    def a(self, name: str) -> list[str]:
+        return self.resolve(name, "A").records
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self.conn.execute("DELETE FROM dns_answers WHERE expires_at <= ?", (time.time(),))
+            return cur.rowcount
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "queries": self.queries}
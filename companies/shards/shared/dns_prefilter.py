@@ -0,0 +1,119 @@
+# companies/shards/shared/dns_prefilter.py
+# Async DNS-förfiltrering innan HTTP-probes (website-gissaren)
+# - de flesta domänkandidater finns inte => en billig A/AAAA-fråga i stället för HEAD + DNS-miss
+# - batchat: alla kandidater för ett bolag frågas samtidigt (globalt tak på antal frågor i luften)
+# - positiv/negativ cache i minnet (positiv enligt TTL i svaret, negativ NEGATIVE_TTL_SEC)
+# - bara NXDOMAIN / inga adresser släpps; timeout/SERVFAIL => behåll kandidaten (HTTP får avgöra)
+# - nameservers/port kan pekas mot en lokal stub-resolver
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Iterable, Optional
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+
+DEFAULT_CONCURRENCY = 200
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_LIFETIME = 3.0
+NEGATIVE_TTL_SEC = 3600
+MIN_POSITIVE_TTL_SEC = 300
+MAX_CACHE_ENTRIES = 500_000
+
+
+class DnsPrefilter:
+    """
+    pre = DnsPrefilter()
+    domains = await pre.filter(["acme.se", "www.acme.se", "acme.com", ...])   # NXDOMAIN bortplockade
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        nameservers: Optional[Iterable[str]] = None,
+        port: int = 53,
+        timeout: float = DEFAULT_TIMEOUT,
+        lifetime: float = DEFAULT_LIFETIME,
+        negative_ttl: float = NEGATIVE_TTL_SEC,
+    ) -> None:
+        if nameservers:
+            res = dns.asyncresolver.Resolver(configure=False)
+            res.nameservers = list(nameservers)
+            res.port = port
+        else:
+            res = dns.asyncresolver.Resolver(configure=True)
+        res.timeout = timeout
+        res.lifetime = lifetime
+        self.resolver = res
+
+        self.negative_ttl = negative_ttl
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._cache: dict[str, tuple[bool, float]] = {}   # host -> (finns, expires_at)
+        self._inflight: dict[str, asyncio.Task] = {}
+
+        self.lookups = 0
+        self.cache_hits = 0
+        self.dropped = 0
+
+    def _remember(self, host: str, exists: bool, ttl: float) -> None:
+        if len(self._cache) >= MAX_CACHE_ENTRIES:
+            now = time.monotonic()
+            self._cache = {h: v for h, v in self._cache.items() if v[1] > now}
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                self._cache.clear()
+        self._cache[host] = (exists, time.monotonic() + ttl)
+
+    async def _lookup(self, host: str) -> bool:
+        async with self._sem:
+            self.lookups += 1
+            for rdtype in ("A", "AAAA"):
+                try:
+                    ans = await self.resolver.resolve(host, rdtype)
+                    ttl = ans.rrset.ttl if ans.rrset is not None else 0
+                    self._remember(host, True, max(MIN_POSITIVE_TTL_SEC, ttl))
+                    return True
+                except dns.resolver.NXDOMAIN:
+                    self._remember(host, False, self.negative_ttl)
+                    return False
+                except dns.resolver.NoAnswer:
+                    continue
+                except dns.exception.DNSException:
+                    # Kommentar: timeout/SERVFAIL/NoNameservers => osäkert, behåll och cacha inte
+                    return True
+
+            # Kommentar: namnet finns men har varken A eller AAAA => går inte att ansluta till
+            self._remember(host, False, self.negative_ttl)
+            return False
+
+    async def exists(self, host: str) -> bool:
+        host = (host or "").strip().lower().rstrip(".")
+        if not host:
+            return False
+
+        hit = self._cache.get(host)
+        if hit is not None and hit[1] > time.monotonic():
+            self.cache_hits += 1
+            return hit[0]
+
+        task = self._inflight.get(host)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(host))
+            self._inflight[host] = task
+            task.add_done_callback(lambda _t, h=host: self._inflight.pop(h, None))
+        return await asyncio.shield(task)
+
+    async def filter(self, hosts: list[str]) -> list[str]:
+        """
+        Behåller ordningen, plockar bort hosts som inte finns i DNS.
+        """
+        flags = await asyncio.gather(*(self.exists(h) for h in hosts))
+        kept = [h for h, ok in zip(hosts, flags) if ok]
+        self.dropped += len(hosts) - len(kept)
+        return kept
+
+    def stats(self) -> dict[str, int]:
+        return {"lookups": self.lookups, "cache_hits": self.cache_hits, "dropped": self.dropped}
@@ -0,0 +1,173 @@
+# companies/shards/shared/done_index.py
+# Resume-index bredvid shard-NDJSON (ersätter att json.loads:a hela OUT-filen vid varje start)
+# - <out>.done       = en orgnr per rad, appendas samtidigt som raden skrivs till NDJSON
+# - <out>.done.meta  = checkpoint {"ndjson_bytes", "done_bytes", "ino"}: så långt är de två filerna i synk
+# - load(): läser .done fram till checkpoint (ingen JSON), tail-scannar bara NDJSON efter checkpoint
+#   (krasch, rader skrivna av äldre kod) och skriver ikapp indexet
+# - NDJSON mindre än checkpoint eller ny inode (roterad/trunkerad) => bygg om indexet från början
+#
+# Användning:
+#   done = DoneIndex(OUT_PATH).load()
+#   with DoneIndex(OUT_PATH).writer() as out_f:
+#       out_f.write_row(row)
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional
+
+CHECKPOINT_EVERY = 500
+
+
+def _orgnr_from_line(line: bytes) -> str:
+    line = line.strip()
+    if not line:
+        return ""
+    try:
+        obj = json.loads(line)
+        return (obj.get("orgnr") or "").strip()
+    except Exception:
+        return ""
+
+
+class DoneIndex:
+    def __init__(self, out_path: Path) -> None:
+        self.out_path = Path(out_path)
+        self.done_path = self.out_path.with_name(self.out_path.name + ".done")
+        self.meta_path = self.out_path.with_name(self.out_path.name + ".done.meta")
+
+    # -------------------------
+    # meta
+    # -------------------------
+    def _read_meta(self) -> tuple[int, int, int]:
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            return int(meta["ndjson_bytes"]), int(meta["done_bytes"]), int(meta.get("ino", 0))
+        except Exception:
+            return (0, 0, 0)
+
+    def _write_meta(self, ndjson_bytes: int, done_bytes: int) -> None:
+        ino = self.out_path.stat().st_ino
+        tmp = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        tmp.write_text(
+            json.dumps({"ndjson_bytes": ndjson_bytes, "done_bytes": done_bytes, "ino": ino}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.meta_path)
+
+    # -------------------------
+    # load
+    # -------------------------
+    def load(self) -> set[str]:
+        done: set[str] = set()
+        if not self.out_path.exists():
+            return done
+
+        st = self.out_path.stat()
+        ndjson_size = st.st_size
+        ndjson_ok, done_ok, ino = self._read_meta()
+        if (
+            not self.done_path.exists()
+            or ino != st.st_ino
+            or ndjson_ok > ndjson_size
+            or done_ok > self.done_path.stat().st_size
+        ):
+            # Kommentar: inget/ogiltigt index => bygg från början (en gång)
+            ndjson_ok, done_ok = 0, 0
+
+        # 1) indexet fram till checkpoint – bara rader, ingen JSON
+        if done_ok:
+            with self.done_path.open("rb") as rf:
+                data = rf.read(done_ok)
+            done.update(x.decode("utf-8") for x in data.split(b"\n") if x)
+
+        if ndjson_ok == ndjson_size:
+            # Kommentar: orgnr efter checkpoint i .done (krasch innan NDJSON flushats) räknas inte
+            if self.done_path.stat().st_size > done_ok:
+                with self.done_path.open("r+b") as wf:
+                    wf.truncate(done_ok)
+            return done
+
+        # 2) tail-scan av NDJSON efter checkpoint (bara hela rader) och skriv ikapp indexet
+        tail: list[str] = []
+        with self.out_path.open("rb") as rf:
+            rf.seek(ndjson_ok)
+            pos = ndjson_ok
+            for line in rf:
+                if not line.endswith(b"\n"):
+                    break
+                pos += len(line)
+                o = _orgnr_from_line(line)
+                if o:
+                    tail.append(o)
+
+        mode = "r+b" if self.done_path.exists() else "wb"
+        with self.done_path.open(mode) as wf:
+            wf.truncate(done_ok)
+            wf.seek(done_ok)
+            if tail:
+                wf.write(("\n".join(tail) + "\n").encode("utf-8"))
+            done_bytes = wf.tell()
+        self._write_meta(pos, done_bytes)
+
+        done.update(tail)
+        return done
+
+    # -------------------------
+    # write
+    # -------------------------
+    def writer(self) -> "DoneWriter":
+        # Kommentar: se till att indexet är ikapp innan vi börjar appenda (annars blir checkpoint fel)
+        self.load()
+        return DoneWriter(self)
+
+
+class DoneWriter:
+    """
+    Appendar rader till NDJSON + orgnr till .done. Checkpoint var CHECKPOINT_EVERY rad och vid close.
+    """
+
+    def __init__(self, index: DoneIndex) -> None:
+        self.index = index
+        index.out_path.parent.mkdir(parents=True, exist_ok=True)
+        # Kommentar: binärt så tell() är exakta byte-offsets för checkpoint
+        self._out: Optional[BinaryIO] = index.out_path.open("ab")
+        self._done: Optional[BinaryIO] = index.done_path.open("ab")
+        self._since = 0
+        # Kommentar: anropas efter varje checkpoint (work_queue.queue_writer sätter done då)
+        self.checkpoint_hooks: list[Callable[[], None]] = []
+
+    def __enter__(self) -> "DoneWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write_row(self, row: dict) -> None:
+        self._out.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+        o = (row.get("orgnr") or "").strip()
+        if o:
+            self._done.write((o + "\n").encode("utf-8"))
+        self._since += 1
+        if self._since >= CHECKPOINT_EVERY:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        # Kommentar: NDJSON flushas först – checkpoint pekar aldrig förbi data som inte finns på disk
+        self._out.flush()
+        self._done.flush()
+        self.index._write_meta(self._out.tell(), self._done.tell())
+        self._since = 0
+        for hook in self.checkpoint_hooks:
+            hook()
+
+    def close(self) -> None:
+        if self._out is None:
+            return
+        self.checkpoint()
+        self._out.close()
+        self._done.close()
+        self._out = None
+        self._done = None
@@ -0,0 +1,496 @@
+# companies/shards/shared/fetch.py
+# Gemensam asyncio-fetchmotor för alla crawler-shards (ersätter requests.Session-kopiorna)
+# - begränsat antal samtidiga anslutningar totalt (max_connections)
+# - per-host politeness: max antal samtidiga anslutningar mot samma host (per_host)
+#   + valfri PolitenessScheduler (token bucket per domän, spärr vid 403/429)
+# - valfri PageCache: GET läses genom delad on-disk cache (en sida hämtas en gång för alla shards)
+# - samma fel-taxonomi som shards haft: "" | "403" | "429" | "timeout" | "other"
+#   (retryable statuskoder 5xx kommer tillbaka som str(status), precis som förut)
+# - run_bounded(): kör många targets samtidigt med tak, så en process kan ha hundratals domäner i luften
+# - stop=: predikat som får varje avkodad textbit medan bodyn läses; True => avbryt nedladdningen
+#   (beslutet är redan slutgiltigt – sparar bytes och släpper anslutningen tidigare)
+#   stop_encoding = samma encoding som anroparen sen avkodar bodyn med (fetch_html: HTML_TEXT_ENCODING),
+#   annars kan predikatet se annan text än den som klassas
+# - html_only=: content-type kollas innan bodyn läses – PDF/bilder osv. laddas aldrig ner och cachas inte
+#   (som requests-versionerna av tech/web gjorde)
+# - anslutningspool: total/per-host-tak, keep-alive (flera sidor från samma bolagshost över samma TLS-anslutning),
+#   ett SSL-context per process och räknare för ny/återanvänd anslutning (conn_stats, skrivs ut vid stängning)
+#   Kommentar: aiohttp pratar bara HTTP/1.1 – ingen HTTP/2-multiplexing; per_host + keep-alive ger samma effekt
+#   för våra få sidor per host. TLS-session-resumption stöds inte av aiohttp (inget session= till ssl), så
+#   återanvänd anslutning är enda sättet att slippa handskakningen.
+
+from __future__ import annotations
+
+import asyncio
+import codecs
+import re
+import sqlite3
+import ssl
+from collections import Counter
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from companies.shards.shared.page_cache import CachedPage, PageCache
+from companies.shards.shared.politeness import PolitenessScheduler
+
+DEFAULT_MAX_CONNECTIONS = 200
+DEFAULT_PER_HOST = 2
+DEFAULT_CONNECT_TIMEOUT = 3
+DEFAULT_READ_TIMEOUT = 12
+# Kommentar: fetch_html avkodar alltid som UTF-8 (som shardsen gjort sedan requests-tiden)
+HTML_TEXT_ENCODING = "utf-8"
+DEFAULT_KEEPALIVE_SEC = 30   # Kommentar: aiohttp-default är 15 s – undersidor kommer ofta senare pga politeness
+DEFAULT_DNS_TTL_SEC = 300
+READ_CHUNK = 32_768
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def normalize_url(u: str) -> str:
+    u = (u or "").strip()
+    if not u:
+        return ""
+    if not u.startswith("http://") and not u.startswith("https://"):
+        u = "https://" + u
+    return u
+
+
+def valid_hostname(host: str) -> bool:
+    if not host:
+        return False
+    host = host.strip().lower().rstrip(".")
+    if len(host) > 253:
+        return False
+    if any(c.isspace() for c in host):
+        return False
+    if ".." in host:
+        return False
+    labels = host.split(".")
+    if len(labels) < 2:
+        return False
+    for lab in labels:
+        if not lab or len(lab) > 63:
+            return False
+        if lab.startswith("-") or lab.endswith("-"):
+            return False
+        if not re.fullmatch(r"[a-z0-9-]+", lab):
+            return False
+    return True
+
+
+def safe_url(url: str) -> bool:
+    try:
+        u = (url or "").strip()
+        if not u:
+            return False
+        parts = urlsplit(u)
+        if parts.scheme not in ("http", "https"):
+            return False
+        return valid_hostname(parts.hostname or "")
+    except Exception:
+        return False
+
+
+def is_retryable_status(code: int) -> bool:
+    # Kommentar: "problem status" – vi retryar dem inte, men vill kunna särskilja dem
+    return code in (403, 429, 500, 502, 503, 504)
+
+
+def is_dns_miss_error(e: BaseException) -> bool:
+    dns_err = getattr(aiohttp, "ClientConnectorDNSError", None)
+    if dns_err is not None and isinstance(e, dns_err):
+        return True
+    msg = str(e).lower()
+    return (
+        "name or service not known" in msg
+        or "failed to resolve" in msg
+        or "nodename nor servname" in msg
+        or "temporary failure in name resolution" in msg
+        or "getaddrinfo failed" in msg
+    )
+
+
+def looks_like_html(content_type: str) -> bool:
+    ct = (content_type or "").lower()
+    return ("text/html" in ct) or ("application/xhtml" in ct) or ct.startswith("text/")
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int = 0
+    content_type: str = ""
+    charset: Optional[str] = None
+    body: bytes = b""
+    err: str = ""          # "" | "403" | "429" | "5xx" | "timeout" | "other"
+    dns_miss: bool = False
+    stopped: bool = False  # stop-predikatet avbröt läsningen (body = det som hunnit läsas)
+
+    @property
+    def ok(self) -> bool:
+        return (not self.err) and 200 <= self.status < 400
+
+    @property
+    def is_html(self) -> bool:
+        return looks_like_html(self.content_type)
+
+    def text(self, encoding: Optional[str] = None) -> str:
+        enc = encoding or self.charset or "utf-8"
+        try:
+            return self.body.decode(enc, errors="ignore")
+        except LookupError:
+            return self.body.decode("utf-8", errors="ignore")
+
+
+def header_encoding(res: FetchResult) -> str:
+    """
+    Samma regel som requests r.encoding: charset i Content-Type, annars ISO-8859-1 för text/*, annars utf-8.
+    """
+    if res.charset:
+        return res.charset
+    if "text" in (res.content_type or "").lower():
+        return "ISO-8859-1"
+    return "utf-8"
+
+
+_SSL_CONTEXT: Optional[ssl.SSLContext] = None
+
+
+def shared_ssl_context() -> ssl.SSLContext:
+    # Kommentar: CA-lagret laddas en gång per process, delas av alla Fetcher-instanser
+    global _SSL_CONTEXT
+    if _SSL_CONTEXT is None:
+        _SSL_CONTEXT = ssl.create_default_context()
+    return _SSL_CONTEXT
+
+
+def _conn_trace(stats: Counter) -> aiohttp.TraceConfig:
+    tc = aiohttp.TraceConfig()
+
+    async def _count(key: str) -> None:
+        stats[key] += 1
+
+    async def on_request_start(_s, _ctx, _p) -> None:
+        await _count("requests")
+
+    async def on_new(_s, _ctx, _p) -> None:
+        await _count("conn_new")
+
+    async def on_reuse(_s, _ctx, _p) -> None:
+        await _count("conn_reused")
+
+    async def on_queued(_s, _ctx, _p) -> None:
+        await _count("conn_queued")
+
+    tc.on_request_start.append(on_request_start)
+    tc.on_connection_create_end.append(on_new)
+    tc.on_connection_reuseconn.append(on_reuse)
+    tc.on_connection_queued_start.append(on_queued)
+    return tc
+
+
+class Fetcher:
+    """
+    Async HTTP-klient för shards. Används som:
+        async with Fetcher(user_agent) as f:
+            res = await f.get(url, max_bytes=400_000)
+    """
+
+    def __init__(
+        self,
+        user_agent: str,
+        *,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        per_host: int = DEFAULT_PER_HOST,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        headers: Optional[dict[str, str]] = None,
+        scheduler: Optional[PolitenessScheduler] = None,
+        cache: Optional[PageCache] = None,
+        keepalive_sec: float = DEFAULT_KEEPALIVE_SEC,
+    ) -> None:
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.keepalive_sec = keepalive_sec
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.headers = {"User-Agent": user_agent}
+        if headers:
+            self.headers.update(headers)
+        self.scheduler = scheduler
+        self.cache = cache
+        self.conn_stats: Counter = Counter()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "Fetcher":
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=DEFAULT_DNS_TTL_SEC,
+            keepalive_timeout=self.keepalive_sec,
+            ssl=shared_ssl_context(),
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            trace_configs=[_conn_trace(self.conn_stats)],
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            if self.conn_stats["requests"]:
+                print(self.conn_summary())
+
+    def conn_summary(self) -> str:
+        st = self.conn_stats
+        opened = st["conn_new"] + st["conn_reused"]
+        reuse = 100.0 * st["conn_reused"] / opened if opened else 0.0
+        return (
+            f"[fetch] requests={st['requests']} conn_new={st['conn_new']} conn_reused={st['conn_reused']} "
+            f"({reuse:.0f}% återanvända) queued={st['conn_queued']}"
+        )
+
+    def _timeout(self, read_timeout: Optional[float], connect_timeout: Optional[float]) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout if connect_timeout is not None else self.connect_timeout,
+            sock_read=read_timeout if read_timeout is not None else self.read_timeout,
+        )
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        max_bytes: int = 0,
+        read_timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        stop: Optional[Callable[[str], bool]] = None,
+        stop_encoding: Optional[str] = None,
+        html_only: bool = False,
+    ) -> FetchResult:
+        """
+        Kör en request och läser max max_bytes av bodyn (0 = läs ingen body).
+        stop(text) anropas med varje ny avkodad bit (inte hela texten); True => sluta läsa, res.stopped = True.
+        Bitarna avkodas med stop_encoding (None = svarets charset, annars UTF-8).
+        html_only = returnera utan body (och utan cache-skrivning) om svaret inte ser ut som HTML.
+        Kastar aldrig – alla fel mappas till FetchResult.err.
+        """
+        res = FetchResult(url=url)
+        if not safe_url(url):
+            res.err = "other"
+            return res
+        if self._session is None:
+            raise RuntimeError("Fetcher används utanför 'async with'")
+
+        cached: Optional[CachedPage] = None
+        use_cache = self.cache is not None and method == "GET" and max_bytes > 0
+        if use_cache:
+            # Kommentar: färsk träff => ingen request alls (räknas inte mot politeness)
+            cached = await self._cache_call(self.cache.get, url, max_bytes)
+            if cached is not None and cached.fresh:
+                return _from_cache(url, cached)
+
+        if self.scheduler is not None:
+            # Kommentar: väntar på token för domänen; spärrad domän => samma fel direkt utan request
+            blocked = await self.scheduler.acquire(url)
+            if blocked:
+                res.err = blocked
+                return res
+
+        try:
+            async with self._session.request(
+                method,
+                url,
+                allow_redirects=True,
+                timeout=self._timeout(read_timeout, connect_timeout),
+                headers=cached.conditional_headers() if cached is not None else None,
+            ) as r:
+                if r.status == 304 and cached is not None:
+                    await self._cache_call(self.cache.mark_revalidated, url)
+                    return _from_cache(url, cached)
+
+                res.status = r.status
+                res.content_type = r.headers.get("Content-Type", "") or ""
+                res.charset = r.charset
+
+                if self.scheduler is not None:
+                    self.scheduler.report(url, r.status)
+
+                if is_retryable_status(r.status):
+                    res.err = str(r.status)
+                    if use_cache:
+                        await self._store(url, res, r, truncated=False)
+                    return res
+
+                if html_only and not looks_like_html(res.content_type):
+                    # Kommentar: anroparen svarar ändå not_html – läs inte bodyn
+                    return res
+
+                truncated = False
+                if max_bytes > 0 and 200 <= r.status < 400:
+                    decoder = _incremental_decoder(stop_encoding or res.charset) if stop is not None else None
+                    buf = bytearray()
+                    while len(buf) < max_bytes:
+                        chunk = await r.content.read(min(READ_CHUNK, max_bytes - len(buf)))
+                        if not chunk:
+                            break
+                        buf.extend(chunk)
+                        if decoder is not None and stop(decoder.decode(chunk)):
+                            # Kommentar: resten lämnas oläst – aiohttp stänger anslutningen när vi går ur blocket
+                            res.stopped = True
+                            break
+                    res.body = bytes(buf)
+                    truncated = res.stopped or (len(buf) >= max_bytes and not r.content.at_eof())
+                if use_cache:
+                    await self._store(url, res, r, truncated=truncated)
+                return res
+
+        except asyncio.TimeoutError:
+            res.err = "timeout"
+        except (aiohttp.InvalidURL, ValueError):
+            res.err = "other"
+        except aiohttp.ClientError as e:
+            res.dns_miss = is_dns_miss_error(e)
+            res.err = "other"
+        except OSError as e:
+            res.dns_miss = is_dns_miss_error(e)
+            res.err = "other"
+        return res
+
+    async def _cache_call(self, fn: Callable[..., T], *args, **kwargs) -> Optional[T]:
+        """
+        Cache-anrop i en tråd (SQLite/zlib/blob-IO blockerar inte event-loopen).
+        Cachen är best effort – låst index, diskfel osv. blir None (= miss / ingen skrivning), aldrig ett undantag.
+        """
+        try:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        except (OSError, sqlite3.Error):
+            return None
+
+    async def _store(self, url: str, res: FetchResult, r: aiohttp.ClientResponse, *, truncated: bool) -> None:
+        await self._cache_call(
+            self.cache.put,
+            url,
+            status=res.status,
+            content_type=res.content_type,
+            charset=res.charset,
+            body=res.body,
+            truncated=truncated,
+            etag=r.headers.get("ETag", "") or "",
+            last_modified=r.headers.get("Last-Modified", "") or "",
+        )
+
+    async def get(self, url: str, *, max_bytes: int, **kw) -> FetchResult:
+        return await self.request("GET", url, max_bytes=max_bytes, **kw)
+
+    async def head(self, url: str, **kw) -> FetchResult:
+        return await self.request("HEAD", url, max_bytes=0, **kw)
+
+
+def _incremental_decoder(charset: Optional[str]) -> codecs.IncrementalDecoder:
+    # Kommentar: multibyte-tecken som delas mellan chunkar avkodas först när resten kommit
+    try:
+        return codecs.getincrementaldecoder(charset or "utf-8")(errors="ignore")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="ignore")
+
+
+def _from_cache(url: str, cached: CachedPage) -> FetchResult:
+    res = FetchResult(
+        url=url,
+        status=cached.status,
+        content_type=cached.content_type,
+        charset=cached.charset,
+        body=cached.body,
+    )
+    if is_retryable_status(cached.status):
+        res.err = str(cached.status)
+    return res
+
+
+async def fetch_html(
+    fetcher: Fetcher,
+    url: str,
+    *,
+    max_bytes: int,
+    stop: Optional[Callable[[str], bool]] = None,
+) -> tuple[Optional[str], str]:
+    """
+    Returns (html_text_or_none, err_reason)
+    err_reason: "" | "403" | "429" | "timeout" | "other" | "not_html"
+    Kommentar: samma semantik som tech/web_review/hiring/line_of_work haft (DNS-miss => "other")
+    stop: se Fetcher.request – html är då bara början av sidan
+    """
+    if not safe_url(url):
+        return (None, "other")
+
+    stop_kw = {"stop": stop, "stop_encoding": HTML_TEXT_ENCODING} if stop is not None else {}
+    r = await fetcher.get(url, max_bytes=max_bytes, html_only=True, **stop_kw)
+    if r.err:
+        return (None, r.err)
+
+    if not (200 <= r.status < 400):
+        return (None, "other")
+
+    if not r.is_html:
+        return (None, "not_html")
+
+    return (r.text(HTML_TEXT_ENCODING), "")
+
+
+async def run_bounded(
+    items: Iterable[T] | AsyncIterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: int,
+) -> AsyncIterator[R]:
+    """
+    Kör worker(item) för alla items med max `concurrency` samtidigt.
+    Yield:ar resultaten i den ordning de blir klara (inte input-ordning).
+    Skapar aldrig fler tasks än concurrency (viktigt vid 300k targets).
+    items får vara en async-iterator (QueueWorker.targets claimar i tråd medan tasks kör).
+    """
+    ait = items.__aiter__() if hasattr(items, "__aiter__") else None
+    it = iter(items) if ait is None else None
+    pending: set[asyncio.Task] = set()
+
+    async def _next() -> tuple[bool, Optional[T]]:
+        if ait is not None:
+            try:
+                return (True, await ait.__anext__())
+            except StopAsyncIteration:
+                return (False, None)
+        try:
+            return (True, next(it))
+        except StopIteration:
+            return (False, None)
+
+    async def _fill() -> None:
+        while len(pending) < concurrency:
+            ok, item = await _next()
+            if not ok:
+                return
+            pending.add(asyncio.ensure_future(worker(item)))
+
+    try:
+        await _fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                pending.discard(t)
+                yield t.result()
+            await _fill()
+    finally:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if ait is not None and hasattr(ait, "aclose"):
+            await ait.aclose()
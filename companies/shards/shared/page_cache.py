@@ -0,0 +1,322 @@
+# companies/shards/shared/page_cache.py
+# Delad on-disk sidcache för alla enrichment-shards (emails, tech, web_review, hiring, line_of_work)
+# - nyckel = normaliserad URL, body lagras content-addressed (sha256) och zlib-komprimerad
+# - TTL: färsk sida serveras direkt, gammal sida revalideras med ETag/Last-Modified (304 => återanvänd)
+# - storleksbegränsad: LRU-eviction på last_access när totalstorleken går över max_bytes
+# - 4xx (inkl. 403/429) cachas kort så nästa shard inte triggar samma WAF igen; 5xx/timeout cachas aldrig
+# - index i SQLite (WAL) så flera shard-processer kan dela samma cache
+# - trådsäker (en lås per instans): Fetcher kör get/put/mark_revalidated i asyncio.to_thread, inte på event-loopen
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_CACHE_DIR = Path("data/cache/pages")
+DEFAULT_TTL_SEC = 3 * 24 * 3600
+DEFAULT_NEGATIVE_TTL_SEC = 6 * 3600
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+EVICT_CHECK_EVERY = 500
+EVICT_TARGET_RATIO = 0.90
+BUSY_TIMEOUT_MS = 1_000  # Kommentar: kort – låst index = miss/hoppa över skrivning, inte en väntande crawl
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url_key       TEXT PRIMARY KEY,
+    status        INTEGER NOT NULL,
+    content_type  TEXT,
+    charset       TEXT,
+    etag          TEXT,
+    last_modified TEXT,
+    body_sha      TEXT,
+    body_len      INTEGER NOT NULL DEFAULT 0,
+    truncated     INTEGER NOT NULL DEFAULT 0,
+    fetched_at    REAL NOT NULL,
+    last_access   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages(last_access);
+CREATE INDEX IF NOT EXISTS idx_pages_body_sha ON pages(body_sha);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha   TEXT PRIMARY KEY,
+    size  INTEGER NOT NULL
+);
+"""
+
+
+def normalize_url_key(url: str) -> str:
+    """
+    https://WWW.Acme.se:443/Om-Oss/?b=2&a=1#x -> https://www.acme.se/Om-Oss?a=1&b=2
+    (path behåller case, host/scheme lowercas, default-port/fragment/trailing slash bort, query sorteras)
+    """
+    parts = urlsplit((url or "").strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower().rstrip(".")
+    port = parts.port
+    netloc = host
+    if port and not ((scheme == "https" and port == 443) or (scheme == "http" and port == 80)):
+        netloc = f"{host}:{port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def _locked(fn):
+    # Kommentar: en anslutning delas mellan trådar => ett anrop i taget (put/evict är flera satser)
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+@dataclass
+class CachedPage:
+    status: int
+    content_type: str
+    charset: Optional[str]
+    etag: str
+    last_modified: str
+    body: bytes
+    truncated: bool
+    fresh: bool
+
+    def conditional_headers(self) -> dict[str, str]:
+        h: dict[str, str] = {}
+        if self.etag:
+            h["If-None-Match"] = self.etag
+        if self.last_modified:
+            h["If-Modified-Since"] = self.last_modified
+        return h
+
+
+class PageCache:
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        *,
+        ttl_sec: float = DEFAULT_TTL_SEC,
+        negative_ttl_sec: float = DEFAULT_NEGATIVE_TTL_SEC,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        self.dir = Path(cache_dir)
+        self.blob_dir = self.dir / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_sec = ttl_sec
+        self.negative_ttl_sec = negative_ttl_sec
+        self.max_bytes = max_bytes
+
+        self.conn = sqlite3.connect((self.dir / "index.sqlite").as_posix(), isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        self.conn.executescript(SCHEMA)
+
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # -------------------------
+    # blobs
+    # -------------------------
+    def _blob_path(self, sha: str) -> Path:
+        return self.blob_dir / sha[:2] / sha
+
+    def _write_blob(self, body: bytes) -> tuple[str, int]:
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(sha)
+        if path.exists():
+            return sha, path.stat().st_size
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = zlib.compress(body, 3)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return sha, len(data)
+
+    def _read_blob(self, sha: str) -> Optional[bytes]:
+        try:
+            return zlib.decompress(self._blob_path(sha).read_bytes())
+        except (OSError, zlib.error):
+            return None
+
+    # -------------------------
+    # API
+    # -------------------------
+    @_locked
+    def get(self, url: str, max_bytes: int) -> Optional[CachedPage]:
+        """
+        Returnerar cachad sida (färsk eller gammal men revaliderbar), annars None.
+        En trunkerad body som är kortare än max_bytes räknas som miss (anroparen vill ha mer).
+        """
+        key = normalize_url_key(url)
+        row = self.conn.execute(
+            """
+            SELECT status, content_type, charset, etag, last_modified, body_sha, body_len, truncated, fetched_at
+            FROM pages WHERE url_key = ?
+            """,
+            (key,),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        status, ctype, charset, etag, last_mod, sha, body_len, truncated, fetched_at = row
+        if truncated and body_len < max_bytes:
+            self.misses += 1
+            return None
+
+        body = b""
+        if sha:
+            body = self._read_blob(sha)
+            if body is None:
+                self.conn.execute("DELETE FROM pages WHERE url_key = ?", (key,))
+                self.misses += 1
+                return None
+
+        now = time.time()
+        ttl = self.ttl_sec if 200 <= status < 400 else self.negative_ttl_sec
+        fresh = (now - fetched_at) < ttl
+        if not fresh and not (etag or last_mod):
+            self.misses += 1
+            return None
+
+        self.conn.execute("UPDATE pages SET last_access = ? WHERE url_key = ?", (now, key))
+        if fresh:
+            self.hits += 1
+        return CachedPage(
+            status=int(status),
+            content_type=ctype or "",
+            charset=charset,
+            etag=etag or "",
+            last_modified=last_mod or "",
+            body=body[:max_bytes] if max_bytes > 0 else b"",
+            truncated=bool(truncated),
+            fresh=fresh,
+        )
+
+    @_locked
+    def mark_revalidated(self, url: str) -> None:
+        # Kommentar: 304 => sidan är oförändrad, ny TTL från nu
+        now = time.time()
+        self.conn.execute(
+            "UPDATE pages SET fetched_at = ?, last_access = ? WHERE url_key = ?",
+            (now, now, normalize_url_key(url)),
+        )
+        self.revalidated += 1
+
+    @_locked
+    def put(
+        self,
+        url: str,
+        *,
+        status: int,
+        content_type: str,
+        charset: Optional[str],
+        body: bytes,
+        truncated: bool,
+        etag: str = "",
+        last_modified: str = "",
+    ) -> None:
+        if status >= 500:
+            return
+
+        sha = None
+        size = 0
+        if body:
+            sha, size = self._write_blob(body)
+
+        now = time.time()
+        self.conn.execute("BEGIN")
+        try:
+            if sha:
+                self.conn.execute("INSERT OR IGNORE INTO blobs(sha, size) VALUES (?, ?)", (sha, size))
+            old = self.conn.execute(
+                "SELECT body_sha FROM pages WHERE url_key = ?", (normalize_url_key(url),)
+            ).fetchone()
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO pages(
+                    url_key, status, content_type, charset, etag, last_modified,
+                    body_sha, body_len, truncated, fetched_at, last_access
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    normalize_url_key(url), int(status), content_type, charset, etag, last_modified,
+                    sha, len(body), 1 if truncated else 0, now, now,
+                ),
+            )
+            orphan = old[0] if old and old[0] and old[0] != sha else None
+            if orphan:
+                self._drop_blob_if_unused(orphan)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        self._puts += 1
+        if self._puts % EVICT_CHECK_EVERY == 0:
+            self.evict()
+
+    def _drop_blob_if_unused(self, sha: str) -> None:
+        used = self.conn.execute("SELECT 1 FROM pages WHERE body_sha = ? LIMIT 1", (sha,)).fetchone()
+        if used:
+            return
+        self.conn.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+        try:
+            self._blob_path(sha).unlink()
+        except OSError:
+            pass
+
+    def total_bytes(self) -> int:
+        return int(self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0])
+
+    @_locked
+    def evict(self) -> int:
+        """
+        LRU-eviction: ta bort minst nyligen använda sidor tills vi är under EVICT_TARGET_RATIO * max_bytes.
+        Returnerar antal borttagna sidor.
+        """
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        removed = 0
+        while total > target:
+            rows = self.conn.execute(
+                "SELECT url_key, body_sha FROM pages ORDER BY last_access ASC LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            self.conn.execute("BEGIN")
+            try:
+                for key, sha in rows:
+                    self.conn.execute("DELETE FROM pages WHERE url_key = ?", (key,))
+                    if sha:
+                        self._drop_blob_if_unused(sha)
+                    removed += 1
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            total = self.total_bytes()
+        return removed
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
@@ -0,0 +1,120 @@
+# companies/shards/shared/refresh_sql.py
+# Refresh-urval + shard direkt i SQL (i stället för SELECT av hela companies + fromisoformat per rad i Python)
+# - due-nyckel per shard: 0 = alltid due (checked_at saknas/ogiltig, tomt värde), annars julianday(checked_at)
+#   => due = nyckel < julianday('now', '-N days') = ett range-scan på ett uttrycksindex, redan i "äldst först"-ordning
+# - samma uttryck används av migrations/add_refresh_due_indexes.py (SQLite matchar uttrycksindex på exakt uttryck,
+#   partial index bara om urvalet har samma WHERE-villkor)
+# - md5_shard(orgnr, total) registreras som SQL-funktion => exakt samma fördelning som in_shard() i sharderna
+# - utan index (migration inte körd) blir det en full scan, men i SQLite och utan datetime-parsning i Python
+#
+# Användning:
+#   cur = select_due(conn, RULES["tech"], "orgnr, name, website, tech_checked_at",
+#                    refresh_days=REFRESH_DAYS, limit=limit, shard=(SHARD_ID, SHARD_TOTAL))
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+TABLE = "companies"
+
+HAS_WEBSITE_SQL = "website IS NOT NULL AND TRIM(website) <> ''"
+
+
+@dataclass(frozen=True)
+class RefreshRule:
+    index: str
+    key: str             # due-nyckel (SQL-uttryck), indexeras som den är
+    where: str = ""      # basvillkor – partial index + samma villkor i urvalet
+
+
+def _due_key(checked_col: str, value_col: Optional[str] = None) -> str:
+    ts = f"COALESCE(julianday({checked_col}), 0)"
+    if value_col is None:
+        return ts
+    # Kommentar: tomt värde => alltid due (som needs_refresh/needs_email_refresh gjorde)
+    return f"CASE WHEN {value_col} IS NULL OR TRIM({value_col}) = '' THEN 0 ELSE {ts} END"
+
+
+# Kommentar: nycklar = QUEUE_KIND i sharderna
+RULES: dict[str, RefreshRule] = {
+    "websites": RefreshRule("idx_companies_due_websites", _due_key("website_checked_at", "website")),
+    "emails": RefreshRule("idx_companies_due_emails", _due_key("emails_checked_at", "emails"), HAS_WEBSITE_SQL),
+    "line_of_work": RefreshRule("idx_companies_due_line_of_work", _due_key("line_of_work_updated_at"), HAS_WEBSITE_SQL),
+    "tech": RefreshRule("idx_companies_due_tech", _due_key("tech_checked_at"), HAS_WEBSITE_SQL),
+    "site_review": RefreshRule("idx_companies_due_site_review", _due_key("site_review_checked_at"), HAS_WEBSITE_SQL),
+    "hiring": RefreshRule("idx_companies_due_hiring", _due_key("hiring_checked_at"), HAS_WEBSITE_SQL),
+    "segment_groups": RefreshRule(
+        "idx_companies_due_segment_groups",
+        _due_key("segment_groups_checked_at", "segment_groups"),
+        "line_of_work IS NOT NULL AND TRIM(line_of_work) <> ''",
+    ),
+}
+
+
+def md5_shard(orgnr: Optional[str], total: int) -> int:
+    if not orgnr or not total:
+        return -1
+    h = hashlib.md5(orgnr.encode("utf-8")).hexdigest()
+    return int(h, 16) % int(total)
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    conn.create_function("md5_shard", 2, md5_shard, deterministic=True)
+
+
+def select_due(
+    conn: sqlite3.Connection,
+    rule: RefreshRule,
+    columns: str,
+    *,
+    refresh_days: Optional[int],
+    limit: Optional[int],
+    shard: Optional[tuple[int, int]] = None,
+) -> sqlite3.Cursor:
+    """
+    Cursor över due-rader (äldst/aldrig kollade först). shard = (shard_id, shard_total) eller None (kö-läge).
+    refresh_days=None => alla rader som uppfyller basvillkoret räknas som due.
+    """
+    where: list[str] = []
+    params: list = []
+    if rule.where:
+        where.append(rule.where)
+    if refresh_days is not None:
+        where.append(f"{rule.key} < julianday('now', ?)")
+        params.append(f"-{int(refresh_days)} days")
+    if shard is not None:
+        register_functions(conn)
+        where.append("md5_shard(orgnr, ?) = ?")
+        params.extend([shard[1], shard[0]])
+
+    sql = f"SELECT {columns} FROM {TABLE}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {rule.key} LIMIT ?"
+    params.append(-1 if limit is None else int(limit))
+    return conn.execute(sql, params)
+
+
+def create_indexes(conn: sqlite3.Connection) -> tuple[list[str], list[str]]:
+    """
+    Skapar due-index för de regler vars kolumner finns. Returnerar (skapade/fanns, hoppade över p.g.a. saknad kolumn).
+    """
+    done: list[str] = []
+    skipped: list[str] = []
+    for name, rule in RULES.items():
+        sql = f"CREATE INDEX IF NOT EXISTS {rule.index} ON {TABLE}({rule.key})"
+        if rule.where:
+            sql += f" WHERE {rule.where}"
+        try:
+            conn.execute(sql)
+        except sqlite3.OperationalError as e:
+            # Kommentar: kolumnen finns inte (migrationen för den sharden inte körd) => hoppa över
+            if "no such column" not in str(e):
+                raise
+            skipped.append(name)
+            continue
+        done.append(rule.index)
+    return done, skipped
@@ -0,0 +1,60 @@
+# companies/shards/shared/site_pages.py
+# Sidmängd per bolag för single-pass crawl (en crawl, flera extractors)
+# - ser ut som en Fetcher (get) så shardernas process_target kan köras oförändrade mot den
+# - varje URL hämtas EN gång per bolag, även om flera extractors ber om den samtidigt
+# - alltid hämtat med största byte-budgeten, varje anrop får en kopia kapad till sin egen max_bytes
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import replace
+
+from companies.shards.shared.fetch import Fetcher, FetchResult
+from companies.shards.shared.page_cache import normalize_url_key
+
+
+class SitePages:
+    """
+    pages = SitePages(fetcher, max_bytes=650_000)
+    r = await pages.get(url, max_bytes=80_000)   # samma FetchResult-semantik som Fetcher.get
+    """
+
+    def __init__(self, fetcher: Fetcher, *, max_bytes: int) -> None:
+        self.fetcher = fetcher
+        self.max_bytes = max_bytes
+        self._pages: dict[str, asyncio.Task] = {}
+        self.requests = 0
+        self.reused = 0
+
+    async def get(self, url: str, *, max_bytes: int, **kw) -> FetchResult:
+        # Kommentar: sidan delas mellan extractors => ingen avbryter läsningen åt de andra (stop ignoreras,
+        # extractorns predikat blir aldrig klart och den kör vidare som vanligt)
+        kw.pop("stop", None)
+        # Kommentar: html_only gäller bara den som frågar – sidan hämtas hel åt alla, kapas per anrop nedan
+        html_only = kw.pop("html_only", False)
+        key = normalize_url_key(url)
+        task = self._pages.get(key)
+        if task is None:
+            # Kommentar: task (inte coroutine) så parallella extractors väntar på samma request
+            task = asyncio.ensure_future(self.fetcher.get(url, max_bytes=max(max_bytes, self.max_bytes), **kw))
+            self._pages[key] = task
+            self.requests += 1
+        else:
+            self.reused += 1
+
+        res = await asyncio.shield(task)
+        if html_only and not res.is_html:
+            return replace(res, url=url, body=b"")
+        if len(res.body) > max_bytes:
+            return replace(res, url=url, body=res.body[:max_bytes])
+        return replace(res, url=url)
+
+    def urls(self) -> list[str]:
+        return list(self._pages.keys())
+
+    async def close(self) -> None:
+        pending = [t for t in self._pages.values() if not t.done()]
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,327 @@
+# companies/shards/shared/work_queue.py
+# Lease-baserad arbetskö för shards (ersätter fast md5(orgnr) % SHARD_TOTAL när man kör med --queue)
+# - work_items i egen SQLite-fil (inte companies-DB:n) – en rad per (kind, orgnr)
+# - workers claimar batchar, förlänger leasen med heartbeat och markerar done/retry per bolag
+# - done sätts först när writerns checkpoint skrivit raden (queue_writer) – dör workern innan dess går leasen ut
+#   och bolaget körs om, i stället för att vara done utan rad i REOPEN_DONE_AFTER_SEC
+# - dör en worker går leasen ut och nästa claim tar över bolagen automatiskt
+# - QueueWorker kör alla kö-skrivningar i tråd (asyncio.to_thread): BEGIN IMMEDIATE kan vänta upp till
+#   BUSY_TIMEOUT_MS när flera workers slåss om kö-filen, och det får inte frysa fetchar/politeness-timers
+# - valfritt antal workers av valfri shard-typ => lastbalansering, lägg till/ta bort workers när som helst
+#
+# status: pending -> leased -> done | retry
+#   retry = timeout (ingen NDJSON-rad), läggs tillbaka som pending vid nästa enqueue (som förut: körs om nästa varv)
+#   done  = öppnas igen vid enqueue först efter REOPEN_DONE_AFTER_SEC (annars dubbeljobb innan apply hunnit köras)
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+DEFAULT_QUEUE_PATH = Path("data/queue/work_queue.sqlite")
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_LEASE_SEC = 15 * 60
+# Kommentar: done-rader som väljs igen efter så här lång tid öppnas på nytt (nästa refresh-varv, apply har körts)
+REOPEN_DONE_AFTER_SEC = 24 * 3600
+BUSY_TIMEOUT_MS = 30_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    kind           TEXT NOT NULL,
+    orgnr          TEXT NOT NULL,
+    payload        TEXT NOT NULL,               -- JSON av shardens target-tuple
+    status         TEXT NOT NULL DEFAULT 'pending',
+    lease_owner    TEXT,
+    lease_expires  REAL,
+    attempts       INTEGER NOT NULL DEFAULT 0,
+    updated_at     REAL NOT NULL,
+    PRIMARY KEY (kind, orgnr)
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_claim ON work_items(kind, status, lease_expires);
+"""
+
+
+def default_owner(kind: str, shard_id: int) -> str:
+    return f"{kind}:{shard_id}:{socket.gethostname()}:{os.getpid()}"
+
+
+def _locked(fn):
+    # Kommentar: anslutningen delas mellan event-loopen och to_thread-trådar => ett anrop i taget
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+class WorkQueue:
+    def __init__(self, db_path: Path = DEFAULT_QUEUE_PATH) -> None:
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path.as_posix(), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS};")
+        self.conn.executescript(SCHEMA)
+
+    @_locked
+    def close(self) -> None:
+        self.conn.close()
+
+    @_locked
+    def enqueue(self, kind: str, targets: Iterable[tuple]) -> int:
+        """
+        Lägger till targets (target[0] = orgnr). Befintliga pending/leased rörs inte,
+        retry (och gamla done) läggs tillbaka som pending. Returnerar antal nya/återöppnade.
+        """
+        now = time.time()
+        rows = [(kind, t[0], json.dumps(list(t), ensure_ascii=False), now) for t in targets]
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                """
+                INSERT INTO work_items(kind, orgnr, payload, status, updated_at)
+                VALUES (?, ?, ?, 'pending', ?)
+                ON CONFLICT(kind, orgnr) DO UPDATE SET
+                    payload = excluded.payload,
+                    status = 'pending',
+                    lease_owner = NULL,
+                    lease_expires = NULL,
+                    updated_at = excluded.updated_at
+                WHERE work_items.status = 'retry'
+                   OR (work_items.status = 'done' AND work_items.updated_at < ?)
+                """,
+                [(*r, now - REOPEN_DONE_AFTER_SEC) for r in rows],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return self.conn.total_changes - before
+
+    @_locked
+    def claim(self, kind: str, owner: str, *, batch_size: int = DEFAULT_BATCH_SIZE, lease_sec: float = DEFAULT_LEASE_SEC) -> list[tuple]:
+        """
+        Claimar upp till batch_size bolag: pending först i kö-ordning, sedan utgångna leases.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                """
+                UPDATE work_items
+                SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?
+                WHERE rowid IN (
+                    SELECT rowid FROM work_items
+                    WHERE kind = ?
+                      AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                    ORDER BY rowid
+                    LIMIT ?
+                )
+                RETURNING payload
+                """,
+                (owner, now + lease_sec, now, kind, now, batch_size),
+            ).fetchall()
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [tuple(json.loads(r[0])) for r in rows]
+
+    @_locked
+    def heartbeat(self, kind: str, owner: str, *, lease_sec: float = DEFAULT_LEASE_SEC) -> int:
+        now = time.time()
+        cur = self.conn.execute(
+            """
+            UPDATE work_items SET lease_expires = ?, updated_at = ?
+            WHERE kind = ? AND lease_owner = ? AND status = 'leased'
+            """,
+            (now + lease_sec, now, kind, owner),
+        )
+        return cur.rowcount
+
+    @_locked
+    def finish(self, kind: str, owner: str, orgnr: str, *, ok: bool) -> None:
+        # Kommentar: bara ägaren får stänga – har leasen gått ut och tagits över ignoreras vi
+        self.conn.execute(
+            """
+            UPDATE work_items
+            SET status = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+            WHERE kind = ? AND orgnr = ? AND lease_owner = ? AND status = 'leased'
+            """,
+            ("done" if ok else "retry", time.time(), kind, orgnr, owner),
+        )
+
+    @_locked
+    def finish_many(self, kind: str, owner: str, orgnrs: Iterable[str], *, ok: bool) -> None:
+        # Kommentar: finish för en hel checkpoint i en transaktion
+        now = time.time()
+        rows = [("done" if ok else "retry", now, kind, o, owner) for o in orgnrs]
+        if not rows:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                """
+                UPDATE work_items
+                SET status = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+                WHERE kind = ? AND orgnr = ? AND lease_owner = ? AND status = 'leased'
+                """,
+                rows,
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    @_locked
+    def release_expired(self, kind: Optional[str] = None) -> int:
+        """
+        Lämnar tillbaka utgångna leases som pending (claim tar dem ändå, men bra för status/överblick).
+        """
+        now = time.time()
+        sql = """
+            UPDATE work_items SET status = 'pending', lease_owner = NULL, lease_expires = NULL, updated_at = ?
+            WHERE status = 'leased' AND lease_expires < ?
+        """
+        params: list = [now, now]
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        return self.conn.execute(sql, params).rowcount
+
+    @_locked
+    def counts(self, kind: str) -> dict[str, int]:
+        rows = self.conn.execute(
+            "SELECT status, COUNT(*) FROM work_items WHERE kind = ? GROUP BY status", (kind,)
+        ).fetchall()
+        return {s: int(n) for s, n in rows}
+
+
+class QueueWorker:
+    """
+    Koppling shard <-> kö:
+        qw = QueueWorker(WorkQueue(), "emails", owner)
+        run_bounded(qw.targets(), qw.track(worker), CONCURRENCY)   # + qw.heartbeat() som task
+        out_f = queue_writer(qw, out_f)                             # done först efter writerns checkpoint
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        kind: str,
+        owner: str,
+        *,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        lease_sec: float = DEFAULT_LEASE_SEC,
+    ) -> None:
+        self.queue = queue
+        self.kind = kind
+        self.owner = owner
+        self.batch_size = batch_size
+        self.lease_sec = lease_sec
+        self._written: list[str] = []
+        self._finishing: list[asyncio.Future] = []
+
+    async def targets(self) -> AsyncIterator[tuple]:
+        # Kommentar: lat – nästa batch claimas först när förra är utdelad (run_bounded tar async-iteratorer)
+        while True:
+            batch = await asyncio.to_thread(
+                self.queue.claim, self.kind, self.owner, batch_size=self.batch_size, lease_sec=self.lease_sec
+            )
+            if not batch:
+                return
+            for target in batch:
+                yield target
+
+    def track(self, worker: Callable[[tuple], Awaitable[Optional[dict]]]) -> Callable[[tuple], Awaitable[Optional[dict]]]:
+        async def _run(target: tuple) -> Optional[dict]:
+            row = await worker(target)
+            # Kommentar: ingen rad => retry direkt; med rad => done först när raden är skriven (commit_written)
+            if row is None:
+                await asyncio.to_thread(self.queue.finish, self.kind, self.owner, target[0], ok=False)
+            return row
+        return _run
+
+    def written(self, orgnr: str) -> None:
+        self._written.append(orgnr)
+
+    def commit_written(self) -> None:
+        # Kommentar: anropas av writerns checkpoint – allt i _written ligger då på disk / i sink-DB:n
+        if not self._written:
+            return
+        orgnrs, self._written = self._written, []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Kommentar: writerns sista checkpoint (close) körs efter asyncio.run => ingen loop att blockera
+            self.queue.finish_many(self.kind, self.owner, orgnrs, ok=True)
+            return
+        self._finishing.append(
+            asyncio.ensure_future(asyncio.to_thread(self.queue.finish_many, self.kind, self.owner, orgnrs, ok=True))
+        )
+
+    async def drain(self) -> None:
+        # Kommentar: vänta in done-markeringar som fortfarande körs i tråd
+        pending, self._finishing = self._finishing, []
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_sec / 3)
+            await asyncio.to_thread(self.queue.heartbeat, self.kind, self.owner, lease_sec=self.lease_sec)
+
+
+class QueueWriter:
+    """
+    Writer-proxy i kö-läge: samma write_row, men bolaget blir done först vid writerns nästa checkpoint.
+    """
+
+    def __init__(self, qw: QueueWorker, out_f: Any) -> None:
+        self.qw = qw
+        self.out_f = out_f
+        out_f.checkpoint_hooks.append(qw.commit_written)
+
+    def write_row(self, row: dict) -> None:
+        self.out_f.write_row(row)
+        o = (row.get("orgnr") or "").strip()
+        if o:
+            self.qw.written(o)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.out_f, name)
+
+
+def queue_writer(qw: Optional[QueueWorker], out_f: Any) -> Any:
+    return out_f if qw is None else QueueWriter(qw, out_f)
+
+
+def track(qw: Optional[QueueWorker], worker: Callable[[tuple], Awaitable[Optional[dict]]]) -> Callable[[tuple], Awaitable[Optional[dict]]]:
+    return worker if qw is None else qw.track(worker)
+
+
+@contextlib.asynccontextmanager
+async def keepalive(qw: Optional[QueueWorker]) -> AsyncIterator[None]:
+    # Kommentar: heartbeat-task under hela crawlen (no-op utan kö)
+    if qw is None:
+        yield
+        return
+    task = asyncio.ensure_future(qw.heartbeat())
+    try:
+        yield
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await qw.drain()
@@ -0,0 +1,46 @@
+# migrations/add_company_sni.py
+# Kommentar:
+# Skapar company_sni (en rad per bolag/SNI-kod/källa) och bygger den från companies.sni_codes + scb_sni_5/scb_sni_5p,
+# så targeting matchar SNI via index i stället för LIKE över sni_codes (se companies/open_data/sni_index.py).
+# Idempotent – bygger om hela tabellen varje gång (kör om efter bulk-importer som skriver sni-kolumnerna direkt).
+# Kör:
+#   python migrations/add_company_sni.py
+
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from companies.open_data.sni_index import rebuild
+
+DB_PATH = Path("data/db/companies.db.sqlite")
+
+def main() -> None:
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+
+    con = sqlite3.connect(DB_PATH.as_posix())
+    try:
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("BEGIN;")
+
+        counts = rebuild(con)
+        con.commit()
+
+        # Kommentar: statistik så planeraren väljer (source, sni_code)-indexet
+        con.execute("ANALYZE company_sni;")
+        con.commit()
+
+        for source, n in counts.items():
+            print(f"company_sni: {source} rader={n}")
+        print("KLART ✅")
+
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# migrations/add_refresh_due_indexes.py
+# Kommentar:
+# Skapar uttrycks-/partial index på due-nyckeln (julianday(*_checked_at)) för varje shard,
+# så pick_targets bara range-scannar de bolag som behöver refresh (se companies/shards/shared/refresh_sql.py).
+# Idempotent (IF NOT EXISTS). Shards vars kolumner saknas hoppas över – kör om efter deras migration.
+# Kör:
+#   python migrations/add_refresh_due_indexes.py
+
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from companies.shards.shared.refresh_sql import create_indexes
+
+DB_PATH = Path("data/db/companies.db.sqlite")
+
+def main() -> None:
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+
+    con = sqlite3.connect(DB_PATH.as_posix())
+    try:
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("BEGIN;")
+
+        created, skipped = create_indexes(con)
+        con.commit()
+
+        # Kommentar: statistik så planeraren väljer indexen
+        con.execute("ANALYZE companies;")
+        con.commit()
+
+        for name in created:
+            print(f"INDEX: {name}")
+        for kind in skipped:
+            print(f"SKIP: {kind} (kolumn saknas)")
+        print("KLART ✅")
+
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,14 @@ import re
 import socket
 import sqlite3
 import subprocess
+import sys
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Iterable, Optional
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
 # =========================
 # KONFIG
 # =========================
@@ -44,6 +47,9 @@ WARN_COMPLAINT_RATE_30D = 0.003  # 0.3%
 DEAD_COMPLAINT_RATE_30D = 0.01   # 1%
 
 SOCKET_TIMEOUT_SEC = 3.0
+
+# Delad DNS-cache (samma fil som tech footprint) – svar återanvänds så länge TTL gäller
+DNS_CACHE_PATH = Path("data/cache/dns_cache.sqlite")
 # =========================
 
 
@@ -91,38 +97,41 @@ def normalize_domain(domain: str) -> str:
 
 
 # -------------------------
-# DNS helpers (dnspython om den finns, annars nslookup/socket)
+# DNS helpers (cachad dnspython-resolver om den finns, annars nslookup/socket)
 # -------------------------
-def _try_import_dnspython():
+def _try_import_cached_resolver():
     try:
-        import dns.resolver  # type: ignore
-        return dns.resolver
+        from companies.shards.shared.dns_cache import CachedResolver  # type: ignore
+        return CachedResolver
     except Exception:
         return None
 
 
-DNSPYTHON = _try_import_dnspython()
+CACHED_RESOLVER = _try_import_cached_resolver()
+_resolver = None
+_resolver_failed = False
+
+
+def _dns():
+    # Kommentar (svenska): en resolver per körning, öppnas först vid första DNS-frågan.
+    # Går cache-filen inte att öppna (skrivskyddad/låst sökväg) => None = okachad nslookup/socket-väg, rapporten körs ändå
+    global _resolver, _resolver_failed
+    if _resolver is None and CACHED_RESOLVER is not None and not _resolver_failed:
+        try:
+            _resolver = CACHED_RESOLVER(DNS_CACHE_PATH, lifetime=SOCKET_TIMEOUT_SEC)
+        except Exception:
+            _resolver_failed = True
+    return _resolver
 
 
 def dns_txt(name: str) -> list[str]:
     name = normalize_domain(name)
     out: list[str] = []
 
-    if DNSPYTHON is not None:
+    resolver = _dns()
+    if resolver is not None:
         try:
-            resolver = DNSPYTHON.Resolver()
-            resolver.lifetime = SOCKET_TIMEOUT_SEC
-            for rdata in resolver.resolve(name, "TXT"):
-                parts = []
-                for p in getattr(rdata, "strings", []) or []:
-                    try:
-                        parts.append(p.decode("utf-8", "ignore"))
-                    except Exception:
-                        parts.append(str(p))
-                if parts:
-                    out.append("".join(parts))
-                else:
-                    out.append(str(rdata).strip().strip('"'))
+            out.extend(resolver.txt(name))
         except Exception:
             pass
         return out
@@ -148,12 +157,10 @@ def dns_mx(domain: str) -> list[str]:
     domain = normalize_domain(domain)
     mx: list[str] = []
 
-    if DNSPYTHON is not None:
+    resolver = _dns()
+    if resolver is not None:
         try:
-            resolver = DNSPYTHON.Resolver()
-            resolver.lifetime = SOCKET_TIMEOUT_SEC
-            for rdata in resolver.resolve(domain, "MX"):
-                mx.append(str(rdata.exchange).rstrip("."))
+            mx.extend(resolver.mx(domain))
         except Exception:
             pass
         return mx
@@ -215,15 +222,15 @@ def rbl_check_ip(ip: str, zone: str) -> RblResult:
     if not q or q.startswith("."):
         return RblResult(zone=zone, status="unknown", response="bad ip")
 
-    if DNSPYTHON is not None:
+    resolver = _dns()
+    if resolver is not None:
         try:
-            resolver = DNSPYTHON.Resolver()
-            resolver.lifetime = SOCKET_TIMEOUT_SEC
-            ans = resolver.resolve(q, "A")
-            resp = ",".join(str(r) for r in ans)
-            return RblResult(zone=zone, status="listed", response=resp)
+            ans = resolver.a(q)
         except Exception:
             return RblResult(zone=zone, status="clean")
+        if not ans:
+            return RblResult(zone=zone, status="clean")
+        return RblResult(zone=zone, status="listed", response=",".join(ans))
 
     try:
         socket.gethostbyname(q)
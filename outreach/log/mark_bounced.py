@@ -3,10 +3,15 @@
 
 import argparse
 import sqlite3
+import sys
 from pathlib import Path
 from datetime import datetime, timezone
 import json
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from outreach.log.suppression import suppress
+
 DB_PATH = Path("data/db/outreach.db.sqlite")
 
 
@@ -71,7 +76,12 @@ def main():
         (ts, msg["lead_id"]),
     )
 
-    # 4) Logga event
+    # 4) Spärra orgnr för framtida targeting (suppression)
+    lead = cur.execute("SELECT orgnr FROM leads WHERE id = ? LIMIT 1", (msg["lead_id"],)).fetchone()
+    if lead and lead["orgnr"]:
+        suppress(con, str(lead["orgnr"]), "bounce", ts)
+
+    # 5) Logga event
     cur.execute(
         """
         INSERT INTO events (lead_id, campaign_id, message_id, type, meta, created_at)
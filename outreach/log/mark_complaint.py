@@ -4,10 +4,15 @@
 
 import argparse
 import sqlite3
+import sys
 from pathlib import Path
 from datetime import datetime, timezone
 import json
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from outreach.log.suppression import suppress
+
 DB_PATH = Path("data/db/outreach.db.sqlite")
 
 
@@ -49,6 +54,9 @@ def main():
     )
     stopped_rows = cur.rowcount
 
+    # Spärra orgnr för framtida targeting (suppression)
+    suppress(con, args.orgnr, "complaint", ts)
+
     # Logga event "complaint" (om din events CHECK tillåter det)
     try:
         cur.execute(
@@ -5,10 +5,15 @@
 
 import argparse
 import sqlite3
+import sys
 from pathlib import Path
 from datetime import datetime, timezone
 import json
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from outreach.log.suppression import suppress
+
 DB_PATH = Path("data/db/outreach.db.sqlite")
 
 
@@ -50,6 +55,9 @@ def main():
     )
     stopped_rows = cur.rowcount
 
+    # Spärra orgnr för framtida targeting (suppression)
+    suppress(con, args.orgnr, "manual_stop", ts)
+
     # Logga event "manual_stop" (om din events CHECK tillåter det)
     try:
         cur.execute(
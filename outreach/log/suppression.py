@@ -0,0 +1,155 @@
+# outreach/log/suppression.py
+# Spärrlista per orgnr (suppression) i outreach.db – en rad per bolag som aldrig ska kontaktas igen
+# - mark_bounced.py / mark_complaint.py / mark_manual_stop.py lägger till raden i samma transaktion som sin UPDATE
+# - targeting (select_targets.get_blocked_orgnrs) slår upp kandidaterna mot suppression + do_not_contact +
+#   leads.status + unsubscribe/bounce-events via en temp-tabell och EN indexerad UNION-fråga (ingen IN-lista per orgnr)
+#   (blocked_union_sql används även av select_targets --attach yes mot den ATTACH:ade outreach-db:n)
+# - rebuild() fyller tabellen från befintliga källor (första gången / efter manuella ändringar)
+# Kör (rebuild):
+#   python outreach/log/suppression.py
+
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, List, Set, Tuple
+
+DB_PATH = Path("data/db/outreach.db.sqlite")
+TABLE = "suppression"
+BLOCK_EVENT_TYPES = ("unsubscribe", "bounce")
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _has_table(con: sqlite3.Connection, name: str, schema: str = "main") -> bool:
+    row = con.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def ensure_table(con: sqlite3.Connection, schema: str = "main") -> None:
+    """
+    schema = "main" eller aliaset outreach.db är ATTACH:ad som (select_targets --attach yes).
+    """
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{TABLE} (
+          orgnr TEXT PRIMARY KEY,
+          reason TEXT NOT NULL,      -- bounce | complaint | manual_stop | do_not_contact | unsubscribe
+          created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    # Kommentar: index som blocked_orgnrs-frågan slår i (finns de redan händer inget)
+    if _has_table(con, "do_not_contact", schema):
+        con.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_do_not_contact_orgnr ON do_not_contact(orgnr)")
+    if _has_table(con, "events", schema):
+        con.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_events_lead_type ON events(lead_id, type)")
+
+
+def suppress(con: sqlite3.Connection, orgnr: str, reason: str, ts: str) -> None:
+    """
+    Spärra orgnr. Första orsaken behålls (raden finns redan => inget händer).
+    """
+    ensure_table(con)
+    con.execute(
+        f"INSERT INTO {TABLE}(orgnr, reason, created_at) VALUES (?, ?, ?) ON CONFLICT(orgnr) DO NOTHING",
+        (orgnr, reason, ts),
+    )
+
+
+def rebuild(con: sqlite3.Connection) -> int:
+    """
+    Lägger till alla orgnr som redan är spärrade i källorna. Returnerar antal nya rader.
+    """
+    ensure_table(con)
+    ts = now_iso()
+    before = con.total_changes
+    if _has_table(con, "do_not_contact"):
+        con.execute(
+            f"""
+            INSERT OR IGNORE INTO {TABLE}(orgnr, reason, created_at)
+            SELECT DISTINCT orgnr, 'do_not_contact', ? FROM do_not_contact WHERE orgnr IS NOT NULL AND orgnr != ''
+            """,
+            (ts,),
+        )
+    con.execute(
+        f"""
+        INSERT OR IGNORE INTO {TABLE}(orgnr, reason, created_at)
+        SELECT l.orgnr, e.type, MIN(e.created_at)
+        FROM leads l
+        JOIN events e ON e.lead_id = l.id
+        WHERE e.type IN ({", ".join("?" * len(BLOCK_EVENT_TYPES))}) AND l.orgnr IS NOT NULL
+        GROUP BY l.orgnr
+        """,
+        BLOCK_EVENT_TYPES,
+    )
+    con.execute(
+        f"""
+        INSERT OR IGNORE INTO {TABLE}(orgnr, reason, created_at)
+        SELECT orgnr, 'do_not_contact', COALESCE(updated_at, ?) FROM leads
+        WHERE status = 'do_not_contact' AND orgnr IS NOT NULL
+        """,
+        (ts,),
+    )
+    return con.total_changes - before
+
+
+def blocked_union_sql(con: sqlite3.Connection, target: str, schema: str = "main") -> Tuple[str, List[object]]:
+    """
+    SELECT orgnr ... för de orgnr i tabellen target (kolumn orgnr) som är spärrade i schema.
+    """
+    # Kommentar: UNION av vanliga joins (inte OR + korrelerade EXISTS) => planeraren väljer join-ordning per källa,
+    # t.ex. events via (type)-delen av indexet även när lead_id saknar deklarerad typ
+    parts = [f"SELECT t.orgnr FROM {target} t JOIN {schema}.{TABLE} s ON s.orgnr = t.orgnr"]
+    if _has_table(con, "do_not_contact", schema):
+        parts.append(f"SELECT t.orgnr FROM {target} t JOIN {schema}.do_not_contact d ON d.orgnr = t.orgnr")
+    parts.append(
+        f"SELECT t.orgnr FROM {target} t JOIN {schema}.leads l ON l.orgnr = t.orgnr WHERE l.status = 'do_not_contact'"
+    )
+    parts.append(
+        f"""
+        SELECT t.orgnr FROM {target} t
+        JOIN {schema}.leads l ON l.orgnr = t.orgnr
+        JOIN {schema}.events e ON e.lead_id = l.id
+        WHERE e.type IN ({", ".join("?" * len(BLOCK_EVENT_TYPES))})
+        """
+    )
+    return " UNION ".join(parts), list(BLOCK_EVENT_TYPES)
+
+
+def blocked_orgnrs(con: sqlite3.Connection, orgnrs: Iterable[str]) -> Set[str]:
+    """
+    De orgnr som är spärrade: suppression, do_not_contact, leads.status='do_not_contact' eller unsubscribe/bounce-event.
+    Kandidaterna läggs i en temp-tabell => en fråga oavsett antal (ingen gräns på SQL-variabler).
+    """
+    ensure_table(con)
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS target_orgnrs (orgnr TEXT PRIMARY KEY) WITHOUT ROWID")
+    con.execute("DELETE FROM temp.target_orgnrs")
+    con.executemany("INSERT OR IGNORE INTO temp.target_orgnrs(orgnr) VALUES (?)", ((o,) for o in orgnrs))
+
+    sql, params = blocked_union_sql(con, "temp.target_orgnrs")
+    rows = con.execute(sql, params).fetchall()
+    con.execute("DELETE FROM temp.target_orgnrs")
+    return {str(r[0]) for r in rows if r and r[0]}
+
+
+def main() -> None:
+    if not DB_PATH.exists():
+        raise FileNotFoundError(f"DB saknas: {DB_PATH}")
+
+    con = sqlite3.connect(DB_PATH.as_posix())
+    try:
+        added = rebuild(con)
+        con.commit()
+        total = con.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+        print(f"{TABLE}: rader={total} nya={added}")
+        print("KLART ✅")
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
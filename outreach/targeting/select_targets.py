@@ -24,19 +24,50 @@
 # - tier, match_flags (JSON), score
 #
 # OBS: Wizard bygger du senare – detta är CLI-motorn.
+#
+# SNI matchas mot company_sni när migrations/add_company_sni.py byggt den (sni_index.is_complete): prefix/exact blir
+# range-scans på index (source, sni_code) i stället för LIKE '%...%' över sni_codes. Utan tabellen: LIKE som förut.
+#
+# Med --features on förväljs bolagen vektoriserat i minnet över targeting_features (outreach/targeting/
+# targeting_features.py); tabellen refreshas inte av apply/merge, så den är opt-in och kan vara gammal.
+# De förvalda bolagen läses därför med samma WHERE som SQL-vägen (_candidate_where) + founded/tech/review på
+# levande rader, i orgnr-ordning tills --limit bolag klarat sig, och tier/score räknas på de raderna
+# (compute_tier_and_flags) – bolag som ändrats sedan refresh registreras aldrig på gammal data.
+# Skillnad mot SQL-vägen: founded/tech/review filtreras före --limit (inte efter).
+#
+# Med --attach yes ATTACH:as outreach.db på companies-anslutningen och hela kedjan körs set-baserat i SQL:
+# urval + tier/score -> temp.target_candidates, DELETE av spärrade (suppression-UNION:en), INSERT ... SELECT av leads
+# och lead_campaigns. Inga rader via Python, en transaktion. Samma resultat som SQL-vägen, förutom att
+# founded/tech/review (som features-vägen) filtreras före --limit.
 
 import argparse
 import json
 import sqlite3
+import sys
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Sequence, Tuple
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from companies.open_data.sni_index import is_complete as company_sni_complete, match_subquery
+from outreach.log.suppression import blocked_orgnrs, blocked_union_sql, ensure_table as ensure_suppression_table
+from outreach.targeting.targeting_features import FeatureSet, TargetFilters, has_features
+
 
 COMPANIES_DB = Path("data/db/companies.db.sqlite")
 OUTREACH_DB = Path("data/db/outreach.db.sqlite")
 
+# Kommentar: registrering i outreach.db – en transaktion (commit) per BATCH_SIZE kandidater
+BATCH_SIZE = 2000
+UPSERT_ROWS_PER_STMT = 100  # 9 parametrar/rad => 900 st, under SQLite-gränsen även på gamla versioner
+
+# Kommentar: --attach yes => outreach.db ATTACH:as på companies-anslutningen under det här namnet
+ATTACH_SCHEMA = "o"
+# Kommentar: samma ordning som flags i compute_tier_and_flags (match_flags-JSON blir identisk)
+TIER_FILTERS = ("city", "sni", "employees", "founded", "tech", "review")
+
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
@@ -157,6 +188,19 @@ def _build_sni_where(*, wanted_snis: Sequence[str], mode: str) -> Tuple[str, Lis
     return f" AND ({' OR '.join(clauses)})", params
 
 
+def _build_sni_index_where(*, wanted_snis: Sequence[str], mode: str) -> Tuple[str, List[object]]:
+    """
+    Kommentar (svenska):
+    Samma matchning som _build_sni_where (token = exakt kod / börjar med prefixet) men via company_sni:
+    en indexerad lookup per kod, UNION => mängden orgnr, sedan bara de bolagen ur companies.
+    Bara källan bolagsverket (= sni_codes), så urvalet blir detsamma som med LIKE.
+    """
+    sql, params = match_subquery(wanted_snis, mode)
+    if not sql:
+        return "", []
+    return f" AND orgnr IN ({sql})", params
+
+
 def _build_city_where(cities: Sequence[str]) -> Tuple[str, List[object]]:
     if not cities:
         return "", []
@@ -207,29 +251,14 @@ def _parse_iso(s: Optional[str]) -> Optional[datetime]:
         return None
 
 
-def fetch_candidates(
-    con: sqlite3.Connection,
-    *,
-    cities: Sequence[str],
-    wanted_snis: Sequence[str],
-    sni_match: str,
-    require_website_status: str,
-    require_email_status: str,
-    require_sni_present: bool,
-    employees_ranges: Sequence[str],
-    limit: int,
-    tech_filter: str,
-    review_filter: str,
-    founded_min: Optional[str],
-    founded_max: Optional[str],
-) -> List[CompanyRow]:
-    cur = con.cursor()
-
-    has_tech = _companies_has_column(con, "tech_footprint_status") or _companies_has_column(con, "tech_footprint")
-    has_review = _companies_has_column(con, "website_review_status") or _companies_has_column(con, "site_review_status")
-
+def _flag_columns(con: sqlite3.Connection) -> Tuple[Optional[str], Optional[str]]:
     tech_col = "tech_footprint_status" if _companies_has_column(con, "tech_footprint_status") else ("tech_footprint" if _companies_has_column(con, "tech_footprint") else None)
     review_col = "website_review_status" if _companies_has_column(con, "website_review_status") else ("site_review_status" if _companies_has_column(con, "site_review_status") else None)
+    return tech_col, review_col
+
+
+def _company_select_cols(con: sqlite3.Connection) -> List[str]:
+    tech_col, review_col = _flag_columns(con)
 
     select_cols = [
         "orgnr", "name", "city", "employees", "sni_codes", "website", "emails",
@@ -243,7 +272,68 @@ def fetch_candidates(
         select_cols.append(f"{review_col} AS review_flag")
     else:
         select_cols.append("NULL AS review_flag")
+    return select_cols
+
+
+def _company_row(r: Sequence[object]) -> CompanyRow:
+    return CompanyRow(
+        orgnr=str(r[0]),
+        name=str(r[1]),
+        city=str(r[2] or ""),
+        employees=r[3],
+        sni_codes_raw=r[4],
+        website=r[5],
+        emails_raw=r[6],
+        website_status=r[7],
+        email_status=r[8],
+        created_at=r[9],
+        started_at=r[10],
+        tech_flag=r[11],
+        review_flag=r[12],
+    )
+
 
+def load_company_rows(
+    con: sqlite3.Connection,
+    orgnrs: Sequence[str],
+    *,
+    where_sql: str = "",
+    where_params: Sequence[object] = (),
+) -> List[CompanyRow]:
+    """
+    CompanyRow för valda orgnr, i samma ordning (features-vägen läser bara de bolag som faktiskt valts).
+    where_sql (från _candidate_where) kontrolleras mot de levande raderna: bolag som ändrats sedan
+    targeting_features refreshades (status, emails, city ...) och inte längre matchar kommer inte med.
+    """
+    select_cols = _company_select_cols(con)
+    recheck = f" AND {where_sql}" if where_sql else ""
+    by_orgnr: Dict[str, CompanyRow] = {}
+    for i in range(0, len(orgnrs), 500):
+        chunk = list(orgnrs[i:i + 500])
+        placeholders = ",".join(["?"] * len(chunk))
+        for r in con.execute(
+            f"SELECT {', '.join(select_cols)} FROM companies WHERE orgnr IN ({placeholders}){recheck}",
+            [*chunk, *where_params],
+        ):
+            by_orgnr[str(r[0])] = _company_row(r)
+    return [by_orgnr[o] for o in orgnrs if o in by_orgnr]
+
+
+def _candidate_where(
+    con: sqlite3.Connection,
+    *,
+    cities: Sequence[str],
+    wanted_snis: Sequence[str],
+    sni_match: str,
+    require_website_status: str,
+    require_email_status: str,
+    require_sni_present: bool,
+    employees_ranges: Sequence[str],
+) -> Tuple[str, List[object]]:
+    """
+    Kommentar (svenska):
+    WHERE-delen (lager 1 + city/employees/SNI) mot companies – samma för fetch_candidates och --attach-vägen.
+    """
     where = [
         "website_status = ?",
         "email_status = ?",
@@ -263,42 +353,83 @@ def fetch_candidates(
 
     city_where, city_params = _build_city_where(cities)
     emp_where, emp_params = _build_employees_where(employees_ranges)
-    sni_where, sni_params = _build_sni_where(wanted_snis=wanted_snis, mode=sni_match)
+    if company_sni_complete(con):
+        sni_where, sni_params = _build_sni_index_where(wanted_snis=wanted_snis, mode=sni_match)
+    else:
+        sni_where, sni_params = _build_sni_where(wanted_snis=wanted_snis, mode=sni_match)
+
+    params.extend(city_params)
+    params.extend(emp_params)
+    params.extend(sni_params)
+    return f"{' AND '.join(where)} {city_where} {emp_where} {sni_where}", params
+
+
+def fetch_candidates(
+    con: sqlite3.Connection,
+    *,
+    cities: Sequence[str],
+    wanted_snis: Sequence[str],
+    sni_match: str,
+    require_website_status: str,
+    require_email_status: str,
+    require_sni_present: bool,
+    employees_ranges: Sequence[str],
+    limit: int,
+    tech_filter: str,
+    review_filter: str,
+    founded_min: Optional[str],
+    founded_max: Optional[str],
+) -> List[CompanyRow]:
+    cur = con.cursor()
+
+    select_cols = _company_select_cols(con)
+
+    where_sql, params = _candidate_where(
+        con,
+        cities=cities,
+        wanted_snis=wanted_snis,
+        sni_match=sni_match,
+        require_website_status=require_website_status,
+        require_email_status=require_email_status,
+        require_sni_present=require_sni_present,
+        employees_ranges=employees_ranges,
+    )
 
     sql = f"""
     SELECT {", ".join(select_cols)}
     FROM companies
-    WHERE {" AND ".join(where)}
-    {city_where}
-    {emp_where}
-    {sni_where}
+    WHERE {where_sql}
     ORDER BY orgnr ASC
     LIMIT ?
     """
-    params.extend(city_params)
-    params.extend(emp_params)
-    params.extend(sni_params)
     params.append(limit)
 
-    rows: List[CompanyRow] = []
-    for r in cur.execute(sql, params).fetchall():
-        rows.append(
-            CompanyRow(
-                orgnr=str(r[0]),
-                name=str(r[1]),
-                city=str(r[2] or ""),
-                employees=r[3],
-                sni_codes_raw=r[4],
-                website=r[5],
-                emails_raw=r[6],
-                website_status=r[7],
-                email_status=r[8],
-                created_at=r[9],
-                started_at=r[10],
-                tech_flag=r[11],
-                review_flag=r[12],
-            )
-        )
+    rows: List[CompanyRow] = [_company_row(r) for r in cur.execute(sql, params).fetchall()]
+    return _filter_extra(
+        con,
+        rows,
+        tech_filter=tech_filter,
+        review_filter=review_filter,
+        founded_min=founded_min,
+        founded_max=founded_max,
+    )
+
+
+def _filter_extra(
+    con: sqlite3.Connection,
+    rows: List[CompanyRow],
+    *,
+    tech_filter: str,
+    review_filter: str,
+    founded_min: Optional[str],
+    founded_max: Optional[str],
+) -> List[CompanyRow]:
+    """
+    Kommentar (svenska):
+    founded/tech/review på inlästa rader – samma för fetch_candidates och features-vägen.
+    """
+    has_tech = _companies_has_column(con, "tech_footprint_status") or _companies_has_column(con, "tech_footprint")
+    has_review = _companies_has_column(con, "website_review_status") or _companies_has_column(con, "site_review_status")
 
     # Kommentar (svenska): founded/created_at intervall (om användaren vill)
     if founded_min or founded_max:
@@ -334,6 +465,44 @@ def fetch_candidates(
     return rows
 
 
+def load_live_candidates(
+    con: sqlite3.Connection,
+    orgnrs: Sequence[str],
+    *,
+    where_sql: str,
+    where_params: Sequence[object],
+    limit: int,
+    tech_filter: str,
+    review_filter: str,
+    founded_min: Optional[str],
+    founded_max: Optional[str],
+) -> Tuple[List[CompanyRow], int]:
+    """
+    Kommentar (svenska):
+    Features-vägen: förvalda orgnr (i orgnr-ordning) kollas om mot levande companies-rader – WHERE + founded/tech/review.
+    Läses i bitar tills limit bolag klarat sig, så bortfallna bolag inte ger färre leads än --limit.
+    Returnerar (rader, antal lästa bolag som inte längre matchade).
+    """
+    rows: List[CompanyRow] = []
+    dropped = 0
+    step = max(limit, 500)
+    for i in range(0, len(orgnrs), step):
+        chunk = orgnrs[i:i + step]
+        live = _filter_extra(
+            con,
+            load_company_rows(con, chunk, where_sql=where_sql, where_params=where_params),
+            tech_filter=tech_filter,
+            review_filter=review_filter,
+            founded_min=founded_min,
+            founded_max=founded_max,
+        )
+        dropped += len(chunk) - len(live)
+        rows.extend(live)
+        if len(rows) >= limit:
+            break
+    return rows[:limit], dropped
+
+
 def upsert_lead(
     con: sqlite3.Connection,
     *,
@@ -370,6 +539,83 @@ def upsert_lead(
     return int(row[0])
 
 
+def upsert_leads_batch(
+    con: sqlite3.Connection,
+    rows: Sequence[CompanyRow],
+    *,
+    lead_type: str,
+    ts: str,
+) -> Dict[str, int]:
+    """
+    Kommentar (svenska):
+    Samma upsert som upsert_lead, men många rader per sats och id:n tillbaka via RETURNING (ingen SELECT per rad).
+    Returnerar orgnr -> lead_id. SQLite < 3.35 saknar RETURNING => upsert_lead per rad (fortfarande utan commit).
+    """
+    ids: Dict[str, int] = {}
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        for c in rows:
+            ids[c.orgnr] = upsert_lead(
+                con,
+                orgnr=c.orgnr,
+                company_name=c.name,
+                city=c.city,
+                sni_codes_raw=c.sni_codes_raw,
+                website=c.website,
+                emails_raw=c.emails_raw,
+                lead_type=lead_type,
+                ts=ts,
+            )
+        return ids
+
+    for i in range(0, len(rows), UPSERT_ROWS_PER_STMT):
+        chunk = rows[i:i + UPSERT_ROWS_PER_STMT]
+        values = ", ".join(["(?, ?, ?, ?, ?, ?, ?, 'new', ?, ?)"] * len(chunk))
+        params: List[object] = []
+        for c in chunk:
+            params.extend([c.orgnr, c.name, c.city, c.sni_codes_raw, c.website, c.emails_raw, lead_type, ts, ts])
+        cur = con.execute(
+            f"""
+            INSERT INTO leads (orgnr, company_name, city, sni_codes, website, emails, lead_type, status, created_at, updated_at)
+            VALUES {values}
+            ON CONFLICT(orgnr) DO UPDATE SET
+              company_name=excluded.company_name,
+              city=excluded.city,
+              sni_codes=excluded.sni_codes,
+              website=excluded.website,
+              emails=excluded.emails,
+              lead_type=excluded.lead_type,
+              updated_at=excluded.updated_at
+            RETURNING orgnr, id
+            """,
+            params,
+        )
+        for orgnr, lead_id in cur.fetchall():
+            ids[str(orgnr)] = int(lead_id)
+
+    missing = [c.orgnr for c in rows if c.orgnr not in ids]
+    if missing:
+        raise RuntimeError(f"Kunde inte läsa tillbaka lead id för orgnr={missing[0]} (+{len(missing) - 1})")
+    return ids
+
+
+def add_lead_campaigns_batch(con: sqlite3.Connection, links: Sequence[Tuple[object, ...]]) -> int:
+    """
+    Kommentar (svenska):
+    ensure_lead_campaign för många rader (executemany). links = (lead_id, campaign_id, next_send_at, ts, ts, tier,
+    match_flags_json, score). Returnerar antal nya kopplingar (redan kopplade ignoreras som förut).
+    """
+    before = con.total_changes
+    con.executemany(
+        """
+        INSERT OR IGNORE INTO lead_campaigns
+          (lead_id, campaign_id, current_step, current_variant, next_send_at, stopped_reason, created_at, updated_at, tier, match_flags, score)
+        VALUES (?, ?, 1, NULL, ?, NULL, ?, ?, ?, ?, ?)
+        """,
+        links,
+    )
+    return con.total_changes - before
+
+
 def ensure_lead_campaign(
     con: sqlite3.Connection,
     *,
@@ -428,38 +674,12 @@ def load_sni_groups(o_con: sqlite3.Connection, group_keys: Sequence[str]) -> Lis
 def get_blocked_orgnrs(o_con: sqlite3.Connection, orgnrs: Sequence[str], *, exclude_dnc: bool) -> set:
     """
     Kommentar (svenska):
-    Exkluderar do_not_contact + unsubscribe/bounce events för befintliga leads.
+    Exkluderar suppression + do_not_contact + unsubscribe/bounce events för befintliga leads.
+    En fråga via temp-tabell (outreach/log/suppression.py) – inga IN-listor, ingen gräns på antal kandidater.
     """
     if not exclude_dnc or not orgnrs:
         return set()
-
-    cur = o_con.cursor()
-    placeholders = ",".join(["?"] * len(orgnrs))
-
-    blocked: set = set()
-
-    # do_not_contact via orgnr
-    cur.execute(f"SELECT orgnr FROM do_not_contact WHERE orgnr IN ({placeholders})", list(orgnrs))
-    blocked.update({str(r[0]) for r in cur.fetchall() if r and r[0]})
-
-    # leads som redan är do_not_contact
-    cur.execute(f"SELECT orgnr FROM leads WHERE orgnr IN ({placeholders}) AND status = 'do_not_contact'", list(orgnrs))
-    blocked.update({str(r[0]) for r in cur.fetchall() if r and r[0]})
-
-    # events: unsubscribe/bounce
-    cur.execute(
-        f"""
-        SELECT l.orgnr
-        FROM leads l
-        JOIN events e ON e.lead_id = l.id
-        WHERE l.orgnr IN ({placeholders})
-          AND e.type IN ('unsubscribe','bounce')
-        """,
-        list(orgnrs),
-    )
-    blocked.update({str(r[0]) for r in cur.fetchall() if r and r[0]})
-
-    return blocked
+    return blocked_orgnrs(o_con, orgnrs)
 
 
 def compute_tier_and_flags(
@@ -531,6 +751,174 @@ def compute_tier_and_flags(
     return tier, flags, score
 
 
+def attach_outreach(con: sqlite3.Connection, path: Path) -> None:
+    con.execute(f"ATTACH DATABASE ? AS {ATTACH_SCHEMA}", (str(path),))
+
+
+def select_candidates_attached(
+    con: sqlite3.Connection,
+    *,
+    where_sql: str,
+    where_params: Sequence[object],
+    active_filters: Dict[str, bool],
+    tech_filter: str,
+    review_filter: str,
+    founded_min: Optional[str],
+    founded_max: Optional[str],
+    limit: int,
+) -> int:
+    """
+    Kommentar (svenska):
+    fetch_candidates + compute_tier_and_flags i en INSERT ... SELECT: kandidaterna med ok-flaggor, tier och score
+    hamnar i temp.target_candidates utan att någon rad går via Python. Returnerar antal kandidater.
+    founded/tech/review filtreras före LIMIT (som features-vägen), founded som unix-sekunder (naiva tider = UTC).
+    """
+    tech_col, review_col = _flag_columns(con)
+    founded = "COALESCE(CAST(strftime('%s', started_at) AS INTEGER), CAST(strftime('%s', created_at) AS INTEGER))"
+    ok_exprs = {
+        "city": "trim(coalesce(city,'')) != ''",
+        "sni": "trim(coalesce(sni_codes,'')) != ''",
+        "employees": "employees IS NOT NULL",
+        "founded": f"({founded}) IS NOT NULL",
+        "tech": f"trim(coalesce({tech_col},'')) != ''" if tech_col else "0",
+        "review": f"trim(coalesce({review_col},'')) != ''" if review_col else "0",
+    }
+
+    where = [where_sql]
+    params: List[object] = list(where_params)
+    dt_min = _parse_iso(founded_min) if founded_min else None
+    dt_max = _parse_iso(founded_max) if founded_max else None
+    if dt_min or dt_max:
+        where.append(f"({founded}) IS NOT NULL")
+    if dt_min:
+        where.append(f"({founded}) >= CAST(strftime('%s', ?) AS INTEGER)")
+        params.append(dt_min.isoformat())
+    if dt_max:
+        where.append(f"({founded}) <= CAST(strftime('%s', ?) AS INTEGER)")
+        params.append(dt_max.isoformat())
+    if tech_filter == "yes" and tech_col:
+        where.append(ok_exprs["tech"])
+    if review_filter == "yes" and review_col:
+        where.append(ok_exprs["review"])
+
+    active = [name for name in TIER_FILTERS if active_filters.get(name, False)]
+    misses = " + ".join(f"(NOT {name}_ok)" for name in active) or "0"
+
+    con.execute("DROP TABLE IF EXISTS temp.target_candidates")
+    con.execute(
+        f"""
+        CREATE TEMP TABLE target_candidates (
+          orgnr TEXT PRIMARY KEY,
+          {", ".join(f"{name}_ok INTEGER" for name in TIER_FILTERS)},
+          tier INTEGER,
+          score INTEGER
+        ) WITHOUT ROWID
+        """
+    )
+    before = con.total_changes
+    con.execute(
+        f"""
+        INSERT INTO temp.target_candidates (orgnr, {", ".join(f"{name}_ok" for name in TIER_FILTERS)}, tier, score)
+        SELECT orgnr, {", ".join(f"{name}_ok" for name in TIER_FILTERS)},
+               min(1 + misses, 5),
+               (6 - min(1 + misses, 5)) * 100 + max(0, 10 - misses) + ?
+        FROM (
+          SELECT *, {misses} AS misses
+          FROM (
+            SELECT orgnr, {", ".join(f"({ok_exprs[name]}) AS {name}_ok" for name in TIER_FILTERS)}
+            FROM companies
+            WHERE {" AND ".join(where)}
+            ORDER BY orgnr ASC
+            LIMIT ?
+          )
+        )
+        """,
+        [len(active), *params, limit],
+    )
+    return con.total_changes - before
+
+
+def exclude_blocked_attached(con: sqlite3.Connection) -> int:
+    """
+    Kommentar (svenska):
+    get_blocked_orgnrs för temp.target_candidates: en DELETE mot spärrarna i den ATTACH:ade outreach-db:n.
+    """
+    ensure_suppression_table(con, ATTACH_SCHEMA)
+    sql, params = blocked_union_sql(con, "temp.target_candidates", ATTACH_SCHEMA)
+    before = con.total_changes
+    con.execute(f"DELETE FROM temp.target_candidates WHERE orgnr IN ({sql})", params)
+    return con.total_changes - before
+
+
+def register_candidates_attached(
+    con: sqlite3.Connection,
+    *,
+    campaign_id: int,
+    lead_type: str,
+    ts: str,
+    base: datetime,
+    stagger_minutes: int,
+    active_filters: Dict[str, bool],
+    match_extra: Dict[str, object],
+) -> Tuple[int, int]:
+    """
+    Kommentar (svenska):
+    upsert_leads_batch + add_lead_campaigns_batch som två INSERT ... SELECT från temp.target_candidates.
+    next_send_at och match_flags byggs i SQL med samma format som Python-vägen. Returnerar (upserted, nya kopplingar).
+    """
+    o = ATTACH_SCHEMA
+    upserted = int(con.execute("SELECT COUNT(*) FROM temp.target_candidates").fetchone()[0])
+    con.execute(
+        f"""
+        INSERT INTO {o}.leads (orgnr, company_name, city, sni_codes, website, emails, lead_type, status, created_at, updated_at)
+        SELECT c.orgnr, c.name, coalesce(c.city, ''), c.sni_codes, c.website, c.emails, ?, 'new', ?, ?
+        FROM temp.target_candidates t
+        JOIN companies c ON c.orgnr = t.orgnr
+        WHERE true
+        ON CONFLICT(orgnr) DO UPDATE SET
+          company_name=excluded.company_name,
+          city=excluded.city,
+          sni_codes=excluded.sni_codes,
+          website=excluded.website,
+          emails=excluded.emails,
+          lead_type=excluded.lead_type,
+          updated_at=excluded.updated_at
+        """,
+        (lead_type, ts, ts),
+    )
+
+    # Kommentar: '{"city_ok": true, ...' per rad + resten av JSON:en (konstant) => samma text som json.dumps
+    flag_parts = [
+        f"""'"{name}_ok": ' || (CASE WHEN t.{name}_ok THEN 'true' ELSE 'false' END)"""
+        if active_filters.get(name, False)
+        else f"""'"{name}_ok": true'"""
+        for name in TIER_FILTERS
+    ]
+    match_flags_sql = "'{' || " + " || ', ' || ".join(flag_parts) + " || ', ' || ?"
+    match_rest = json.dumps(match_extra, ensure_ascii=False)[1:]
+
+    # Kommentar: next_send_at = base + position * stagger, isoformat med base:s mikrosekunder/offset som suffix
+    base_epoch = int(base.replace(microsecond=0).timestamp())
+    base_suffix = base.isoformat()[19:]
+
+    before = con.total_changes
+    con.execute(
+        f"""
+        INSERT OR IGNORE INTO {o}.lead_campaigns
+          (lead_id, campaign_id, current_step, current_variant, next_send_at, stopped_reason, created_at, updated_at, tier, match_flags, score)
+        SELECT
+          l.id, ?, 1, NULL,
+          strftime('%Y-%m-%dT%H:%M:%S', ? + (ROW_NUMBER() OVER (ORDER BY t.orgnr) - 1) * ?, 'unixepoch') || ?,
+          NULL, ?, ?, t.tier, {match_flags_sql}, t.score
+        FROM temp.target_candidates t
+        JOIN {o}.leads l ON l.orgnr = t.orgnr
+        ORDER BY t.orgnr
+        """,
+        (campaign_id, base_epoch, max(stagger_minutes, 0) * 60, base_suffix, ts, ts, match_rest),
+    )
+    return upserted, con.total_changes - before
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
 
@@ -538,6 +926,7 @@ def main() -> None:
     ap.add_argument("--campaign-name", required=True)
     ap.add_argument("--limit", type=int, default=10_000)
     ap.add_argument("--stagger-minutes", type=int, default=2)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="kandidater per transaktion (1 = commit per rad)")
 
     # Hårda krav (lager 1)
     ap.add_argument("--require-website-status", default="found")
@@ -568,6 +957,20 @@ def main() -> None:
     ap.add_argument("--tech", choices=["yes", "no"], default="no", help="yes = kräver att tech-kolumn finns + är satt")
     ap.add_argument("--review", choices=["yes", "no"], default="no", help="yes = kräver att review-kolumn finns + är satt")
 
+    # Motor
+    ap.add_argument(
+        "--features",
+        choices=["on", "off"],
+        default="off",
+        help="on = förval vektoriserat över targeting_features (refreshas inte av apply/merge: kör targeting_features.py först)",
+    )
+    ap.add_argument(
+        "--attach",
+        choices=["yes", "no"],
+        default="no",
+        help="yes = ATTACH outreach.db och kör urval, spärrar och registrering som SQL över båda DB:erna (ignorerar --features)",
+    )
+
     args = ap.parse_args()
 
     if not COMPANIES_DB.exists():
@@ -577,6 +980,7 @@ def main() -> None:
 
     require_sni_present = parse_bool_choice(args.require_sni_present) == "yes"
     exclude_dnc = parse_bool_choice(args.exclude_do_not_contact) == "yes"
+    use_attach = parse_bool_choice(args.attach) == "yes"
     tech_filter = parse_bool_choice(args.tech)
     review_filter = parse_bool_choice(args.review)
 
@@ -601,29 +1005,6 @@ def main() -> None:
 
         wanted_snis = wanted_snis_manual + wanted_snis_from_groups
 
-        candidates = fetch_candidates(
-            c_con,
-            cities=cities,
-            wanted_snis=wanted_snis,
-            sni_match=args.sni_match,
-            require_website_status=args.require_website_status,
-            require_email_status=args.require_email_status,
-            require_sni_present=require_sni_present,
-            employees_ranges=employees_ranges,
-            limit=args.limit,
-            tech_filter=tech_filter,
-            review_filter=review_filter,
-            founded_min=founded_min,
-            founded_max=founded_max,
-        )
-
-        # Kommentar: exkludera DNC / unsubscribe / bounce
-        blocked = get_blocked_orgnrs(o_con, [c.orgnr for c in candidates], exclude_dnc=exclude_dnc)
-        candidates = [c for c in candidates if c.orgnr not in blocked]
-
-        ts = now_iso()
-        base = datetime.now(timezone.utc)
-
         # Kommentar: vilka filter är “aktiva” för tier-beräkning?
         active_filters = {
             "city": bool(cities),
@@ -634,68 +1015,166 @@ def main() -> None:
             "review": (review_filter == "yes"),
         }
 
-        added_links = 0
-        upserted_leads = 0
+        match_extra = {
+            "active_filters": active_filters,
+            "sni_groups": group_keys,
+            "sni_manual": wanted_snis_manual,
+            "employees_ranges": employees_ranges,
+            "founded_min": founded_min or "",
+            "founded_max": founded_max or "",
+        }
         tiers_count = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
 
-        for idx, comp in enumerate(candidates):
-            tier, flags, score = compute_tier_and_flags(
-                comp,
+        if use_attach:
+            # Kommentar: set-baserat över båda DB:erna – urval, spärrar och registrering utan en rad via Python,
+            # en transaktion för hela körningen
+            attach_outreach(c_con, OUTREACH_DB)
+            where_sql, where_params = _candidate_where(
+                c_con,
+                cities=cities,
+                wanted_snis=wanted_snis,
+                sni_match=args.sni_match,
+                require_website_status=args.require_website_status,
+                require_email_status=args.require_email_status,
+                require_sni_present=require_sni_present,
+                employees_ranges=employees_ranges,
+            )
+            matched = select_candidates_attached(
+                c_con,
+                where_sql=where_sql,
+                where_params=where_params,
                 active_filters=active_filters,
-                wanted_snis_any=active_filters["sni"],
-                cities_any=active_filters["city"],
-                employees_any=active_filters["employees"],
-                founded_any=active_filters["founded"],
-                tech_any=active_filters["tech"],
-                review_any=active_filters["review"],
+                tech_filter=tech_filter,
+                review_filter=review_filter,
+                founded_min=founded_min,
+                founded_max=founded_max,
+                limit=args.limit,
             )
-            tiers_count[tier] += 1
-
-            lead_id = upsert_lead(
-                o_con,
-                orgnr=comp.orgnr,
-                company_name=comp.name,
-                city=comp.city,
-                sni_codes_raw=comp.sni_codes_raw,
-                website=comp.website,
-                emails_raw=comp.emails_raw,
+            if exclude_dnc:
+                matched -= exclude_blocked_attached(c_con)
+            upserted_leads, added_links = register_candidates_attached(
+                c_con,
+                campaign_id=campaign_id,
                 lead_type=lead_type,
-                ts=ts,
-            )
-            upserted_leads += 1
-
-            next_send = (base + timedelta(minutes=idx * max(args.stagger_minutes, 0))).isoformat()
-            match_flags_json = json.dumps(
-                {
-                    **flags,
-                    "active_filters": active_filters,
-                    "sni_groups": group_keys,
-                    "sni_manual": wanted_snis_manual,
-                    "employees_ranges": employees_ranges,
-                    "founded_min": founded_min or "",
-                    "founded_max": founded_max or "",
-                },
-                ensure_ascii=False,
+                ts=now_iso(),
+                base=datetime.now(timezone.utc),
+                stagger_minutes=args.stagger_minutes,
+                active_filters=active_filters,
+                match_extra=match_extra,
             )
-
-            if ensure_lead_campaign(
-                o_con,
-                lead_id=lead_id,
-                campaign_id=campaign_id,
-                next_send_at=next_send,
-                ts=ts,
-                tier=tier,
-                match_flags_json=match_flags_json,
-                score=score,
-            ):
-                added_links += 1
-
-            # Kommentar: commit per rad (enklast/robust), optimera senare om du vill
-            o_con.commit()
+            for tier, n in c_con.execute("SELECT tier, COUNT(*) FROM temp.target_candidates GROUP BY tier"):
+                tiers_count[int(tier)] = int(n)
+            c_con.commit()
+        else:
+            if args.features == "on":
+                if not has_features(c_con):
+                    raise SystemExit("targeting_features saknas – kör outreach/targeting/targeting_features.py först")
+                features = FeatureSet(c_con)
+                picked = features.select(
+                    TargetFilters(
+                        website_status=args.require_website_status,
+                        email_status=args.require_email_status,
+                        require_sni_present=require_sni_present,
+                        cities=cities,
+                        employees_ranges=employees_ranges,
+                        founded_min=_parse_iso(founded_min) if founded_min else None,
+                        founded_max=_parse_iso(founded_max) if founded_max else None,
+                        tech=(tech_filter == "yes"),
+                        review=(review_filter == "yes"),
+                        wanted_snis=wanted_snis,
+                        sni_match=args.sni_match,
+                    ),
+                )
+                # Kommentar: features kan vara äldre än companies – alla filter kollas om på riktiga rader
+                where_sql, where_params = _candidate_where(
+                    c_con,
+                    cities=cities,
+                    wanted_snis=wanted_snis,
+                    sni_match=args.sni_match,
+                    require_website_status=args.require_website_status,
+                    require_email_status=args.require_email_status,
+                    require_sni_present=require_sni_present,
+                    employees_ranges=employees_ranges,
+                )
+                candidates, dropped = load_live_candidates(
+                    c_con,
+                    [features.orgnrs[i] for i in picked],
+                    where_sql=where_sql,
+                    where_params=where_params,
+                    limit=args.limit,
+                    tech_filter=tech_filter,
+                    review_filter=review_filter,
+                    founded_min=founded_min,
+                    founded_max=founded_max,
+                )
+                print(f"features: {len(features)} bolag (refresh {features.meta.get('refreshed_at', '?')})")
+                if dropped:
+                    print(f"features: {dropped} förvalda bolag matchar inte längre companies (ändrade sedan refresh), hoppas över")
+            else:
+                candidates = fetch_candidates(
+                    c_con,
+                    cities=cities,
+                    wanted_snis=wanted_snis,
+                    sni_match=args.sni_match,
+                    require_website_status=args.require_website_status,
+                    require_email_status=args.require_email_status,
+                    require_sni_present=require_sni_present,
+                    employees_ranges=employees_ranges,
+                    limit=args.limit,
+                    tech_filter=tech_filter,
+                    review_filter=review_filter,
+                    founded_min=founded_min,
+                    founded_max=founded_max,
+                )
+
+            # Kommentar: exkludera DNC / unsubscribe / bounce
+            blocked = get_blocked_orgnrs(o_con, [c.orgnr for c in candidates], exclude_dnc=exclude_dnc)
+            candidates = [c for c in candidates if c.orgnr not in blocked]
+            matched = len(candidates)
+
+            ts = now_iso()
+            base = datetime.now(timezone.utc)
+
+            added_links = 0
+            upserted_leads = 0
+
+            batch_size = max(args.batch_size, 1)
+            for start in range(0, len(candidates), batch_size):
+                chunk = candidates[start:start + batch_size]
+                pending: List[Tuple[str, str, int, str, int]] = []
+
+                for idx, comp in enumerate(chunk, start):
+                    tier, flags, score = compute_tier_and_flags(
+                        comp,
+                        active_filters=active_filters,
+                        wanted_snis_any=active_filters["sni"],
+                        cities_any=active_filters["city"],
+                        employees_any=active_filters["employees"],
+                        founded_any=active_filters["founded"],
+                        tech_any=active_filters["tech"],
+                        review_any=active_filters["review"],
+                    )
+                    tiers_count[tier] += 1
+
+                    next_send = (base + timedelta(minutes=idx * max(args.stagger_minutes, 0))).isoformat()
+                    match_flags_json = json.dumps({**flags, **match_extra}, ensure_ascii=False)
+                    pending.append((comp.orgnr, next_send, tier, match_flags_json, score))
+
+                # Kommentar: en transaktion per batch – leads via RETURNING id, lead_campaigns via executemany
+                lead_ids = upsert_leads_batch(o_con, chunk, lead_type=lead_type, ts=ts)
+                upserted_leads += len(chunk)
+                added_links += add_lead_campaigns_batch(
+                    o_con,
+                    [
+                        (lead_ids[orgnr], campaign_id, next_send, ts, ts, tier, match_flags_json, score)
+                        for orgnr, next_send, tier, match_flags_json, score in pending
+                    ],
+                )
+                o_con.commit()
 
         print("DONE ✅")
         print(f"campaign={args.campaign_name} (id={campaign_id}, audience={audience})")
-        print(f"matched_after_filters={len(candidates)}")
+        print(f"matched_after_filters={matched}")
         print(f"upserted_leads={upserted_leads} new_campaign_links={added_links}")
         print(f"tiers: t1={tiers_count[1]} t2={tiers_count[2]} t3={tiers_count[3]} t4={tiers_count[4]} t5={tiers_count[5]}")
         print(f"stagger_minutes={args.stagger_minutes}")
@@ -0,0 +1,436 @@
+# outreach/targeting/targeting_features.py
+# Förberäknad targeting-tabell + vektoriserade filter för select_targets.py --features on
+# - targeting_features (companies.db): en kompakt rad per bolag, bara heltal/flaggor:
+#   city_id/status-id (targeting_dict), employees, founded_epoch (started_at, annars created_at),
+#   SNI-divisioner som bitset, flaggor (emails/sni/tech/review/hiring/...) och senaste finansiella score
+# - refresh = EN SQL-sats (INSERT ... ON CONFLICT DO UPDATE ... WHERE något ändrats) => bara ändrade rader skrivs,
+#   ingen Python per rad; borttagna bolag raderas
+# - FeatureSet: tabellen som kolumn-arrayer i minnet (numpy om installerat, annars listor)
+#   filter = bool-masker – inga _parse_iso/CompanyRow per bolag; select_targets kollar om de valda på levande
+#   rader och räknar tier där (tabellen refreshas inte av apply/merge)
+# - SNI: prefix med 1–2 siffror testas mot divisions-bitset, längre prefix/exakta koder via company_sni (index)
+# Kör (refresh, t.ex. efter apply/merge):
+#   python outreach/targeting/targeting_features.py
+
+from __future__ import annotations
+
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from companies.open_data.sni_index import SOURCE_BOLAGSVERKET, ensure_table as ensure_company_sni
+from companies.open_data.sni_index import is_complete as company_sni_complete, match_subquery, rebuild as rebuild_company_sni
+
+COMPANIES_DB = Path("data/db/companies.db.sqlite")
+
+TABLE = "targeting_features"
+DICT_TABLE = "targeting_dict"
+META_TABLE = "targeting_features_meta"
+
+# Kommentar: bitar i flags
+FLAG_EMAILS = 1          # emails ifyllt
+FLAG_SNI_PRESENT = 2     # sni_codes ifyllt och inte __NO_SNI__/00000 (hårt krav i lager 1)
+FLAG_SNI_RAW = 4         # sni_codes ifyllt alls (tier: sni_ok)
+FLAG_CITY = 8            # city ifyllt (tier: city_ok)
+FLAG_FOUNDED = 16        # founded_epoch gick att läsa
+FLAG_TECH = 32           # tech-kolumnen satt (om den finns)
+FLAG_REVIEW = 64         # review-kolumnen satt (om den finns)
+FLAG_HIRING = 128        # hiring_status = 'yes'
+
+NO_EMPLOYEES = -1
+FEATURE_COLS = (
+    "city_id", "website_status_id", "email_status_id", "employees",
+    "founded_epoch", "sni_div_lo", "sni_div_hi", "flags", "fin_score",
+)
+
+
+def _try_import_numpy():
+    try:
+        import numpy  # type: ignore
+        return numpy
+    except Exception:
+        return None
+
+
+NUMPY = _try_import_numpy()
+
+
+# -------------------------
+# tabell + refresh
+# -------------------------
+def ensure_tables(con: sqlite3.Connection) -> None:
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {DICT_TABLE} (
+          id INTEGER PRIMARY KEY,
+          kind TEXT NOT NULL,
+          value TEXT NOT NULL,
+          UNIQUE (kind, value)
+        )
+        """
+    )
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+          orgnr TEXT PRIMARY KEY,
+          city_id INTEGER NOT NULL,            -- targeting_dict(kind='city'), 0 = NULL
+          website_status_id INTEGER NOT NULL,  -- targeting_dict(kind='website_status'), 0 = NULL
+          email_status_id INTEGER NOT NULL,    -- targeting_dict(kind='email_status'), 0 = NULL
+          employees INTEGER NOT NULL,          -- -1 = saknas
+          founded_epoch INTEGER,               -- unix-sekunder (UTC), NULL = saknas/oläsbar
+          sni_div_lo INTEGER NOT NULL,         -- bit d: någon SNI-kod börjar på division d (00..49)
+          sni_div_hi INTEGER NOT NULL,         -- bit d-50: division 50..99
+          flags INTEGER NOT NULL,              -- FLAG_*
+          fin_score REAL                       -- senaste score_total, NULL = saknas
+        ) WITHOUT ROWID
+        """
+    )
+    con.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+def has_features(con: sqlite3.Connection) -> bool:
+    row = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (META_TABLE,)).fetchone()
+    if row is None:
+        return False
+    return con.execute(f"SELECT 1 FROM {META_TABLE} WHERE key = 'refreshed_at'").fetchone() is not None
+
+
+def _companies_columns(con: sqlite3.Connection) -> set:
+    return {str(r[1]) for r in con.execute("PRAGMA table_info(companies)")}
+
+
+def _first_col(cols: set, names: Sequence[str]) -> Optional[str]:
+    # Kommentar: samma kolumnval som fetch_candidates
+    for n in names:
+        if n in cols:
+            return n
+    return None
+
+
+def _nonempty(expr: str) -> str:
+    return f"(TRIM(COALESCE({expr}, '')) != '')"
+
+
+def refresh(con: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    Uppdaterar targeting_features från companies. Returnerar (ändrade/nya rader, raderade rader).
+    """
+    ensure_tables(con)
+    cols = _companies_columns(con)
+    tech_col = _first_col(cols, ("tech_footprint_status", "tech_footprint"))
+    review_col = _first_col(cols, ("website_review_status", "site_review_status"))
+
+    for kind in ("city", "website_status", "email_status"):
+        con.execute(
+            f"INSERT OR IGNORE INTO {DICT_TABLE}(kind, value) SELECT DISTINCT ?, {kind} FROM companies WHERE {kind} IS NOT NULL",
+            (kind,),
+        )
+
+    # Kommentar: divisions-bitset ur company_sni (bygg den om ingen full rebuild körts – bara synkade orgnr räcker inte)
+    ensure_company_sni(con)
+    if not company_sni_complete(con):
+        rebuild_company_sni(con)
+
+    has_fin = con.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'company_financial_scores'"
+    ).fetchone() is not None
+    fin_cte = (
+        """
+        , fin AS (
+          SELECT orgnr, score_total FROM (
+            SELECT orgnr, score_total,
+                   ROW_NUMBER() OVER (PARTITION BY orgnr ORDER BY fiscal_year_end_date DESC) AS rn
+            FROM company_financial_scores
+          ) WHERE rn = 1
+        )
+        """
+        if has_fin
+        else ", fin AS (SELECT NULL AS orgnr, NULL AS score_total WHERE 0)"
+    )
+
+    founded = (
+        "COALESCE(CAST(strftime('%s', c.started_at) AS INTEGER), CAST(strftime('%s', c.created_at) AS INTEGER))"
+    )
+    flags = " + ".join(
+        [
+            f"({_nonempty('c.emails')} * {FLAG_EMAILS})",
+            f"(({_nonempty('c.sni_codes')} AND TRIM(c.sni_codes) NOT IN ('__NO_SNI__', '00000')) * {FLAG_SNI_PRESENT})",
+            f"({_nonempty('c.sni_codes')} * {FLAG_SNI_RAW})",
+            f"({_nonempty('c.city')} * {FLAG_CITY})",
+            f"(({founded}) IS NOT NULL) * {FLAG_FOUNDED}",
+            f"({_nonempty('c.' + tech_col)} * {FLAG_TECH})" if tech_col else "0",
+            f"({_nonempty('c.' + review_col)} * {FLAG_REVIEW})" if review_col else "0",
+            f"((COALESCE(c.hiring_status, '') = 'yes') * {FLAG_HIRING})" if "hiring_status" in cols else "0",
+        ]
+    )
+
+    def _dict_id(kind: str) -> str:
+        return f"COALESCE((SELECT d.id FROM {DICT_TABLE} d WHERE d.kind = '{kind}' AND d.value = c.{kind}), 0)"
+
+    changed_before = con.total_changes
+    con.execute(
+        f"""
+        WITH sni AS (
+          SELECT orgnr,
+                 COALESCE(SUM(DISTINCT CASE WHEN d < 50 THEN 1 << d END), 0) AS lo,
+                 COALESCE(SUM(DISTINCT CASE WHEN d >= 50 THEN 1 << (d - 50) END), 0) AS hi
+          FROM (
+            SELECT orgnr, CAST(substr(sni_code, 1, 2) AS INTEGER) AS d
+            FROM company_sni
+            WHERE source = '{SOURCE_BOLAGSVERKET}' AND sni_code GLOB '[0-9][0-9]*'
+          )
+          GROUP BY orgnr
+        )
+        {fin_cte}
+        INSERT INTO {TABLE} (orgnr, {", ".join(FEATURE_COLS)})
+        SELECT
+          c.orgnr,
+          {_dict_id("city")},
+          {_dict_id("website_status")},
+          {_dict_id("email_status")},
+          COALESCE(CAST(c.employees AS INTEGER), {NO_EMPLOYEES}),
+          {founded},
+          COALESCE(s.lo, 0),
+          COALESCE(s.hi, 0),
+          {flags},
+          f.score_total
+        FROM companies c
+        LEFT JOIN sni s ON s.orgnr = c.orgnr
+        LEFT JOIN fin f ON f.orgnr = c.orgnr
+        WHERE c.orgnr IS NOT NULL AND c.orgnr != ''
+        ON CONFLICT(orgnr) DO UPDATE SET
+          {", ".join(f"{k} = excluded.{k}" for k in FEATURE_COLS)}
+        WHERE {" OR ".join(f"{k} IS NOT excluded.{k}" for k in FEATURE_COLS)}
+        """
+    )
+    changed = con.total_changes - changed_before
+
+    deleted = con.execute(
+        f"DELETE FROM {TABLE} WHERE orgnr NOT IN (SELECT orgnr FROM companies WHERE orgnr IS NOT NULL)"
+    ).rowcount
+
+    meta = {
+        "refreshed_at": datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        "tech_col": tech_col or "",
+        "review_col": review_col or "",
+    }
+    con.executemany(f"INSERT OR REPLACE INTO {META_TABLE}(key, value) VALUES (?, ?)", list(meta.items()))
+    return changed, deleted
+
+
+# -------------------------
+# filter + tiers i minnet
+# -------------------------
+@dataclass(frozen=True)
+class TargetFilters:
+    website_status: str
+    email_status: str
+    require_sni_present: bool
+    cities: Sequence[str]
+    employees_ranges: Sequence[str]
+    founded_min: Optional[datetime]
+    founded_max: Optional[datetime]
+    tech: bool
+    review: bool
+    wanted_snis: Sequence[str]
+    sni_match: str
+
+
+def _epoch(dt: Optional[datetime]) -> Optional[int]:
+    # Kommentar: naiva tider = UTC, samma som strftime('%s', ...) i refresh
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _div_bits(prefix: str) -> Tuple[int, int]:
+    # Kommentar: "6" => divisionerna 60..69, "62" => 62
+    divs = [int(prefix)] if len(prefix) == 2 else [int(prefix) * 10 + i for i in range(10)]
+    lo = sum(1 << d for d in divs if d < 50)
+    hi = sum(1 << (d - 50) for d in divs if d >= 50)
+    return lo, hi
+
+
+class FeatureSet:
+    """
+    targeting_features i minnet, sorterad på orgnr (samma ordning som ORDER BY orgnr i fetch_candidates).
+    """
+
+    def __init__(self, con: sqlite3.Connection) -> None:
+        self.con = con
+        self.np = NUMPY
+        rows = con.execute(f"SELECT orgnr, {', '.join(FEATURE_COLS)} FROM {TABLE} ORDER BY orgnr").fetchall()
+        self.orgnrs: List[str] = [r[0] for r in rows]
+        self._index: Optional[Dict[str, int]] = None
+        cols = list(zip(*rows)) if rows else [()] * (len(FEATURE_COLS) + 1)
+        self.cols = {}
+        for k, values in zip(FEATURE_COLS, cols[1:]):
+            if k == "founded_epoch":
+                values = [0 if v is None else v for v in values]  # Kommentar: FLAG_FOUNDED avgör om värdet gäller
+            elif k == "fin_score":
+                values = [float("nan") if v is None else v for v in values]
+            self.cols[k] = self._array(values, float if k == "fin_score" else int)
+
+        self.ids = {
+            (kind, value): i
+            for i, kind, value in con.execute(f"SELECT id, kind, value FROM {DICT_TABLE}")
+        }
+        self.meta = dict(con.execute(f"SELECT key, value FROM {META_TABLE}"))
+
+    def __len__(self) -> int:
+        return len(self.orgnrs)
+
+    # Kommentar: små mask-primitiver – numpy-arrayer eller listor, samma semantik
+    def _array(self, values, typ):
+        if self.np is not None:
+            return self.np.fromiter(values, dtype=self.np.int64 if typ is int else self.np.float64, count=len(values))
+        return list(values)
+
+    def _full(self, value: bool):
+        if self.np is not None:
+            return self.np.full(len(self), value, dtype=bool)
+        return [value] * len(self)
+
+    def _where(self, col: str, pred):
+        a = self.cols[col]
+        if self.np is not None:
+            return pred(a)
+        return [bool(pred(v)) for v in a]
+
+    def _and(self, a, b):
+        if self.np is not None:
+            return a & b
+        return [x and y for x, y in zip(a, b)]
+
+    def _or(self, a, b):
+        if self.np is not None:
+            return a | b
+        return [x or y for x, y in zip(a, b)]
+
+    def _flag(self, bit: int):
+        return self._where("flags", lambda v: (v & bit) != 0)
+
+    def _id(self, kind: str, value: str) -> int:
+        # Kommentar: värde som inte finns i DB => -1 (matchar inget)
+        return self.ids.get((kind, value), -1)
+
+    def _orgnr_mask(self, orgnrs: set):
+        if self._index is None:
+            self._index = {o: i for i, o in enumerate(self.orgnrs)}
+        idx = [self._index[o] for o in orgnrs if o in self._index]
+        if self.np is not None:
+            m = self._full(False)
+            m[idx] = True
+            return m
+        m = self._full(False)
+        for i in idx:
+            m[i] = True
+        return m
+
+    def _sni_mask(self, wanted: Sequence[str], mode: str):
+        mask = self._full(False)
+        lookup: List[str] = []
+        lo = hi = 0
+        for s in dict.fromkeys(x.strip() for x in wanted):
+            if not s:
+                continue
+            if mode == "prefix" and len(s) <= 2 and s.isdigit():
+                a, b = _div_bits(s)
+                lo |= a
+                hi |= b
+            else:
+                lookup.append(s)
+        if lo or hi:
+            mask = self._or(self._where("sni_div_lo", lambda v: (v & lo) != 0), self._where("sni_div_hi", lambda v: (v & hi) != 0))
+        if lookup:
+            # Kommentar: längre prefix / exakta koder => indexerad lookup i company_sni (samma som select_targets)
+            sql, params = match_subquery(lookup, mode)
+            mask = self._or(mask, self._orgnr_mask({r[0] for r in self.con.execute(sql, params)}))
+        return mask
+
+    def _employees_mask(self, ranges: Sequence[str]):
+        mask = self._full(False)
+        for r in ranges:
+            rr = r.strip()
+            if not rr:
+                continue
+            if rr.endswith("+"):
+                lo = int(rr[:-1])
+                mask = self._or(mask, self._where("employees", lambda v: (v >= lo) & (v >= 0)))
+            else:
+                a, b = rr.split("-", 1)
+                lo, hi = int(a.strip()), int(b.strip())
+                mask = self._or(mask, self._where("employees", lambda v: (v >= lo) & (v <= hi) & (v >= 0)))
+        return mask
+
+    def select(self, f: TargetFilters, limit: Optional[int] = None) -> List[int]:
+        """
+        Radindex (i orgnr-ordning) som klarar alla filter, max limit st (None = alla).
+        """
+        ws_id = self._id("website_status", f.website_status)
+        es_id = self._id("email_status", f.email_status)
+        m = self._where("website_status_id", lambda v: v == ws_id)
+        m = self._and(m, self._where("email_status_id", lambda v: v == es_id))
+        m = self._and(m, self._flag(FLAG_EMAILS))
+        if f.require_sni_present:
+            m = self._and(m, self._flag(FLAG_SNI_PRESENT))
+        if f.cities:
+            ids = [self._id("city", c) for c in f.cities]
+            if self.np is not None:
+                m = m & self.np.isin(self.cols["city_id"], ids)
+            else:
+                ids_set = set(ids)
+                m = self._and(m, [v in ids_set for v in self.cols["city_id"]])
+        if any(r.strip() for r in f.employees_ranges):
+            m = self._and(m, self._employees_mask(f.employees_ranges))
+        if any(s.strip() for s in f.wanted_snis):
+            m = self._and(m, self._sni_mask(f.wanted_snis, f.sni_match))
+        lo, hi = _epoch(f.founded_min), _epoch(f.founded_max)
+        if f.founded_min is not None or f.founded_max is not None:
+            m = self._and(m, self._flag(FLAG_FOUNDED))
+            if lo is not None:
+                m = self._and(m, self._where("founded_epoch", lambda v: v >= lo))
+            if hi is not None:
+                m = self._and(m, self._where("founded_epoch", lambda v: v <= hi))
+        # Kommentar: tech/review filtrerar bara om kolumnen fanns vid refresh (som has_tech/has_review)
+        if f.tech and self.meta.get("tech_col"):
+            m = self._and(m, self._flag(FLAG_TECH))
+        if f.review and self.meta.get("review_col"):
+            m = self._and(m, self._flag(FLAG_REVIEW))
+
+        if self.np is not None:
+            return [int(i) for i in self.np.flatnonzero(m)[:limit]]
+        return [i for i, ok in enumerate(m) if ok][:limit]
+
+
+def main() -> None:
+    if not COMPANIES_DB.exists():
+        raise FileNotFoundError(f"DB saknas: {COMPANIES_DB}")
+
+    con = sqlite3.connect(COMPANIES_DB.as_posix())
+    try:
+        con.execute("PRAGMA journal_mode=WAL;")
+        start = time.time()
+        con.execute("BEGIN;")
+        changed, deleted = refresh(con)
+        con.commit()
+        total = con.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+        print(f"{TABLE}: rader={total} ändrade={changed} raderade={deleted} | {time.time() - start:.1f}s")
+        print("KLART ✅")
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# Kommentar: repo-roten på sys.path (skripten gör samma sak själva via parents[N])
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,74 @@
+# tests/test_apply_staged.py
+# apply_staged: fill (värde bara om tomt, markör om nyare) och union (segment_groups)
+
+import sqlite3
+
+import pytest
+
+from companies.apply.apply_out_shards_to_db import BULK_SPECS, apply_staged, create_stage
+
+
+@pytest.fixture
+def conn():
+    con = sqlite3.connect(":memory:")
+    con.execute(
+        """
+        CREATE TABLE companies (
+          orgnr TEXT PRIMARY KEY, website TEXT, website_status TEXT, website_checked_at TEXT,
+          segment_groups TEXT, segment_groups_checked_at TEXT, updated_at TEXT
+        )
+        """
+    )
+    con.executemany(
+        "INSERT INTO companies VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            ("1", None, None, None, "it,bygg", "2026-07-01T00:00:00+00:00", "orörd"),
+            ("2", "https://gammal.se", "found", "2026-05-01T00:00:00+00:00", None, None, "orörd"),
+            ("3", "", None, "2026-05-01T00:00:00+00:00", "bygg", None, "orörd"),
+        ],
+    )
+    yield con
+    con.close()
+
+
+def _stage(con, kind: str, rows: list[tuple]) -> None:
+    spec = BULK_SPECS[kind]
+    create_stage(con, spec)
+    n = len(spec.fields) + 4
+    con.executemany(f"INSERT INTO temp.stage VALUES ({', '.join(['?'] * n)})", rows)
+
+
+def test_fill_sets_empty_value_and_newer_marker(conn):
+    _stage(conn, "websites", [
+        (0, "1", "2026-06-01T00:00:00+00:00", "https://ett.se", "found"),
+        (1, "1", "2026-06-02T00:00:00+00:00", "https://annan.se", "found"),
+        (2, "2", "2026-04-01T00:00:00+00:00", "https://ny.se", "found"),
+        (3, "3", "2026-06-01T00:00:00+00:00", "", "not_found"),
+    ])
+
+    applied_value, applied_marker = apply_staged(conn, BULK_SPECS["websites"])
+
+    rows = {r[0]: r[1:] for r in conn.execute("SELECT orgnr, website, website_status, website_checked_at FROM companies")}
+    # Kommentar: första raden med värde fyller tomt; markören tas från senaste checked_at
+    assert rows["1"] == ("https://ett.se", "found", "2026-06-02T00:00:00+00:00")
+    # Kommentar: befintligt värde och nyare markör i DB rörs inte
+    assert rows["2"] == ("https://gammal.se", "found", "2026-05-01T00:00:00+00:00")
+    assert rows["3"] == ("", "not_found", "2026-06-01T00:00:00+00:00")
+    assert (applied_value, applied_marker) == (1, 2)
+
+
+def test_union_only_writes_when_groups_are_added(conn):
+    _stage(conn, "segment_groups", [
+        (0, "1", "2026-06-01T00:00:00+00:00", "bygg,it"),   # samma mängd, annan ordning
+        (1, "3", "2026-06-01T00:00:00+00:00", "it"),
+        (2, "3", "2026-06-02T00:00:00+00:00", "handel,bygg"),
+    ])
+
+    applied_value, _applied_marker = apply_staged(conn, BULK_SPECS["segment_groups"])
+
+    rows = {r[0]: r[1:] for r in conn.execute("SELECT orgnr, segment_groups, updated_at FROM companies")}
+    assert rows["1"] == ("it,bygg", "orörd")
+    # Kommentar: senaste raden först, sedan äldre rader, sist det som redan fanns i DB
+    assert rows["3"][0] == "handel,bygg,it"
+    assert rows["3"][1] != "orörd"
+    assert applied_value == 1
@@ -0,0 +1,67 @@
+# tests/test_fetch_html_only.py
+# html_only: binärer läses/cachas inte; mejl-snippeten avkodar som requests r.encoding
+
+import asyncio
+
+from aiohttp import web
+
+from companies.shards.shared.fetch import Fetcher, fetch_html, header_encoding
+from companies.shards.shared.page_cache import PageCache
+
+PDF = b"%PDF-1.4 " + b"x" * 200_000
+
+
+async def _serve():
+    async def pdf(request: web.Request) -> web.Response:
+        return web.Response(body=PDF, headers={"Content-Type": "application/pdf"})
+
+    async def latin1(request: web.Request) -> web.Response:
+        return web.Response(body="<p>Felanmälan</p>".encode("latin-1"), headers={"Content-Type": "text/html"})
+
+    app = web.Application()
+    app.router.add_get("/doc.pdf", pdf)
+    app.router.add_get("/latin1", latin1)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_html_only_skips_body_and_cache(tmp_path):
+    cache = PageCache(tmp_path / "cache")
+
+    async def run():
+        runner, base = await _serve()
+        try:
+            async with Fetcher("test-agent", read_timeout=5, cache=cache) as f:
+                html, err = await fetch_html(f, base + "/doc.pdf", max_bytes=len(PDF))
+                r = await f.get(base + "/doc.pdf", max_bytes=len(PDF), html_only=True)
+                assert cache.get(base + "/doc.pdf", 1) is None
+                full = await f.get(base + "/doc.pdf", max_bytes=len(PDF))
+        finally:
+            await runner.cleanup()
+        return html, err, r, full
+
+    html, err, r, full = asyncio.run(run())
+    assert (html, err) == (None, "not_html")
+    assert r.err == "" and r.body == b""
+    # Kommentar: utan html_only läses (och cachas) bodyn som förut
+    assert full.body == PDF
+    assert cache.get(full.url, len(PDF)) is not None
+
+
+def test_email_snippet_decodes_like_requests():
+    async def run():
+        runner, base = await _serve()
+        try:
+            async with Fetcher("test-agent", read_timeout=5) as f:
+                return await f.get(base + "/latin1", max_bytes=10_000)
+        finally:
+            await runner.cleanup()
+
+    r = asyncio.run(run())
+    # Kommentar: text/* utan charset => ISO-8859-1 (requests), inte UTF-8
+    assert header_encoding(r) == "ISO-8859-1"
+    assert r.text(header_encoding(r)) == "<p>Felanmälan</p>"
@@ -0,0 +1,93 @@
+# tests/test_fetch_stop.py
+# stop-predikatet ska se exakt samma text som fetch_html sen returnerar (även för sidor som inte är UTF-8)
+
+import asyncio
+import sys
+from collections import Counter
+
+import pytest
+from aiohttp import web
+
+from companies.shards.shared.fetch import Fetcher, fetch_html
+
+# Kommentar: latin-1-sida där "Felanmäl" bara blir en träff om bodyn avkodas med svarets charset
+LATIN1_PAGE = (
+    "<html><body><h1>Felanmäl ditt ärende</h1>"
+    "<p>Vi jobbar i Teams, Intune och Defender.</p>"
+    + "<p>fyllnad</p>" * 4000
+    + "</body></html>"
+).encode("latin-1")
+
+SUPPORT_PAGE = "<html><body><p>Kontakta vår helpdesk</p></body></html>".encode("utf-8")
+
+
+async def _serve(routes: dict[str, tuple[bytes, str]]):
+    async def handler(request: web.Request) -> web.Response:
+        body, content_type = routes.get(request.path, (b"<html></html>", "text/html; charset=utf-8"))
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_stop_pieces_match_fetch_html_text_for_latin1_page():
+    async def run():
+        runner, base = await _serve({"/": (LATIN1_PAGE, "text/html; charset=iso-8859-1")})
+        pieces: list[str] = []
+        try:
+            async with Fetcher("test-agent", read_timeout=5) as f:
+                full, err = await fetch_html(f, base + "/", max_bytes=len(LATIN1_PAGE))
+                assert err == ""
+                stopped, err = await fetch_html(
+                    f, base + "/", max_bytes=len(LATIN1_PAGE), stop=lambda piece: pieces.append(piece) or False
+                )
+                assert err == ""
+        finally:
+            await runner.cleanup()
+        return full, stopped, "".join(pieces)
+
+    full, stopped, seen = asyncio.run(run())
+    assert stopped == full
+    assert seen == full
+
+
+@pytest.fixture
+def tech(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["tech_footprint_shards.py", "--shard-id", "0"])
+    from companies.shards.extras import tech_footprint_shards as mod
+
+    # Kommentar: ingen riktig DNS i testet
+    monkeypatch.setattr(mod, "dns_lookup_m365", lambda domain: (False, False, False))
+    return mod
+
+
+async def _tech_row(mod) -> dict:
+    runner, base = await _serve({
+        "/": (LATIN1_PAGE, "text/html; charset=iso-8859-1"),
+        "/support": (SUPPORT_PAGE, "text/html; charset=utf-8"),
+    })
+    try:
+        async with Fetcher("test-agent", read_timeout=5) as f:
+            row = await mod.process_target(f, Counter(), ("5560000000", "Test AB", base, None))
+    finally:
+        await runner.cleanup()
+    assert row is not None and row["err_reason"] == ""
+    for k in ("checked_at", "website"):
+        row.pop(k)
+    return row
+
+
+def test_tech_row_unchanged_by_early_stop_on_latin1_page(tech, monkeypatch):
+    with_stop = asyncio.run(_tech_row(tech))
+
+    # Kommentar: samma körning utan tidigt avbrott (predikatet blir aldrig slutgiltigt)
+    monkeypatch.setattr(tech, "web_signals_final", lambda found: False)
+    without_stop = asyncio.run(_tech_row(tech))
+
+    assert with_stop == without_stop
@@ -0,0 +1,140 @@
+# tests/test_select_targets_paths.py
+# --features off / --features on / --attach yes ska registrera samma leads (tier, flaggor, score) på samma data
+
+import json
+import sqlite3
+import sys
+
+import pytest
+
+from outreach.targeting import select_targets
+from outreach.targeting.targeting_features import refresh as refresh_features
+
+CITIES = ("Göteborg", "Borås", "Malmö")
+SNIS = ("62010", "69201", "41200,43210", "__NO_SNI__", "")
+
+
+def _companies_db(path) -> None:
+    con = sqlite3.connect(path)
+    con.execute(
+        """
+        CREATE TABLE companies (
+          orgnr TEXT PRIMARY KEY, name TEXT, city TEXT, employees INTEGER, sni_codes TEXT,
+          website TEXT, emails TEXT, website_status TEXT, email_status TEXT,
+          created_at TEXT, started_at TEXT, tech_footprint_status TEXT
+        )
+        """
+    )
+    rows = []
+    for i in range(60):
+        rows.append((
+            f"55600{i:05d}",
+            f"Bolag {i} AB",
+            CITIES[i % 3] if i % 7 else "",
+            None if i % 5 == 0 else (i * 3) % 120,
+            SNIS[i % 5],
+            f"https://bolag{i}.se",
+            "" if i % 11 == 0 else f"info@bolag{i}.se",
+            "found" if i % 13 else "not_found",
+            "found",
+            "2020-01-01 10:00:00",
+            f"20{10 + i % 12}-03-01" if i % 4 else None,
+            "yes" if i % 3 == 0 else None,
+        ))
+    con.executemany("INSERT INTO companies VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+    con.commit()
+    con.close()
+
+
+def _outreach_db(path) -> None:
+    con = sqlite3.connect(path)
+    con.executescript(
+        """
+        CREATE TABLE campaigns (id INTEGER PRIMARY KEY, name TEXT, audience TEXT);
+        CREATE TABLE leads (
+          id INTEGER PRIMARY KEY, orgnr TEXT UNIQUE, company_name TEXT, city TEXT, sni_codes TEXT, website TEXT,
+          emails TEXT, lead_type TEXT, status TEXT, created_at TEXT, updated_at TEXT
+        );
+        CREATE TABLE lead_campaigns (
+          id INTEGER PRIMARY KEY, lead_id INTEGER, campaign_id INTEGER, current_step INTEGER, current_variant TEXT,
+          next_send_at TEXT, stopped_reason TEXT, created_at TEXT, updated_at TEXT, tier INTEGER, match_flags TEXT,
+          score INTEGER, UNIQUE(lead_id, campaign_id)
+        );
+        CREATE TABLE events (id INTEGER PRIMARY KEY, lead_id INTEGER, type TEXT, created_at TEXT);
+        CREATE TABLE do_not_contact (orgnr TEXT);
+        INSERT INTO campaigns(id, name, audience) VALUES (1, 'test', 'customer');
+        INSERT INTO do_not_contact(orgnr) VALUES ('5560000002'), ('5560000016');
+        INSERT INTO leads(id, orgnr, status) VALUES (1, '5560000008', 'new');
+        INSERT INTO events(lead_id, type, created_at) VALUES (1, 'unsubscribe', '2026-01-01');
+        """
+    )
+    con.commit()
+    con.close()
+
+
+def _run(monkeypatch, tmp_path, companies, name: str, args: list[str]) -> set:
+    outreach = tmp_path / f"outreach_{name}.sqlite"
+    _outreach_db(outreach)
+    monkeypatch.setattr(select_targets, "COMPANIES_DB", companies)
+    monkeypatch.setattr(select_targets, "OUTREACH_DB", outreach)
+    monkeypatch.setattr(sys, "argv", ["select_targets.py", "--campaign-name", "test", *args])
+    select_targets.main()
+
+    con = sqlite3.connect(outreach)
+    rows = con.execute(
+        """
+        SELECT l.orgnr, l.company_name, l.emails, lc.tier, lc.match_flags, lc.score
+        FROM lead_campaigns lc JOIN leads l ON l.id = lc.lead_id
+        """
+    ).fetchall()
+    con.close()
+    return {(o, n, e, t, json.dumps(json.loads(f), sort_keys=True), s) for o, n, e, t, f, s in rows}
+
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--limit", "15"],
+        ["--limit", "1000", "--cities", "Göteborg,Borås", "--employees", "0-19,50+", "--sni", "62,69"],
+        ["--limit", "1000", "--founded-min", "2014-01-01", "--tech", "yes"],
+        ["--limit", "1000", "--require-sni-present", "no", "--sni", "4321", "--sni-match", "prefix"],
+    ],
+)
+def test_features_and_attach_paths_register_same_leads(monkeypatch, tmp_path, args):
+    companies = tmp_path / "companies.sqlite"
+    _companies_db(companies)
+    con = sqlite3.connect(companies)
+    refresh_features(con)
+    con.commit()
+    con.close()
+
+    off = _run(monkeypatch, tmp_path, companies, "off", [*args, "--features", "off"])
+    on = _run(monkeypatch, tmp_path, companies, "on", [*args, "--features", "on"])
+    attached = _run(monkeypatch, tmp_path, companies, "attach", [*args, "--attach", "yes"])
+
+    assert off
+    assert on == off
+    assert attached == off
+
+
+def test_stale_features_use_live_rows_and_fill_limit(monkeypatch, tmp_path):
+    companies = tmp_path / "companies.sqlite"
+    _companies_db(companies)
+    con = sqlite3.connect(companies)
+    refresh_features(con)
+    # Kommentar: ändringar efter refresh (apply/merge refreshar inte targeting_features)
+    con.execute("UPDATE companies SET emails = '' WHERE orgnr = '5560000001'")
+    con.execute("UPDATE companies SET employees = NULL, tech_footprint_status = 'yes' WHERE orgnr = '5560000003'")
+    con.execute("UPDATE companies SET name = 'Nytt namn AB' WHERE orgnr = '5560000006'")
+    con.commit()
+    con.close()
+    args = ["--limit", "12", "--employees", "0-200"]
+
+    off = _run(monkeypatch, tmp_path, companies, "off", [*args, "--features", "off"])
+    on = _run(monkeypatch, tmp_path, companies, "on", [*args, "--features", "on"])
+
+    assert len(off) == 12 - 2  # Kommentar: två spärrade bland de 12 första
+    assert on == off
+    assert "5560000001" not in {r[0] for r in on}
+    assert "Nytt namn AB" in {r[1] for r in on}
@@ -0,0 +1,55 @@
+# tests/test_websites_probe.py
+# probe-fönstret: kandidater på samma registrerade domän får inte köras samtidigt (403/429-spärren delas per domän)
+
+import asyncio
+import sys
+from collections import Counter
+
+import pytest
+
+from companies.shards.shared.politeness import domain_key
+
+
+@pytest.fixture
+def websites(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["shards_find_websites.py", "--shard-id", "0"])
+    from companies.shards.must_have import shards_find_websites as mod
+
+    return mod
+
+
+def test_same_domain_candidates_probe_in_rank_order(websites, monkeypatch):
+    blocked: set[str] = set()
+    active: Counter = Counter()
+    order: list[str] = []
+    overlaps: list[str] = []
+
+    async def fake_probe(fetcher, url):
+        key = domain_key(url)
+        if active[key]:
+            overlaps.append(url)
+        active[key] += 1
+        order.append(url)
+        try:
+            await asyncio.sleep(0.01 if url.startswith("https://www.") else 0.05)
+            if key in blocked:
+                return (False, False, "403")
+            if url == "https://www.testbolaget.se":
+                # Kommentar: som PolitenessScheduler.report – 403 spärrar hela domänen
+                blocked.add(key)
+                return (False, False, "403")
+            return (url == "https://testbolaget.se", False, "")
+        finally:
+            active[key] -= 1
+
+    monkeypatch.setattr(websites, "fetch_probe", fake_probe)
+    monkeypatch.setattr(
+        websites, "domain_candidates", lambda slugs: ["testbolaget.se", "www.testbolaget.se", "testbolaget.com"]
+    )
+
+    row = asyncio.run(websites.process_target(None, Counter(), ("5560000000", "Testbolaget AB", None, None)))
+
+    assert overlaps == []
+    assert row["status"] == "found"
+    assert row["found_website"] == "https://testbolaget.se"
+    assert order[0] == "https://testbolaget.se"
@@ -0,0 +1,100 @@
+# tests/test_work_queue.py
+# lease-kön: utgångna leases tas över, done först efter writerns checkpoint, claim blockerar inte event-loopen
+
+import asyncio
+import sqlite3
+
+from companies.shards.shared.fetch import run_bounded
+from companies.shards.shared.work_queue import QueueWorker, WorkQueue, keepalive, queue_writer
+
+KIND = "test"
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.rows: list[dict] = []
+        self.checkpoint_hooks: list = []
+
+    def write_row(self, row: dict) -> None:
+        self.rows.append(row)
+
+    def checkpoint(self) -> None:
+        for hook in self.checkpoint_hooks:
+            hook()
+
+
+def _targets(n: int) -> list[tuple]:
+    return [(f"55600000{i:02d}", f"Bolag {i}") for i in range(n)]
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    q = WorkQueue(tmp_path / "q.sqlite")
+    q.enqueue(KIND, _targets(3))
+
+    assert len(q.claim(KIND, "a", lease_sec=-1)) == 3
+    # Kommentar: a:s lease har gått ut => b claimar om samma bolag, a:s finish ignoreras sen
+    taken = q.claim(KIND, "b")
+    assert [t[0] for t in taken] == [t[0] for t in _targets(3)]
+    q.finish(KIND, "a", taken[0][0], ok=True)
+    assert q.counts(KIND) == {"leased": 3}
+
+    q.finish_many(KIND, "b", [t[0] for t in taken], ok=True)
+    assert q.counts(KIND) == {"done": 3}
+    q.close()
+
+
+def test_done_only_after_checkpoint_and_retry_without_row(tmp_path):
+    q = WorkQueue(tmp_path / "q.sqlite")
+    q.enqueue(KIND, _targets(5))
+    qw = QueueWorker(q, KIND, "w", batch_size=2)
+    out = _Writer()
+    writer = queue_writer(qw, out)
+
+    async def worker(target: tuple):
+        await asyncio.sleep(0)
+        return None if target[0].endswith("03") else {"orgnr": target[0]}
+
+    async def run():
+        async with keepalive(qw):
+            async for row in run_bounded(qw.targets(), qw.track(worker), 3):
+                if row is not None:
+                    writer.write_row(row)
+            # Kommentar: raderna är skrivna men inte checkpointade => fortfarande leased
+            assert q.counts(KIND) == {"leased": 4, "retry": 1}
+            out.checkpoint()
+
+    asyncio.run(run())
+    assert len(out.rows) == 4
+    assert q.counts(KIND) == {"done": 4, "retry": 1}
+    q.close()
+
+
+def test_claim_waits_in_thread_while_queue_is_locked(tmp_path):
+    path = tmp_path / "q.sqlite"
+    q = WorkQueue(path)
+    q.enqueue(KIND, _targets(2))
+    qw = QueueWorker(q, KIND, "w")
+
+    other = sqlite3.connect(path.as_posix(), isolation_level=None)
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def run() -> list[tuple]:
+        # Kommentar: en annan worker håller skrivlåset en stund – loopen ska fortsätta ticka under tiden
+        other.execute("BEGIN IMMEDIATE")
+        asyncio.get_running_loop().call_later(0.3, lambda: other.execute("COMMIT"))
+        t = asyncio.ensure_future(ticker())
+        got = [x async for x in qw.targets()]
+        t.cancel()
+        return got
+
+    got = asyncio.run(run())
+    other.close()
+    assert len(got) == 2
+    assert ticks >= 10
+    q.close()